@@ -10,10 +10,25 @@ from aiogram import Router, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from service.user_vpn_check import update_vpn_state
-from service.notifier import daily_check_end_date_and_notify
+from service.db_instance import user_db
+from service.notifier import daily_check_end_date_and_notify, resume_broadcasts
 from handlers import payment, user_actions, start_help, admin_actions, instrustion
 from middlewares.admin_delete import AdminMessageDeletionMiddleware
-from settings import BOT, ADMINS, check_environment
+from middlewares.concurrency import ConcurrencyLimitMiddleware
+from service.webhook import run_webhook
+from settings import (
+    BOT,
+    ADMINS,
+    TRAFFIC_SAMPLE_INTERVAL,
+    UPDATE_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    MAX_CONCURRENT_UPDATES,
+    check_environment,
+)
 
 
 # ⚙️ Логирование
@@ -28,7 +43,6 @@ scheduler = AsyncIOScheduler(timezone=ZoneInfo("UTC"))
 
 # 🚀 Запуск
 async def main():
-    os.makedirs("files/connections", exist_ok=True)
     os.makedirs("users", exist_ok=True)
     await load_isp_cache()
     if not await check_environment():
@@ -42,7 +56,10 @@ async def main():
     dp.include_router(user_actions.router)
     dp.include_router(admin_actions.router)
     dp.include_router(instrustion.router)
+    instrustion.prepare_instruction_albums()
 
+    concurrency = ConcurrencyLimitMiddleware(MAX_CONCURRENT_UPDATES)
+    dp.update.outer_middleware(concurrency)
     dp.message.middleware(AdminMessageDeletionMiddleware(admins=ADMINS))
 
     scheduler.add_job(
@@ -79,8 +96,47 @@ async def main():
 
     scheduler.add_job(db.ensure_peer_names, trigger="interval", minutes=1)
 
+    scheduler.add_job(
+        db.prune_connection_log,
+        trigger="cron",
+        hour=4,
+        minute=10,
+        timezone=ZoneInfo("Europe/Moscow"),
+    )
+
+    scheduler.add_job(
+        db.sample_traffic,
+        trigger="interval",
+        seconds=TRAFFIC_SAMPLE_INTERVAL,
+        max_instances=1,
+        coalesce=True,
+    )
+
+    # Без триггера задача выполняется один раз сразу после запуска
+    scheduler.add_job(resume_broadcasts)
+    scheduler.add_job(db.import_legacy_connections)
+
     scheduler.start()
-    await dp.start_polling(BOT)
+    try:
+        if UPDATE_MODE == "webhook":
+            await run_webhook(
+                dp,
+                BOT,
+                url=WEBHOOK_URL,
+                path=WEBHOOK_PATH,
+                host=WEBHOOK_HOST,
+                port=WEBHOOK_PORT,
+                secret=WEBHOOK_SECRET,
+                max_connections=min(MAX_CONCURRENT_UPDATES, 100),
+                stats=concurrency.stats,
+            )
+        else:
+            # getUpdates не работает, пока установлен webhook
+            await BOT.delete_webhook()
+            await dp.start_polling(BOT)
+    finally:
+        # Дописываем записи, поставленные в очередь без ожидания
+        await user_db.flush()
 
 
 if __name__ == "__main__":
@@ -1,28 +1,40 @@
 import os
 import subprocess
 import configparser
-import json
 import socket
 import logging
-import tempfile
-from datetime import datetime, timezone
+from datetime import datetime
 from typing import Dict, Optional
 
 from service.base_model import ActiveClient
-
-EXPIRATIONS_FILE = "files/expirations.json"
-PAYMENTS_FILE = "files/payments.json"
-ADMINS_FILE = "files/admins.json"  # Новый файл для хранения админов
-UTC = timezone.utc
+from service.connection_log import ConnectionLog
+from service.executor import executor
+from service.ip_allocator import IpAllocator, PoolExhaustedError
+from service.media_registry import MediaRegistry
+from service.peer_registry import PeerRegistry
+from service.telemetry import read_peer_stats
+from service.traffic_store import TrafficSample, TrafficStore
+from service.wg_apply import remove_peer, write_clients_table, write_config
+from service.wg_config import WgConfig
+
+SCRIPT_TIMEOUT = 120  # newclient.sh выполняет несколько docker exec
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_peer_registry: Optional[PeerRegistry] = None
+_ip_allocator: Optional[IpAllocator] = None
+_traffic_store: Optional[TrafficStore] = None
+_connection_log: Optional[ConnectionLog] = None
+_media_registry: Optional[MediaRegistry] = None
+# Хеш wg0.conf/clientsTable, для которого имена peer'ов уже проверены
+_names_checked_hash: Optional[str] = None
+
 
 def get_amnezia_container():
-    cmd = "docker ps --filter 'name=amnezia-awg' --format '{{.Names}}'"
+    cmd = ["docker", "ps", "--filter", "name=amnezia-awg", "--format", "{{.Names}}"]
     try:
-        output = subprocess.check_output(cmd, shell=True).decode().strip()
+        output = subprocess.check_output(cmd).decode().strip()
         if output:
             return output
         else:
@@ -53,9 +65,9 @@ def create_config(path="files/setting.ini"):
     docker_container = get_amnezia_container()
     logger.info(f"Найден Docker-контейнер: {docker_container}")
 
-    cmd = f"docker exec {docker_container} find / -name wg0.conf"
+    cmd = ["docker", "exec", docker_container, "find", "/", "-name", "wg0.conf"]
     try:
-        wg_config_file = subprocess.check_output(cmd, shell=True).decode().strip()
+        wg_config_file = subprocess.check_output(cmd).decode().strip()
         if not wg_config_file:
             logger.warning(
                 "Не удалось найти файл конфигурации WireGuard 'wg0.conf'. Используется путь по умолчанию."
@@ -69,7 +81,7 @@ def create_config(path="files/setting.ini"):
 
     try:
         endpoint = (
-            subprocess.check_output("curl -s https://api.ipify.org", shell=True)
+            subprocess.check_output(["curl", "-s", "https://api.ipify.org"])
             .decode()
             .strip()
         )
@@ -94,97 +106,74 @@ def create_config(path="files/setting.ini"):
         config.write(config_file)
     logger.info(f"Конфигурация сохранена в {path}")
 
-    # Инициализируем admins.json с начальными администраторами
-    save_admins(admin_ids)
-
-
-def ensure_peer_names():
-    setting = get_config()
-    wg_config_file = setting["wg_config_file"]
-    docker_container = setting["docker_container"]
-
-    clientsTable = get_full_clients_table()
-    clients_dict = {client["clientId"]: client["userData"] for client in clientsTable}
 
-    try:
-        cmd = f"docker exec -i {docker_container} cat {wg_config_file}"
-        config_content = subprocess.check_output(cmd, shell=True).decode("utf-8")
-
-        lines = config_content.splitlines()
-        new_config_lines = []
-        i = 0
-        modified = False
-        updated_clientsTable = False
-
-        while i < len(lines):
-            line = lines[i]
-            if line.strip().startswith("[Peer]"):
-                peer_block = [line]
-                i += 1
-                has_name_comment = False
-                client_public_key = ""
-                while i < len(lines) and lines[i].strip() != "":
-                    peer_line = lines[i]
-                    if peer_line.strip().startswith("#"):
-                        has_name_comment = True
-                    elif peer_line.strip().startswith("PublicKey ="):
-                        client_public_key = peer_line.strip().split("=", 1)[1].strip()
-                    peer_block.append(peer_line)
-                    i += 1
-                if not has_name_comment:
-                    if client_public_key in clients_dict:
-                        client_name = clients_dict[client_public_key].get(
-                            "clientName", f"client_{client_public_key[:6]}"
-                        )
-                    else:
-                        client_name = f"client_{client_public_key[:6]}"
-                        clients_dict[client_public_key] = {
-                            "clientName": client_name,
-                            "creationDate": datetime.now().isoformat(),
-                        }
-                        updated_clientsTable = True
-                    peer_block.insert(1, f"# {client_name}")
-                    modified = True
-                new_config_lines.extend(peer_block)
-                if i < len(lines):
-                    new_config_lines.append(lines[i])
-                    i += 1
-            else:
-                new_config_lines.append(line)
-                i += 1
-
-        if modified:
-            new_config_content = "\n".join(new_config_lines)
-            with tempfile.NamedTemporaryFile(mode="w", delete=False) as temp_config:
-                temp_config.write(new_config_content)
-                temp_config_path = temp_config.name
-            docker_cmd = (
-                f"docker cp {temp_config_path} {docker_container}:{wg_config_file}"
-            )
-            subprocess.check_call(docker_cmd, shell=True)
-            os.remove(temp_config_path)
+async def ensure_peer_names():
+    """Добавляет комментарий # name peer'ам, у которых его нет.
+
+    Запускается по расписанию, но работает только при изменении файлов:
+    снимок реестра перечитывается лишь при смене mtime/size, а уже
+    проверенный хеш содержимого пропускается. Меняются только блоки
+    безымянных peer'ов, остальной текст wg0.conf сохраняется как есть.
+    """
+    global _names_checked_hash
+    registry = get_peer_registry()
+    if registry.write_lock.locked():
+        # Идёт добавление/удаление клиента — проверим при следующем запуске
+        return
+
+    async with registry.write_lock:
+        snapshot = await registry.snapshot()
+        if not snapshot.content_hash or snapshot.content_hash == _names_checked_hash:
+            return
+        if not snapshot.unnamed_peers:
+            _names_checked_hash = snapshot.content_hash
+            return
+
+        setting = get_config()
+        wg_config_file = setting["wg_config_file"]
+        docker_container = setting["docker_container"]
+        clients_dict = {
+            client["clientId"]: client["userData"] for client in snapshot.clients_table
+        }
+        try:
+            config = WgConfig.parse(snapshot.config_content)
+            updated_clients_table = False
+
+            for public_key in snapshot.unnamed_peers:
+                peer = config.by_public_key.get(public_key)
+                if peer is None:
+                    continue
+                if public_key in clients_dict:
+                    client_name = clients_dict[public_key].get(
+                        "clientName", f"client_{public_key[:6]}"
+                    )
+                else:
+                    client_name = f"client_{public_key[:6]}"
+                    clients_dict[public_key] = {
+                        "clientName": client_name,
+                        "creationDate": datetime.now().isoformat(),
+                    }
+                    updated_clients_table = True
+                peer.set_name(client_name)
+
+            await write_config(docker_container, wg_config_file, config.to_text())
             logger.info(
-                "Конфигурационный файл WireGuard обновлён с добавлением комментариев # name_client."
+                f"Добавлены комментарии # name_client для {len(snapshot.unnamed_peers)} peer'ов."
             )
 
-        if updated_clientsTable:
-            clientsTable_list = [
-                {"clientId": key, "userData": value}
-                for key, value in clients_dict.items()
-            ]
-            with tempfile.NamedTemporaryFile(
-                mode="w", delete=False
-            ) as temp_clientsTable:
-                json.dump(clientsTable_list, temp_clientsTable)
-                temp_clientsTable_path = temp_clientsTable.name
-            docker_cmd = f"docker cp {temp_clientsTable_path} {docker_container}:/opt/amnezia/awg/clientsTable"
-            subprocess.check_call(docker_cmd, shell=True)
-            os.remove(temp_clientsTable_path)
-            logger.info("clientsTable обновлён с новыми клиентами.")
-    except Exception as e:
-        logger.error(
-            f"Ошибка при обновлении комментариев в конфигурации WireGuard: {e}"
-        )
+            if updated_clients_table:
+                clients_table = [
+                    {"clientId": key, "userData": value}
+                    for key, value in clients_dict.items()
+                ]
+                await write_clients_table(docker_container, clients_table)
+                logger.info("clientsTable обновлён с новыми клиентами.")
+        except Exception as e:
+            logger.error(
+                f"Ошибка при обновлении комментариев в конфигурации WireGuard: {e}"
+            )
+        finally:
+            registry.invalidate()
 
 
 def get_config(path="files/setting.ini"):
@@ -202,399 +191,267 @@ def get_config(path="files/setting.ini"):
     return out
 
 
-def save_client_endpoint(username, endpoint):
-    os.makedirs("files/connections", exist_ok=True)
-    file_path = os.path.join("files", "connections", f"{username}_ip.json")
-    timestamp = datetime.now().strftime("%d.%m.%Y %H:%M")
-    ip_address = endpoint.split(":")[0]
+def get_peer_registry() -> PeerRegistry:
+    """Общий для всех обработчиков и задач реестр пиров WireGuard."""
+    global _peer_registry
+    if _peer_registry is None:
+        setting = get_config()
+        _peer_registry = PeerRegistry(
+            setting["docker_container"], setting["wg_config_file"]
+        )
+    return _peer_registry
 
-    if os.path.exists(file_path):
-        with open(file_path, "r") as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                data = {}
-    else:
-        data = {}
 
-    data[ip_address] = timestamp
+def get_ip_allocator() -> IpAllocator:
+    """Пулы адресов клиентов (ip_pool / ipv6_pool в setting.ini)."""
+    global _ip_allocator
+    if _ip_allocator is None:
+        from service.db_instance import user_db
 
-    with open(file_path, "w") as f:
-        json.dump(data, f)
+        setting = get_config()
+        _ip_allocator = IpAllocator(
+            user_db,
+            setting.get("ip_pool", "10.8.1.0/24"),
+            setting.get("ipv6_pool") or None,
+        )
+    return _ip_allocator
 
 
-def root_add(id_user, ipv6=False):
-    logger.info(f"➕ root_add - {id_user}")
-    setting = get_config()
-    endpoint = setting["endpoint"]
-    wg_config_file = setting["wg_config_file"]
-    docker_container = setting["docker_container"]
+def get_traffic_store() -> TrafficStore:
+    global _traffic_store
+    if _traffic_store is None:
+        from service.db_instance import user_db
 
-    clients = get_client_list()
-    client_entry = next((c for c in clients if c[0] == id_user), None)
-    if client_entry:
-        logger.info(
-            f"Пользователь {id_user} уже существует. Генерация конфигурации невозможна без приватного ключа."
-        )
-        return False
-    else:
-        cmd = ["./newclient.sh", id_user, endpoint, wg_config_file, docker_container]
-        if subprocess.call(cmd) == 0:
-            return True
-        return False
+        _traffic_store = TrafficStore(user_db)
+    return _traffic_store
 
 
-def get_clients_from_clients_table():
+async def sample_traffic() -> None:
+    """Снимает счётчики rx/tx всех peer'ов и сохраняет приращения."""
     setting = get_config()
-    docker_container = setting["docker_container"]
-    clients_table_path = "/opt/amnezia/awg/clientsTable"
     try:
-        cmd = f"docker exec -i {docker_container} cat {clients_table_path}"
-        call = subprocess.check_output(cmd, shell=True)
-        clients_table = json.loads(call.decode("utf-8"))
-        client_map = {
-            client["clientId"]: client["userData"]["clientName"]
-            for client in clients_table
-        }
-        return client_map
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Ошибка при получении clientsTable: {e}")
-        return {}
-    except json.JSONDecodeError:
-        logger.error("Ошибка при разборе clientsTable JSON.")
-        return {}
+        snapshot = await get_peer_registry().snapshot()
+        peer_stats = await read_peer_stats(setting["docker_container"], setting["wg_config_file"])
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        logger.error(f"Ошибка при сборе статистики трафика: {e}")
+        return
 
+    samples = []
+    for public_key, stats in peer_stats.items():
+        client = snapshot.by_public_key.get(public_key)
+        if client is None:
+            continue
+        samples.append(TrafficSample(client[0], public_key, stats.rx_bytes, stats.tx_bytes))
+    store = get_traffic_store()
+    await store.record(samples)
+    await store.rollup()
+    await record_connections(snapshot, peer_stats)
 
-def get_full_clients_table():
-    setting = get_config()
-    docker_container = setting["docker_container"]
-    clients_table_path = "/opt/amnezia/awg/clientsTable"
-    try:
-        cmd = f"docker exec -i {docker_container} cat {clients_table_path}"
-        call = subprocess.check_output(cmd, shell=True)
-        clients_table = json.loads(call.decode("utf-8"))
-        return clients_table
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Ошибка при получении clientsTable: {e}")
-        return []
-    except json.JSONDecodeError:
-        logger.error("Ошибка при разборе clientsTable JSON.")
-        return []
 
+def _has_ipv6(addresses: str) -> bool:
+    return any(":" in address for address in addresses.split(","))
 
-def parse_client_name(full_name):
-    return full_name.split("[")[0].strip()
 
+async def allocate_client_address(client_name: str, ipv6: Optional[bool] = None):
+    """Выдаёт адреса новому клиенту с учётом уже занятых в wg0.conf.
 
-def get_client_list():
-    setting = get_config()
-    wg_config_file = setting["wg_config_file"]
-    docker_container = setting["docker_container"]
+    ipv6=None — IPv6-адрес выдаётся, если он есть у интерфейса сервера
+    (Address в wg0.conf) и в setting.ini задан ipv6_pool.
+    """
+    snapshot = await get_peer_registry().snapshot()
+    if ipv6 is None:
+        ipv6 = _has_ipv6(snapshot.interface_address or "")
+    allocator = get_ip_allocator()
+    used = [(client[0], client[2]) for client in snapshot.clients]
+    if snapshot.interface_address:
+        used.append(("server", snapshot.interface_address))
+    await allocator.sync(used, snapshot.content_hash)
+    return await allocator.allocate(client_name, ipv6=ipv6)
 
-    client_map = get_clients_from_clients_table()
 
-    try:
-        cmd = f"docker exec -i {docker_container} cat {wg_config_file}"
-        call = subprocess.check_output(cmd, shell=True)
-        config_content = call.decode("utf-8")
-
-        clients = []
-        lines = config_content.splitlines()
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            if line.startswith("[Peer]"):
-                client_public_key = ""
-                allowed_ips = ""
-                client_name = "Unknown"
-                i += 1
-                while i < len(lines):
-                    peer_line = lines[i].strip()
-                    if peer_line == "":
-                        break
-                    if peer_line.startswith("#"):
-                        full_client_name = peer_line[1:].strip()
-                        client_name = parse_client_name(full_client_name)
-                    elif peer_line.startswith("PublicKey ="):
-                        client_public_key = peer_line.split("=", 1)[1].strip()
-                    elif peer_line.startswith("AllowedIPs ="):
-                        allowed_ips = peer_line.split("=", 1)[1].strip()
-                    i += 1
-                client_name = client_map.get(
-                    client_public_key,
-                    client_name if "client_name" in locals() else "Unknown",
-                )
-                clients.append([client_name, client_public_key, allowed_ips])
-            else:
-                i += 1
-        return clients
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Ошибка при получении списка клиентов: {e}")
-        return []
-
-
-def get_active_list() -> Dict[str, ActiveClient]:
-    setting = get_config()
-    docker_container = setting["docker_container"]
+def get_connection_log() -> ConnectionLog:
+    global _connection_log
+    if _connection_log is None:
+        from service.db_instance import user_db
 
-    client_map = get_clients_from_clients_table()
+        _connection_log = ConnectionLog(user_db)
+    return _connection_log
+
+
+async def import_legacy_connections() -> None:
+    """Переносит историю подключений из files/connections в базу (один раз при запуске)."""
+    await get_connection_log().import_legacy(os.path.join("files", "connections"))
+
+
+async def prune_connection_log() -> None:
+    await get_connection_log().prune()
 
-    try:
-        clients = get_client_list()
-        client_key_map = {client[1]: client[0] for client in clients}
-
-        cmd = f"docker exec -i {docker_container} wg show"
-        call = subprocess.check_output(cmd, shell=True)
-        wg_output = call.decode("utf-8")
-
-        active_clients: Dict[str, ActiveClient] = {}
-        current_peer: Dict[str, Optional[str]] = {}
-        for line in wg_output.splitlines():
-            line = line.strip()
-            if line.startswith("peer:"):
-                peer_public_key = line.split("peer: ")[1].strip()
-                current_peer = {"public_key": peer_public_key}
-            elif line.startswith("endpoint:") and "public_key" in current_peer:
-                current_peer["endpoint"] = line.split("endpoint: ")[1].strip()
-            elif line.startswith("latest handshake:") and "public_key" in current_peer:
-                current_peer["latest_handshake"] = line.split("latest handshake: ")[
-                    1
-                ].strip()
-            elif line.startswith("transfer:") and "public_key" in current_peer:
-                current_peer["transfer"] = line.split("transfer: ")[1].strip()
-            elif line == "" and "public_key" in current_peer:
-                last_handshake_raw = current_peer.get("latest_handshake")
-                last_handshake = last_handshake_raw.lower() if last_handshake_raw else ""
-                if last_handshake not in ["never", "нет данных", "-"]:
-                    peer_public_key = current_peer.get("public_key") or ""
-                    if peer_public_key in client_key_map:
-                        username = client_key_map[peer_public_key]
-                        last_time = current_peer.get("latest_handshake", "Нет данных")
-                        transfer = current_peer.get("transfer", "Нет данных")
-                        endpoint = current_peer.get("endpoint", "Нет данных")
-                        save_client_endpoint(username, endpoint)
-                        active_clients[username] = ActiveClient(
-                            last_time=last_time or "",
-                            transfer=transfer or "",
-                            endpoint=endpoint or ""
-                        )
-                current_peer = {}
-
-        if "public_key" in current_peer:
-            last_handshake_raw = current_peer.get("latest_handshake")
-            last_handshake = last_handshake_raw.lower() if last_handshake_raw else ""
-            if last_handshake not in ["never", "нет данных", "-"]:
-                peer_public_key = current_peer.get("public_key") or ""
-                if peer_public_key in client_key_map:
-                    username = client_key_map[peer_public_key]
-                    last_time = current_peer.get("latest_handshake", "Нет данных")
-                    transfer = current_peer.get("transfer", "Нет данных")
-                    endpoint = current_peer.get("endpoint", "Нет данных")
-                    save_client_endpoint(username, endpoint)
-                    active_clients[username] = ActiveClient(
-                            last_time=last_time or "",
-                            transfer=transfer or "",
-                            endpoint=endpoint or ""
-                        )
-
-        return active_clients
-
-    except subprocess.CalledProcessError as e:
-        print(f"Ошибка при получении активных клиентов: {e}")
-        return {}
 
+async def record_connections(snapshot, peer_stats) -> None:
+    """Записывает endpoint'ы peer'ов с рукопожатием в историю подключений."""
+    observations = []
+    for public_key, stats in peer_stats.items():
+        client = snapshot.by_public_key.get(public_key)
+        if client is None or not stats.latest_handshake or not stats.endpoint:
+            continue
+        observations.append((client[0], stats.endpoint, stats.latest_handshake))
+    await get_connection_log().record(observations)
 
-def deactive_user_db(client_name):
+
+async def root_add(id_user, ipv6: Optional[bool] = None):
+    logger.info(f"➕ root_add - {id_user}")
     setting = get_config()
+    endpoint = setting["endpoint"]
     wg_config_file = setting["wg_config_file"]
     docker_container = setting["docker_container"]
 
-    clients = get_client_list()
-    client_entry = next((c for c in clients if c[0] == client_name), None)
-    if client_entry:
-        client_public_key = client_entry[1]
-        if (
-            subprocess.call(
-                [
-                    "./removeclient.sh",
-                    client_name,
-                    client_public_key,
-                    wg_config_file,
-                    docker_container,
-                ]
+    # newclient.sh дописывает wg0.conf и clientsTable — не пересекаемся с другими записями
+    async with get_peer_registry().write_lock:
+        if await get_client(id_user):
+            logger.info(
+                f"Пользователь {id_user} уже существует. Генерация конфигурации невозможна без приватного ключа."
             )
-            == 0
-        ):
-            return True
-    else:
-        logger.error(f"Пользователь {client_name} не найден в списке клиентов.")
-    return False
-
-
-def load_expirations():
-    if not os.path.exists(EXPIRATIONS_FILE):
-        return {}
-    with open(EXPIRATIONS_FILE, "r") as f:
+            return False
         try:
-            data = json.load(f)
-            for user, info in data.items():
-                if info.get("expiration_time"):
-                    data[user]["expiration_time"] = datetime.fromisoformat(
-                        info["expiration_time"]
-                    ).replace(tzinfo=UTC)
-                else:
-                    data[user]["expiration_time"] = None
-            return data
-        except json.JSONDecodeError:
-            logger.error("Ошибка при загрузке expirations.json.")
-            return {}
-
-
-def save_expirations(expirations):
-    os.makedirs(os.path.dirname(EXPIRATIONS_FILE), exist_ok=True)
-    data = {}
-    for user, info in expirations.items():
-        data[user] = {
-            "expiration_time": (
-                info["expiration_time"].isoformat() if info["expiration_time"] else None
-            ),
-            "traffic_limit": info.get("traffic_limit", "Неограниченно"),
-        }
-    with open(EXPIRATIONS_FILE, "w") as f:
-        json.dump(data, f)
-
-
-def set_user_expiration(username: str, expiration: datetime, traffic_limit: str):
-    expirations = load_expirations()
-    if username not in expirations:
-        expirations[username] = {}
-    if expiration:
-        if expiration.tzinfo is None:
-            expiration = expiration.replace(tzinfo=UTC)
-        expirations[username]["expiration_time"] = expiration
-    else:
-        expirations[username]["expiration_time"] = None
-    expirations[username]["traffic_limit"] = traffic_limit
-    save_expirations(expirations)
-
-
-def remove_user_expiration(username: str):
-    expirations = load_expirations()
-    if username in expirations:
-        del expirations[username]
-        save_expirations(expirations)
-
-
-def get_users_with_expiration():
-    expirations = load_expirations()
-    return [
-        (
-            user,
-            info["expiration_time"].isoformat() if info["expiration_time"] else None,
-            info.get("traffic_limit", "Неограниченно"),
+            ipv4_address, ipv6_address = await allocate_client_address(id_user, ipv6)
+        except PoolExhaustedError as e:
+            logger.error(f"Не удалось выделить адрес для {id_user}: {e}")
+            return False
+        result = await executor.call(
+            "./newclient.sh",
+            id_user,
+            endpoint,
+            wg_config_file,
+            docker_container,
+            setting.get("apply_mode", "live"),
+            ipv4_address,
+            ipv6_address or "",
+            timeout=SCRIPT_TIMEOUT,
         )
-        for user, info in expirations.items()
-    ]
+        get_peer_registry().invalidate()
+        if result != 0:
+            await get_ip_allocator().release(id_user)
+        return result == 0
 
 
-def get_user_expiration(username: str):
-    expirations = load_expirations()
-    return expirations.get(username, {}).get("expiration_time", None)
+async def get_clients_from_clients_table():
+    return (await get_peer_registry().snapshot()).client_map
 
 
-def get_user_traffic_limit(username: str):
-    expirations = load_expirations()
-    return expirations.get(username, {}).get("traffic_limit", "Неограниченно")
+async def get_full_clients_table():
+    return (await get_peer_registry().snapshot()).clients_table
 
 
-def load_payments():
-    if os.path.exists(PAYMENTS_FILE):
-        try:
-            with open(PAYMENTS_FILE, "r") as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
-
-
-def save_payments(payments):
-    os.makedirs(os.path.dirname(PAYMENTS_FILE), exist_ok=True)
-    with open(PAYMENTS_FILE, "w") as f:
-        json.dump(payments, f, indent=4)
-
-
-def add_payment(user_id: int, payment_id: str, amount: float, status: str = "pending"):
-    payments = load_payments()
-    payment_data = {
-        "user_id": user_id,
-        "payment_id": payment_id,
-        "amount": amount,
-        "status": status,
-        "timestamp": datetime.now(UTC).isoformat(),
-    }
-    if str(user_id) not in payments:
-        payments[str(user_id)] = []
-    payments[str(user_id)].append(payment_data)
-    save_payments(payments)
-    return payment_data
-
-
-def update_payment_status(payment_id: str, status: str):
-    payments = load_payments()
-    for user_payments in payments.values():
-        for payment in user_payments:
-            if payment["payment_id"] == payment_id:
-                payment["status"] = status
-                save_payments(payments)
-                return True
-    return False
-
-
-def get_user_payments(user_id: int):
-    payments = load_payments()
-    return payments.get(str(user_id), [])
-
-
-def get_all_payments():
-    payments = load_payments()
-    flat_payments = []
-    for user_id, user_payments in payments.items():
-        flat_payments.extend(user_payments)
-    return flat_payments
-
-
-# Методы для управления администраторами
-def load_admins():
-    os.makedirs(os.path.dirname(ADMINS_FILE), exist_ok=True)
-    if not os.path.exists(ADMINS_FILE):
-        return []
-    with open(ADMINS_FILE, "r") as f:
+async def get_client_list():
+    return (await get_peer_registry().snapshot()).clients
+
+
+async def get_client(client_name: str) -> Optional[list]:
+    """Возвращает [имя, публичный ключ, AllowedIPs] клиента или None."""
+    return (await get_peer_registry().snapshot()).by_name.get(client_name)
+
+
+async def get_active_list() -> Dict[str, ActiveClient]:
+    """Клиенты, у которых было хотя бы одно рукопожатие, по данным wg show dump."""
+    setting = get_config()
+    docker_container = setting["docker_container"]
+    wg_config_file = setting["wg_config_file"]
+
+    try:
+        snapshot = await get_peer_registry().snapshot()
+        peer_stats = await read_peer_stats(docker_container, wg_config_file)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        logger.error(f"Ошибка при получении активных клиентов: {e}")
+        return {}
+
+    active_clients: Dict[str, ActiveClient] = {}
+    for public_key, stats in peer_stats.items():
+        client = snapshot.by_public_key.get(public_key)
+        handshake_at = stats.handshake_at
+        if client is None or handshake_at is None:
+            continue
+        active_clients[client[0]] = ActiveClient(
+            latest_handshake=handshake_at,
+            rx_bytes=stats.rx_bytes,
+            tx_bytes=stats.tx_bytes,
+            endpoint=stats.endpoint or "Нет данных",
+        )
+    await record_connections(snapshot, peer_stats)
+    return active_clients
+
+
+async def deactive_user_db(client_name):
+    setting = get_config()
+    wg_config_file = setting["wg_config_file"]
+    docker_container = setting["docker_container"]
+    registry = get_peer_registry()
+
+    async with registry.write_lock:
+        client_entry = await get_client(client_name)
+        if not client_entry:
+            logger.error(f"Пользователь {client_name} не найден в списке клиентов.")
+            return False
+
+        client_public_key = client_entry[1]
         try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            logger.error("Ошибка при загрузке admins.json.")
-            return []
+            registry.invalidate()
+            snapshot = await registry.snapshot()
+            config = WgConfig.parse(snapshot.config_content)
+            if config.remove_peer(client_public_key):
+                await write_config(docker_container, wg_config_file, config.to_text())
+            await remove_peer(
+                docker_container,
+                wg_config_file,
+                client_public_key,
+                setting.get("apply_mode", "live"),
+            )
 
+            clients_table = [
+                client
+                for client in snapshot.clients_table
+                if client.get("clientId") != client_public_key
+            ]
+            if len(clients_table) != len(snapshot.clients_table):
+                await write_clients_table(docker_container, clients_table)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logger.error(f"Ошибка при удалении клиента {client_name}: {e}")
+            return False
+        finally:
+            registry.invalidate()
+
+    user_dir = os.path.join("users", client_name)
+    # traffic.json создавался старыми версиями newclient.sh
+    for file_name in (f"{client_name}.conf", "traffic.json"):
+        file_path = os.path.join(user_dir, file_name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    try:
+        os.rmdir(user_dir)
+    except OSError:
+        pass
 
-def save_admins(admin_ids):
-    os.makedirs(os.path.dirname(ADMINS_FILE), exist_ok=True)
-    with open(ADMINS_FILE, "w") as f:
-        json.dump(admin_ids, f)
+    await get_ip_allocator().release(client_name)
+    await get_traffic_store().forget_client(client_name, client_public_key)
+    logger.info(f"Клиент {client_name} удалён из WireGuard")
+    return True
 
 
-def get_admins():
-    return load_admins()
+async def get_preshared_key(client_name: str) -> Optional[str]:
+    """Текущий PresharedKey клиента из wg0.conf или None."""
+    snapshot = await get_peer_registry().snapshot()
+    client = snapshot.by_name.get(client_name)
+    if client is None:
+        return None
+    peer = snapshot.config.by_public_key.get(client[1])
+    return peer.preshared_key if peer and peer.preshared_key else None
 
 
-def add_admin(user_id):
-    admin_ids = load_admins()
-    if str(user_id) not in admin_ids:
-        admin_ids.append(str(user_id))
-        save_admins(admin_ids)
+def get_media_registry() -> MediaRegistry:
+    """file_id статических файлов из media/, уже загруженных в Telegram."""
+    global _media_registry
+    if _media_registry is None:
+        from service.db_instance import user_db
 
+        _media_registry = MediaRegistry(user_db)
+    return _media_registry
 
-def remove_admin(user_id):
-    admin_ids = load_admins()
-    if str(user_id) in admin_ids:
-        admin_ids.remove(str(user_id))
-        save_admins(admin_ids)
@@ -1,10 +1,8 @@
 import asyncio
 import datetime
-import json
 import logging
-import os
 import re
-import aiofiles
+import time
 import aiohttp
 import humanize
 from typing import cast, Optional
@@ -26,18 +24,22 @@ from aiogram.utils.chat_action import ChatActionSender
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.text_decorations import markdown_decoration
 from admin_service.admin import is_privileged
-from service.send_backup_admin import create_db_backup
-from utils import get_isp_info, parse_relative_time, parse_transfer
+from service.send_backup_admin import deliver_backup
+from service.connection_log import format_seen
+from utils import get_isp_info
 from fsm.callback_data import ClientCallbackFactory
 from keyboard.menu import get_client_profile_keyboard, get_home_keyboard
 from fsm.admin_state import AdminState
 from service.vpn_service import create_vpn_config
 from service.db_instance import user_db
-from settings import ADMINS, DB_FILE, MODERATORS
+from settings import ADMINS, MODERATORS
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+# За сколько последних дней показывать трафик в профиле клиента
+RECENT_TRAFFIC_DAYS = 30
+
 
 @router.callback_query(F.data == "add_user")
 async def adimin_add_user_callback_handler(callback: CallbackQuery, state: FSMContext):
@@ -122,7 +124,7 @@ async def admin_list_users_callback(callback: CallbackQuery):
 
     try:
         logger.info("Fetching client list...")
-        clients = db.get_client_list()
+        clients = await db.get_client_list()
         logger.info(f"Found {len(clients)} clients.")
 
         if not clients:
@@ -135,8 +137,12 @@ async def admin_list_users_callback(callback: CallbackQuery):
             await callback.answer()
             return
 
-        activ_clients = db.get_active_list()
+        activ_clients = await db.get_active_list()
         logger.info(f"Fetched active clients data.")
+        # Имена из базы одним запросом по всем клиентам
+        telegram_users = await user_db.get_users_by_telegram_ids(
+            [client_data[0] for client_data in clients]
+        )
 
         keyboard_buttons: list = []
 
@@ -153,16 +159,12 @@ async def admin_list_users_callback(callback: CallbackQuery):
             if not activ_client:
                 continue
 
-            if activ_client.last_time and activ_client.last_time.lower() not in [
-                "never",
-                "нет данных",
-                "-",
-            ]:
-                status = "🟢"  # Упрощенно ставим 🟢 если строка рукопожатия не пуста и не Never/Нет данных/
+            if activ_client.latest_handshake:
+                status = "🟢"  # В списке активных только клиенты с рукопожатием
 
-            telegram_name = user_db.get_user_by_telegram_id(username)
+            telegram_name = telegram_users.get(username)
 
-            if telegram_name is not False:
+            if telegram_name:
                 button_text = f"{status} {telegram_name.name}"
             else:
                 button_text = f"{status} {username}"
@@ -238,8 +240,8 @@ async def validate_callback_data(callback: CallbackQuery) -> bool:
 
 async def get_client_info(username: str) -> Optional[tuple]:
     """Получает базовую информацию о клиенте."""
-    clients = db.get_client_list()
-    return next((c for c in clients if c[0] == username), None)
+    client = await db.get_client(username)
+    return tuple(client) if client else None
 
 def get_client_network_info(client_info: tuple) -> tuple[str, str, str, str]:
     """Извлекает сетевую информацию клиента."""
@@ -265,36 +267,37 @@ async def update_client_activity_status(
     outgoing_traffic: str
 ) -> tuple[str, str, str]:
     """Обновляет статус активности клиента."""
-    active_clients = db.get_active_list()
+    active_clients = await db.get_active_list()
     active_info = active_clients.get(username)
 
-    if active_info and active_info.last_time.lower() not in ["never", "нет данных", "-"]:
-        try:
-            last_handshake = parse_relative_time(active_info.last_time)
-            if (
-                last_handshake
-                and (
-                    datetime.datetime.now(ZoneInfo("Europe/Moscow"))
-                    - last_handshake
-                ).total_seconds()
-                <= 60
-            ):
-                status = "🟢 Онлайн"
-            else:
-                status = "❌ Офлайн"
-
-            transfer_result = parse_transfer(active_info.transfer)
-            if transfer_result:
-                incoming_bytes, outgoing_bytes = transfer_result
-                incoming_traffic = f"↓{humanize.naturalsize(incoming_bytes)}"
-                outgoing_traffic = f"↑{humanize.naturalsize(outgoing_bytes)}"
-
-        except Exception as e:
-            logger.error(f"Ошибка при анализе активности клиента: {e}", exc_info=True)
+    if active_info:
+        if (
+            datetime.datetime.now(ZoneInfo("Europe/Moscow"))
+            - active_info.latest_handshake
+        ).total_seconds() <= 60:
+            status = "🟢 Онлайн"
+        else:
+            status = "❌ Офлайн"
+
+    # Накопленный трафик берётся из локальной статистики, а не из счётчиков
+    # интерфейса, которые обнуляются при его перезапуске
+    store = db.get_traffic_store()
+    rx_bytes, tx_bytes = await store.totals(username)
+    if rx_bytes or tx_bytes:
+        since = int(time.time()) - RECENT_TRAFFIC_DAYS * 86400
+        recent_rx, recent_tx = await store.usage_since(username, since)
+        incoming_traffic = (
+            f"↓{humanize.naturalsize(rx_bytes)}"
+            f" (за {RECENT_TRAFFIC_DAYS} дн.: {humanize.naturalsize(recent_rx)})"
+        )
+        outgoing_traffic = (
+            f"↑{humanize.naturalsize(tx_bytes)}"
+            f" (за {RECENT_TRAFFIC_DAYS} дн.: {humanize.naturalsize(recent_tx)})"
+        )
 
     return status, incoming_traffic, outgoing_traffic
 
-def format_profile_text(
+async def format_profile_text(
     username: str,
     ipv4_address: str,
     status: str,
@@ -302,7 +305,7 @@ def format_profile_text(
     incoming_traffic: str
 ) -> str:
     """Форматирует текст профиля пользователя."""
-    telegram_name = user_db.get_user_by_telegram_id(username)
+    telegram_name = await user_db.get_user_by_telegram_id(username)
     telegram_name_text = telegram_name.name if telegram_name is not False else ""
     is_unlimited = telegram_name.is_unlimited if telegram_name is not False else 0
     telegram_end_date_text = "безлимит" if is_unlimited else (
@@ -341,7 +344,7 @@ async def client_selected_callback(
             username, status, incoming_traffic, outgoing_traffic
         )
 
-        text = format_profile_text(
+        text = await format_profile_text(
             username, ipv4_address, status, outgoing_traffic, incoming_traffic
         )
 
@@ -387,13 +390,9 @@ async def create_backup_callback(callback: CallbackQuery):
     try:
         bot = cast(Bot, callback.bot)
         async with ChatActionSender.upload_document(bot=bot, chat_id=user_id):
-            backup_bytes = create_db_backup(DB_FILE)
-            await bot.send_document(
-                chat_id=user_id,
-                document=BufferedInputFile(file=backup_bytes, filename="backup.zip"),
-                caption="Бэкап успешно создан и отправлен.",
-                parse_mode=ParseMode.HTML,
-            )
+            delivered = await deliver_backup(bot, [user_id], "Бэкап успешно создан и отправлен.")
+        if not delivered:
+            raise RuntimeError("бэкап не доставлен")
         logging.info(f"Бэкап отправлен администратору: {user_id}")
     except Exception as e:
         logging.error(f"Ошибка при создании/отправке бэкапа: {e}")
@@ -411,27 +410,18 @@ async def client_connections_callback(callback: CallbackQuery):
         return
 
     username = callback.data.split("connections_")[1]
-    file_path = os.path.join("files", "connections", f"{username}_ip.json")
-    if not os.path.exists(file_path):
+    last_connections = await db.get_connection_log().recent(username, limit=5)
+    if not last_connections:
         await callback.answer("Нет данных о подключениях.", show_alert=True)
         return
 
-    async with aiofiles.open(file_path, "r") as f:
-        data = json.loads(await f.read())
-
-    last_connections = sorted(
-        data.items(),
-        key=lambda x: datetime.datetime.strptime(x[1], "%d.%m.%Y %H:%M"),
-        reverse=True,
-    )[:5]
-
     isp_results = await asyncio.gather(
-        *(get_isp_info(ip) for ip, _ in last_connections)
+        *(get_isp_info(event.ip) for event in last_connections)
     )
 
     text = f"*Последние подключения {username}:*\n" + "\n".join(
-        f"{ip} ({isp}) - {time}"
-        for (ip, time), isp in zip(last_connections, isp_results)
+        f"{event.ip} ({isp}) - {format_seen(event.last_seen)}"
+        for event, isp in zip(last_connections, isp_results)
     )
 
     keyboard = InlineKeyboardMarkup(
@@ -465,7 +455,7 @@ async def ip_info_callback(callback: CallbackQuery):
         return
 
     username = callback.data.split("ip_info_")[1]
-    active_clients = db.get_active_list()
+    active_clients = await db.get_active_list()
     active_info = active_clients.get(username)
 
     if not active_info:
@@ -527,7 +517,7 @@ async def delete_user_callback(callback: CallbackQuery):
     username = callback.data.split("delete_user_")[1]
     try:
         # Удаляем из AmneziaVPN/WireGuard через deactive_user_db
-        db.deactive_user_db(username)
+        await db.deactive_user_db(username)
         # Удаляем файлы пользователя, если есть
         import shutil, os
         user_dir = os.path.join("users", username)
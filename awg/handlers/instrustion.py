@@ -1,94 +1,95 @@
+import logging
+from typing import Dict, List, Tuple
+
 from aiogram import Router, F
-from aiogram.types import Message, FSInputFile, CallbackQuery
+from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 
+import db
 from keyboard.menu import get_instruction_type
 
+logger = logging.getLogger(__name__)
 router = Router()
 
 
-@router.callback_query(F.data == "instruction_iphone")
-async def send_iphone_instruction(callback: CallbackQuery):
-    if callback.bot is None:
-        await callback.answer("Ошибка: бот недоступен.")
-        return
-    try:
-        screenshots = [
-            FSInputFile("media/iphone_step1.jpg"),  # Нажать на файл 123144.conf
-            FSInputFile("media/iphone_step2.jpg"),  # Нажать "Поделиться"
-            FSInputFile("media/iphone_step3.jpg"),  # Нажать "Поделиться"
-            FSInputFile(
-                "media/iphone_step4.jpg"
-            ),  # Выбрать "AmneziaWG" → Нажать "Подключить"
-        ]
-
-        captions = [
+# Шаги инструкции по платформам: (скриншот, подпись). Каждая инструкция
+# отправляется одним альбомом; загруженные скриншоты переиспользуются по file_id
+INSTRUCTION_STEPS: Dict[str, List[Tuple[str, str]]] = {
+    "iphone": [
+        (
+            "media/iphone_step1.jpg",  # Нажать на файл 123144.conf
             "📱 *Шаг 1:* Нажмите на файл `.conf`, который вы получили.",
+        ),
+        (
+            "media/iphone_step2.jpg",  # Нажать "Поделиться"
             "📤 *Шаг 2:* Нажмите кнопку *«Поделиться»*",
+        ),
+        (
+            "media/iphone_step3.jpg",  # Нажать "Поделиться"
             "📤 *Шаг 3:* Нажмите кнопку *«Поделиться»*, затем — *«Ещё» (три точки)*.",
+        ),
+        (
+            "media/iphone_step4.jpg",  # Выбрать "AmneziaWG" → Нажать "Подключить"
             "🅦 *Шаг 4:* Выберите *AmneziaWG* из списка приложений и нажмите *«Подключить»*.",
-        ]
-
-        for i in range(len(screenshots)):
-            if isinstance(callback.message, Message):
-                await callback.message.answer_photo(
-                    photo=screenshots[i], caption=captions[i], parse_mode="Markdown"
-                )
-            else:
-                await callback.bot.send_photo(
-                    chat_id=callback.from_user.id,
-                    photo=screenshots[i],
-                    caption=captions[i],
-                    parse_mode="Markdown",
-                )
+        ),
+    ],
+    "android": [
+        (
+            "media/android_step1.jpg",  # Нажать на файл 123144.conf
+            "📱 *Шаг 1:* Нажмите на файл `.conf`, который вы получили.",
+        ),
+        (
+            "media/android_step2.jpg",  # Выбрать "AmneziaWG"
+            "🅦 *Шаг 4:* Выберите *AmneziaVPN* из списка приложений",
+        ),
+        (
+            "media/android_step3.jpg",  # Нажать "Подключить"
+            "🌐 нажмите *«Подключиться»*.",
+        ),
+    ],
+}
 
-    except Exception as e:
-        await callback.answer(
-            "⚠ Произошла ошибка при отправке инструкции. Попробуйте позже."
-        )
-        import logging
 
-        logging.exception("Ошибка при отправке инструкции")
+def prepare_instruction_albums():
+    """При запуске проверяет скриншоты и считает их хэши для MediaRegistry."""
+    media = db.get_media_registry()
+    for platform, steps in INSTRUCTION_STEPS.items():
+        for path, _ in steps:
+            try:
+                media.content_hash(path)
+            except OSError:
+                logger.error(f"Нет скриншота инструкции {platform}: {path}")
 
 
-@router.callback_query(F.data == "instruction_android")
-async def send_android_instruction(callback: CallbackQuery):
+async def send_instruction(callback: CallbackQuery, platform: str):
     if callback.bot is None:
         await callback.answer("Ошибка: бот недоступен.")
         return
     try:
-        screenshots = [
-            FSInputFile("media/android_step1.jpg"),  # Нажать на файл 123144.conf
-            FSInputFile("media/android_step2.jpg"),  # Выбрать "AmneziaWG"
-            FSInputFile("media/android_step3.jpg"),  # Нажать "Подключить"
-        ]
-
-        captions = [
-            "📱 *Шаг 1:* Нажмите на файл `.conf`, который вы получили.",
-            "🅦 *Шаг 4:* Выберите *AmneziaVPN* из списка приложений",
-            "🌐 нажмите *«Подключиться»*.",
-        ]
-
-        for i in range(len(screenshots)):
-            if isinstance(callback.message, Message):
-                await callback.message.answer_photo(
-                    photo=screenshots[i], caption=captions[i], parse_mode="Markdown"
-                )
-            else:
-                await callback.bot.send_photo(
-                    chat_id=callback.from_user.id,
-                    photo=screenshots[i],
-                    caption=captions[i],
-                    parse_mode="Markdown",
-                )
-
-    except Exception as e:
+        media = db.get_media_registry()
+        steps = INSTRUCTION_STEPS[platform]
+        if isinstance(callback.message, Message):
+            await media.send_album(callback.message.answer_media_group, steps)
+        else:
+            await media.send_album(
+                callback.bot.send_media_group, steps, chat_id=callback.from_user.id
+            )
+        await callback.answer()
+    except Exception:
         await callback.answer(
             "⚠ Произошла ошибка при отправке инструкции. Попробуйте позже."
         )
-        import logging
+        logger.exception("Ошибка при отправке инструкции")
 
-        logging.exception("Ошибка при отправке инструкции")
+
+@router.callback_query(F.data == "instruction_iphone")
+async def send_iphone_instruction(callback: CallbackQuery):
+    await send_instruction(callback, "iphone")
+
+
+@router.callback_query(F.data == "instruction_android")
+async def send_android_instruction(callback: CallbackQuery):
+    await send_instruction(callback, "android")
 
 
 @router.callback_query(F.data == "instructions")
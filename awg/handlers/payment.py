@@ -8,13 +8,14 @@ import uuid
 import logging
 
 from aiogram import Router, F
-from aiogram.types import LabeledPrice, PreCheckoutQuery, Message
+from aiogram.types import LabeledPrice, PreCheckoutQuery, Message, SuccessfulPayment
 from aiogram.enums import ContentType
 from aiogram.types import CallbackQuery
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from service.generate_vpn_key import generate_vpn_key
 from service.db_instance import user_db
+from service.db_user import PaymentOutcome
 from aiogram.types import Message, FSInputFile
 from settings import BOT, YOOKASSA_PROVIDER_TOKEN, ACTIVE_PAYMENT_SYSTEMS, PAYMENT_PLANS
 
@@ -124,34 +125,49 @@ async def pre_checkout(pre_checkout_query: PreCheckoutQuery):
     await pre_checkout_query.answer(ok=True)
 
 
+def parse_invoice_payload(payload: str) -> Optional[int]:
+    """Количество месяцев из payload вида '<система>-<telegram_id>-<месяцы>-<цена>'."""
+    parts = payload.rsplit("-", 3)
+    if len(parts) != 4:
+        return None
+    try:
+        return int(parts[2])
+    except ValueError:
+        return None
+
+
 async def process_successful_payment(
-    user_id: str, raw_payload: str, provider_payment_charge_id: str
-) -> Optional[int]:
-    """Обновление статуса платежа и продление подписки"""
+    user_id: str, payment: SuccessfulPayment
+) -> Optional[PaymentOutcome]:
+    """Проведение платежа и продление подписки одной транзакцией.
+
+    Повторная доставка того же платежа возвращает исходный результат
+    с duplicate=True, подписка второй раз не продлевается.
+    """
+    months = parse_invoice_payload(payment.invoice_payload)
+    if months is None:
+        logger.error(f"Некорректный payload платежа: {payment.invoice_payload}")
+        return None
     try:
-        updated_payment = user_db.update_payment_status(
-            raw_payload, provider_payment_charge_id, new_status="success"
+        return await user_db.apply_payment(
+            user_id,
+            payment.telegram_payment_charge_id,
+            payment.invoice_payload,
+            months=months,
+            amount=payment.total_amount,
+            provider_payment_id=payment.provider_payment_charge_id,
         )
-        if not updated_payment:
-            return None
-
-        user_db.update_user_end_date(user_id, months_to_add=updated_payment.months)
-        return updated_payment.months
     except Exception as e:
         logger.error(f"Ошибка при обработке успешного платежа: {e}", exc_info=True)
         return None
 
 
-def validate_payment(message: Message) -> Optional[tuple[str, str, str]]:
+def validate_payment(message: Message) -> Optional[tuple[str, SuccessfulPayment]]:
     """Валидация входных данных"""
     payment = message.successful_payment
     if payment is None or payment.invoice_payload is None or message.from_user is None:
         return None
-    return (
-        str(message.from_user.id),
-        payment.invoice_payload,
-        payment.provider_payment_charge_id,
-    )
+    return str(message.from_user.id), payment
 
 
 # 👉 Успешная оплата
@@ -162,31 +178,35 @@ async def successful_payment(message: Message):
         if result is None:
             await message.answer("Ошибка оплаты")
             return
-        telegram_id, payload, provider_payment_charge_id = result
+        telegram_id, payment = result
+        payload = payment.invoice_payload
 
         logger.info(f"💰 Успешная оплата {payload}")
 
-        months = await process_successful_payment(
-            telegram_id, payload, provider_payment_charge_id
-        )
-        if months is None:
+        outcome = await process_successful_payment(telegram_id, payment)
+        if outcome is None:
             await message.answer("Не удалось обновить статус оплаты.")
             return
+        if outcome.duplicate:
+            # Telegram повторил доставку: подписка уже продлена, конфигурацию не трогаем
+            logger.info(f"Повторная доставка платежа {outcome.payment.telegram_payment_charge_id}")
+            await message.answer("✅ Этот платёж уже обработан, подписка активна.")
+            return
 
+        months = outcome.payment.months
         logger.info(f"🔁 Подписка продлена на {months} мес. для {telegram_id}")
 
         # Проверяем есть конфигурация или нет
-        clients = db.get_client_list()
-        client_entry = next((c for c in clients if c[0] == str(telegram_id)), None)
+        client_entry = await db.get_client(str(telegram_id))
         if client_entry is None:  # Если нет создаем
             # Проверяем есть она у нас в БД
-            config = user_db.get_config_by_telegram_id(str(telegram_id))
+            config = await user_db.get_config_by_telegram_id(str(telegram_id))
             if not config:
                 await message.answer("⚙️ Генерируем VPN-конфигурацию...")
                 await create_vpn_config(telegram_id, message)
         else:
             await message.answer("🛡 У вас уже есть активная конфигурация.")
-        update_vpn_state()
+        await update_vpn_state()
         await notify_admins(
             text=f"🔁 Подписка продлена на {months} мес. для {telegram_id} \n {message.from_user.username} \n {payload}"
         )
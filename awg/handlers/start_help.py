@@ -1,11 +1,12 @@
 import logging
+import db
 from aiogram import Router, F
 
 from service.db_instance import user_db
 from utils import get_short_name, get_welcome_caption
 from keyboard.menu import get_main_menu_markup, get_user_main_menu
 from aiogram.filters import Command
-from aiogram.types import Message, FSInputFile, CallbackQuery
+from aiogram.types import Message, CallbackQuery
 from admin_service.admin import is_privileged
 from settings import ADMINS
 
@@ -26,11 +27,12 @@ async def help_command_handler(message: Message):
         )
     else:
         name = get_short_name(message.from_user)
-        user_db.add_user(str(user_id), name)
+        # Приветствие не ждёт коммита: записи /start коммитятся пачками
+        await user_db.add_user(str(user_id), name, wait=False)
         try:
-            photo = FSInputFile("media/logo.png")
-            await message.answer_photo(
-                photo=photo,
+            await db.get_media_registry().send_photo(
+                message.answer_photo,
+                "media/logo.png",
                 caption=get_welcome_caption(),
                 parse_mode="Markdown",
                 reply_markup=get_user_main_menu(),
@@ -63,9 +65,9 @@ async def home_callback_handler(callback: CallbackQuery):
         )
     else:
         try:
-            photo = FSInputFile("media/logo.png")
-            await callback.message.answer_photo(
-                photo=photo,
+            await db.get_media_registry().send_photo(
+                callback.message.answer_photo,
+                "media/logo.png",
                 caption=get_welcome_caption(),
                 parse_mode="Markdown",
                 reply_markup=get_user_main_menu(),
@@ -1,4 +1,3 @@
-from datetime import datetime
 from io import BytesIO
 import logging
 import os
@@ -10,6 +9,7 @@ from aiogram.filters import Command
 from aiogram.types import CallbackQuery, Message, BufferedInputFile
 
 from service.db_instance import user_db
+from service.epoch_day import today_epoch_day
 from keyboard.menu import get_user_profile_menu, get_user_profile_menu_expired
 from settings import BOT, VPN_NAME
 
@@ -27,7 +27,7 @@ async def user_profile(callback: CallbackQuery):
     telegram_id = str(callback.from_user.id)
     logger.info(f"Пользователь {telegram_id} открыл профиль")
 
-    user = user_db.get_user_by_telegram_id(telegram_id)
+    user = await user_db.get_user_by_telegram_id(telegram_id)
 
     if not user:
         await message.answer(
@@ -41,12 +41,8 @@ async def user_profile(callback: CallbackQuery):
 
     # Выбор нужного меню в зависимости от подписки
     if not user.is_unlimited:
-        try:
-            end_date_obj = datetime.strptime(user.end_date, "%Y-%m-%d") if user.end_date else None
-        except Exception:
-            end_date_obj = None
-
-        if not user.end_date or (end_date_obj and end_date_obj < datetime.now()):
+        expired = user.end_day is not None and user.end_day <= today_epoch_day()
+        if not user.end_date or expired:
             reply_markup = get_user_profile_menu_expired()  # Кнопки для неактивной подписки
         else:
             reply_markup = get_user_profile_menu()
@@ -79,7 +75,7 @@ async def get_vpn_config(callback: CallbackQuery):
         return
 
     user_id = callback.from_user.id
-    config = user_db.get_config_by_telegram_id(str(user_id))
+    config = await user_db.get_config_by_telegram_id(str(user_id))
     if not config:
         await callback.answer("Конфигурация не найдена")
         return
@@ -107,7 +103,7 @@ async def delete_user_handler(message: Message):
         return
     username = str(message.from_user.id)
 
-    if db.deactive_user_db(username):
+    if await db.deactive_user_db(username):
         shutil.rmtree(os.path.join("users", username), ignore_errors=True)
         await message.answer(f"Пользователь **{username}** удален.")
     else:
@@ -26,6 +26,12 @@ CLIENT_NAME="$1"
 ENDPOINT="$2"
 WG_CONFIG_FILE="$3"
 DOCKER_CONTAINER="$4"
+# live — применить peer через wg set без перезапуска интерфейса, restart — wg-quick down/up
+APPLY_MODE="${5:-live}"
+# Адреса выдаёт бот (service/ip_allocator.py); без них — поиск свободного в 10.8.1.0/24
+CLIENT_IP="${6:-}"
+CLIENT_IPV6="${7:-}"
+WG_INTERFACE=$(basename "$WG_CONFIG_FILE" .conf)
 
 if [[ ! "$CLIENT_NAME" =~ ^[a-zA-Z0-9_-]+$ ]]; then
     echo "Error: Invalid CLIENT_NAME. Only letters, numbers, underscores, and hyphens are allowed."
@@ -47,18 +53,28 @@ SERVER_PUBLIC_KEY=$(echo "$SERVER_PRIVATE_KEY" | docker exec -i $DOCKER_CONTAINE
 LISTEN_PORT=$(awk '/ListenPort\s*=/ {print $3}' "$SERVER_CONF_PATH")
 ADDITIONAL_PARAMS=$(awk '/^Jc\s*=|^Jmin\s*=|^Jmax\s*=|^S1\s*=|^S2\s*=|^H[1-4]\s*=/' "$SERVER_CONF_PATH")
 
-octet=2
-while grep -E "AllowedIPs\s*=\s*10\.8\.1\.$octet/32" "$SERVER_CONF_PATH" > /dev/null; do
-    (( octet++ ))
-done
+if [ -z "$CLIENT_IP" ]; then
+    octet=2
+    while grep -E "AllowedIPs\s*=\s*10\.8\.1\.$octet/32" "$SERVER_CONF_PATH" > /dev/null; do
+        (( octet++ ))
+    done
 
-if [ "$octet" -gt 254 ]; then
-    echo "Error: WireGuard internal subnet 10.8.1.0/24 is full"
-    exit 1
+    if [ "$octet" -gt 254 ]; then
+        echo "Error: WireGuard internal subnet 10.8.1.0/24 is full"
+        exit 1
+    fi
+
+    CLIENT_IP="10.8.1.$octet/32"
 fi
 
-CLIENT_IP="10.8.1.$octet/32"
 ALLOWED_IPS="$CLIENT_IP"
+CLIENT_ADDRESS="$CLIENT_IP"
+CLIENT_ALLOWED_IPS="0.0.0.0/0"
+if [ -n "$CLIENT_IPV6" ]; then
+    ALLOWED_IPS="$CLIENT_IP, $CLIENT_IPV6"
+    CLIENT_ADDRESS="$CLIENT_IP, $CLIENT_IPV6"
+    CLIENT_ALLOWED_IPS="0.0.0.0/0, ::/0"
+fi
 
 CLIENT_PUBLIC_KEY=$(echo "$key" | docker exec -i $DOCKER_CONTAINER wg pubkey)
 
@@ -73,18 +89,22 @@ EOF
 
 docker cp "$SERVER_CONF_PATH" $DOCKER_CONTAINER:$WG_CONFIG_FILE
 
-docker exec -i $DOCKER_CONTAINER sh -c "wg-quick down $WG_CONFIG_FILE && wg-quick up $WG_CONFIG_FILE"
+if [ "$APPLY_MODE" = "restart" ]; then
+    docker exec -i $DOCKER_CONTAINER sh -c "wg-quick down $WG_CONFIG_FILE && wg-quick up $WG_CONFIG_FILE"
+else
+    echo "$psk" | docker exec -i $DOCKER_CONTAINER wg set "$WG_INTERFACE" peer "$CLIENT_PUBLIC_KEY" preshared-key /dev/stdin allowed-ips "${ALLOWED_IPS// /}"
+fi
 
 cat << EOF > "$pwd/users/$CLIENT_NAME/$CLIENT_NAME.conf"
 [Interface]
-Address = $CLIENT_IP
+Address = $CLIENT_ADDRESS
 DNS = 1.1.1.1, 1.0.0.1
 PrivateKey = $key
 $ADDITIONAL_PARAMS
 [Peer]
 PublicKey = $SERVER_PUBLIC_KEY
 PresharedKey = $psk
-AllowedIPs = 0.0.0.0/0
+AllowedIPs = $CLIENT_ALLOWED_IPS
 Endpoint = $ENDPOINT:$LISTEN_PORT
 PersistentKeepalive = 25
 EOF
@@ -110,12 +130,4 @@ fi
 
 docker cp "$CLIENTS_TABLE_PATH" $DOCKER_CONTAINER:/opt/amnezia/awg/clientsTable
 
-traffic_file="$pwd/users/$CLIENT_NAME/traffic.json"
-echo '{
-    "total_incoming": 0,
-    "total_outgoing": 0,
-    "last_incoming": 0,
-    "last_outgoing": 0
-}' > "$traffic_file"
-
 echo "Client $CLIENT_NAME successfully added to WireGuard"
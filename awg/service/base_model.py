@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from datetime import datetime
 from typing import Optional
 
 
@@ -22,6 +23,8 @@ class UserData(BaseModel):
     end_date: Optional[str]
     is_unlimited: int
     has_used_trial: int
+    # end_date как номер дня от 1970-01-01 (см. service.epoch_day)
+    end_day: Optional[int] = None
 
 
 class Config(BaseModel):
@@ -64,9 +67,11 @@ class Payment(BaseModel):
     raw_payload: Optional[str] = None
     status: Optional[str] = "pending"  # DEFAULT 'pending'
     unique_payload: Optional[str] = None
+    telegram_payment_charge_id: Optional[str] = None
 
 
 class ActiveClient(BaseModel):
-    last_time: str
-    transfer: str
+    latest_handshake: datetime
+    rx_bytes: int
+    tx_bytes: int
     endpoint: str
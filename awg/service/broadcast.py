@@ -0,0 +1,373 @@
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+)
+from aiogram.types import InlineKeyboardMarkup
+
+if TYPE_CHECKING:
+    from service.db_user import AsyncDatabase, Database
+
+logger = logging.getLogger(__name__)
+
+# Общий лимит Telegram — около 30 сообщений в секунду; оставляем запас
+GLOBAL_RATE = 25.0
+# Не чаще одного сообщения в секунду в один чат
+PER_CHAT_INTERVAL = 1.0
+# Сколько сообщений отправляется одновременно
+WORKERS = 8
+# Попыток на сообщение при сетевых ошибках
+MAX_ATTEMPTS = 5
+# Как часто (в сообщениях) сохранять прогресс рассылки
+PROGRESS_BATCH = 20
+# Сколько дней хранить завершённые рассылки
+RETENTION_DAYS = 30
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+# Ошибки, после которых повторять отправку бессмысленно
+_PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound)
+
+
+class TokenBucket:
+    """Ограничитель скорости: rate токенов в секунду, не больше capacity подряд."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def pause(self, seconds: float) -> None:
+        """Останавливает выдачу токенов (flood wait от Telegram)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        # Создаём лениво, чтобы блокировка принадлежала работающему event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastResult:
+    __slots__ = ("job_id", "sent", "failed")
+
+    def __init__(self, job_id: int, sent: int, failed: int):
+        self.job_id = job_id
+        self.sent = sent
+        self.failed = failed
+
+
+class _Outgoing:
+    __slots__ = ("chat_id", "text", "attempts")
+
+    def __init__(self, chat_id: str, text: str, attempts: int):
+        self.chat_id = chat_id
+        self.text = text
+        self.attempts = attempts
+
+
+class BroadcastStore:
+    """Рассылки и статус каждого сообщения в SQLite (для продолжения после сбоя).
+
+    Запись идёт через писателя AsyncDatabase, чтение — через её читателей.
+    """
+
+    def __init__(self, db: "AsyncDatabase"):
+        self.db = db
+
+    async def create_job(
+        self,
+        name: str,
+        messages: Iterable[Tuple[Union[int, str], str]],
+        reply_markup: Optional[str],
+        parse_mode: Optional[str],
+        on_create: Optional[Callable[["Database"], None]] = None,
+    ) -> int:
+        """Сохраняет рассылку; повторный chat_id в одной рассылке отбрасывается.
+
+        on_create(db) выполняется в той же транзакции, что и запись рассылки.
+        """
+        return await self.db.run_write(
+            self._create_job, name, list(messages), reply_markup, parse_mode, on_create
+        )
+
+    @staticmethod
+    def _create_job(
+        db: "Database",
+        name: str,
+        messages: List[Tuple[Union[int, str], str]],
+        reply_markup: Optional[str],
+        parse_mode: Optional[str],
+        on_create: Optional[Callable[["Database"], None]],
+    ) -> int:
+        job_id = db.conn.execute(
+            "INSERT INTO broadcast_jobs (name, reply_markup, parse_mode, created_at)"
+            " VALUES (?, ?, ?, ?)",
+            (name, reply_markup, parse_mode, int(time.time())),
+        ).lastrowid
+        if job_id is None:
+            raise RuntimeError(f"Рассылка {name} не сохранена.")
+        db.conn.executemany(
+            "INSERT OR IGNORE INTO broadcast_messages (job_id, chat_id, text) VALUES (?, ?, ?)",
+            ((job_id, str(chat_id), text) for chat_id, text in messages),
+        )
+        if on_create is not None:
+            on_create(db)
+        return job_id
+
+    async def pending(self, job_id: int) -> List[_Outgoing]:
+        rows = await self.db.run_read(self._pending, job_id)
+        return [_Outgoing(*row) for row in rows]
+
+    @staticmethod
+    def _pending(db: "Database", job_id: int) -> list:
+        return db.conn.execute(
+            "SELECT chat_id, text, attempts FROM broadcast_messages"
+            " WHERE job_id = ? AND status = ?",
+            (job_id, PENDING),
+        ).fetchall()
+
+    async def save_progress(
+        self, job_id: int, results: List[Tuple[str, str, int, Optional[str]]]
+    ) -> None:
+        """results: [(chat_id, статус, попыток, ошибка), ...]"""
+        if not results:
+            return
+        await self.db.run_write(self._save_progress, job_id, results)
+
+    @staticmethod
+    def _save_progress(
+        db: "Database", job_id: int, results: List[Tuple[str, str, int, Optional[str]]]
+    ) -> None:
+        db.conn.executemany(
+            "UPDATE broadcast_messages SET status = ?, attempts = ?, error = ?"
+            " WHERE job_id = ? AND chat_id = ?",
+            (
+                (status, attempts, error, job_id, chat_id)
+                for chat_id, status, attempts, error in results
+            ),
+        )
+
+    async def finish(self, job_id: int) -> Tuple[int, int]:
+        """Отмечает рассылку завершённой; возвращает (отправлено, ошибок)."""
+        return await self.db.run_write(self._finish, job_id, int(time.time()))
+
+    @staticmethod
+    def _finish(db: "Database", job_id: int, now: int) -> Tuple[int, int]:
+        cur = db.conn
+        cur.execute("UPDATE broadcast_jobs SET finished_at = ? WHERE job_id = ?", (now, job_id))
+        counts = dict(
+            cur.execute(
+                "SELECT status, COUNT(*) FROM broadcast_messages WHERE job_id = ? GROUP BY status",
+                (job_id,),
+            ).fetchall()
+        )
+        # Старые завершённые рассылки больше не нужны
+        old = [
+            row[0]
+            for row in cur.execute(
+                "SELECT job_id FROM broadcast_jobs WHERE finished_at < ?",
+                (now - RETENTION_DAYS * 86400,),
+            )
+        ]
+        for old_job_id in old:
+            cur.execute("DELETE FROM broadcast_messages WHERE job_id = ?", (old_job_id,))
+            cur.execute("DELETE FROM broadcast_jobs WHERE job_id = ?", (old_job_id,))
+        return counts.get(SENT, 0), counts.get(FAILED, 0)
+
+    async def unfinished_jobs(self) -> List[Tuple[int, str, Optional[str], Optional[str]]]:
+        return await self.db.run_read(self._unfinished_jobs)
+
+    @staticmethod
+    def _unfinished_jobs(db: "Database") -> List[Tuple[int, str, Optional[str], Optional[str]]]:
+        return db.conn.execute(
+            "SELECT job_id, name, reply_markup, parse_mode FROM broadcast_jobs"
+            " WHERE finished_at IS NULL ORDER BY job_id"
+        ).fetchall()
+
+
+class _JobRun:
+    __slots__ = ("job_id", "reply_markup", "parse_mode", "remaining", "done", "results")
+
+    def __init__(self, job_id, reply_markup, parse_mode, remaining):
+        self.job_id = job_id
+        self.reply_markup = reply_markup
+        self.parse_mode = parse_mode
+        self.remaining = remaining
+        self.done = asyncio.Event()
+        self.results: List[Tuple[str, str, int, Optional[str]]] = []
+
+
+class Broadcaster:
+    """Рассылка сообщений с ограничением скорости.
+
+    Общий лимит — TokenBucket на GLOBAL_RATE сообщений в секунду, в один
+    чат — не чаще PER_CHAT_INTERVAL. Сообщения отправляют WORKERS
+    параллельных задач. При TelegramRetryAfter отправка приостанавливается
+    на указанное время, а сообщение возвращается в очередь; сетевые ошибки
+    повторяются до MAX_ATTEMPTS раз. Статус сообщений сохраняется в
+    BroadcastStore, так что прерванная рассылка продолжается через resume().
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        store: BroadcastStore,
+        rate: float = GLOBAL_RATE,
+        workers: int = WORKERS,
+        per_chat_interval: float = PER_CHAT_INTERVAL,
+    ):
+        self.bot = bot
+        self.store = store
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.per_chat_interval = per_chat_interval
+        # chat_id -> monotonic-время, раньше которого в чат не пишем
+        self._chat_ready: Dict[str, float] = {}
+        self._running: set = set()
+
+    async def broadcast(
+        self,
+        name: str,
+        messages: Iterable[Tuple[Union[int, str], str]],
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        parse_mode: Optional[str] = None,
+        on_create: Optional[Callable[["Database"], None]] = None,
+    ) -> BroadcastResult:
+        """Рассылает [(chat_id, текст), ...] и ждёт завершения.
+
+        on_create(db) выполняется в транзакции, сохраняющей рассылку: то,
+        что он записывает, фиксируется вместе с ней, и после сбоя
+        сообщения досылает resume(), а не повторный вызов. Если прогресс
+        не удалось сохранить и в конце рассылки, ошибка пробрасывается, а
+        рассылка остаётся незавершённой.
+        """
+        markup_json = reply_markup.model_dump_json(exclude_none=True) if reply_markup else None
+        job_id = await self.store.create_job(name, messages, markup_json, parse_mode, on_create)
+        return await self._run_job(job_id, reply_markup, parse_mode)
+
+    async def resume(self) -> None:
+        """Дорассылает рассылки, прерванные остановкой бота."""
+        for job_id, name, markup_json, parse_mode in await self.store.unfinished_jobs():
+            if job_id in self._running:
+                continue
+            markup = (
+                InlineKeyboardMarkup.model_validate_json(markup_json) if markup_json else None
+            )
+            logger.info(f"Продолжаю прерванную рассылку {name} (#{job_id})")
+            await self._run_job(job_id, markup, parse_mode)
+
+    async def _run_job(
+        self, job_id: int, reply_markup: Optional[InlineKeyboardMarkup], parse_mode: Optional[str]
+    ) -> BroadcastResult:
+        self._running.add(job_id)
+        try:
+            pending = await self.store.pending(job_id)
+            if pending:
+                run = _JobRun(job_id, reply_markup, parse_mode, len(pending))
+                queue: asyncio.Queue = asyncio.Queue()
+                for item in pending:
+                    queue.put_nowait(item)
+                workers = [
+                    asyncio.create_task(self._worker(queue, run))
+                    for _ in range(min(self.workers, len(pending)))
+                ]
+                try:
+                    await run.done.wait()
+                finally:
+                    for worker in workers:
+                        worker.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+                    await self.store.save_progress(job_id, run.results)
+            sent, failed = await self.store.finish(job_id)
+        finally:
+            self._running.discard(job_id)
+            now = time.monotonic()
+            self._chat_ready = {
+                chat_id: ready for chat_id, ready in self._chat_ready.items() if ready > now
+            }
+        return BroadcastResult(job_id, sent, failed)
+
+    async def _worker(self, queue: asyncio.Queue, run: _JobRun) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item: _Outgoing = await queue.get()
+            wait = self._chat_ready.get(item.chat_id, 0.0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self.bucket.acquire()
+            self._chat_ready[item.chat_id] = time.monotonic() + self.per_chat_interval
+            item.attempts += 1
+            try:
+                await self.bot.send_message(
+                    item.chat_id,
+                    item.text,
+                    reply_markup=run.reply_markup,
+                    parse_mode=run.parse_mode,
+                )
+            except TelegramRetryAfter as e:
+                # Попытка не засчитывается: сообщение не отправлено по нашей вине
+                item.attempts -= 1
+                logger.warning(f"Flood wait {e.retry_after} сек., сообщение в {item.chat_id} отложено")
+                self.bucket.pause(e.retry_after)
+                loop.call_later(e.retry_after, queue.put_nowait, item)
+                continue
+            except _PERMANENT_ERRORS as e:
+                logger.error(f"Ошибка отправки сообщения пользователю {item.chat_id}: {e}")
+                await self._complete(run, item, FAILED, str(e))
+                continue
+            except Exception as e:
+                if item.attempts < MAX_ATTEMPTS:
+                    logger.warning(f"Ошибка отправки в {item.chat_id} (попытка {item.attempts}): {e}")
+                    loop.call_later(2 ** item.attempts, queue.put_nowait, item)
+                else:
+                    logger.error(f"Ошибка отправки сообщения пользователю {item.chat_id}: {e}")
+                    await self._complete(run, item, FAILED, str(e))
+                continue
+            await self._complete(run, item, SENT, None)
+
+    async def _complete(
+        self, run: _JobRun, item: _Outgoing, status: str, error: Optional[str]
+    ) -> None:
+        run.results.append((item.chat_id, status, item.attempts, error))
+        try:
+            if len(run.results) >= PROGRESS_BATCH:
+                # Пока пачка пишется, другие обработчики копят следующую
+                results, run.results = run.results, []
+                try:
+                    await self.store.save_progress(run.job_id, results)
+                except asyncio.CancelledError:
+                    run.results[:0] = results
+                    raise
+                except Exception as e:
+                    # Пачка запишется со следующей или в конце рассылки;
+                    # если не выйдет и там, _run_job пробросит ошибку
+                    run.results[:0] = results
+                    logger.error(f"Ошибка сохранения прогресса рассылки #{run.job_id}: {e}")
+        finally:
+            run.remaining -= 1
+            if run.remaining == 0:
+                run.done.set()
@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from service.db_user import AsyncDatabase, Database
+
+logger = logging.getLogger(__name__)
+
+# Как часто (сек.) обновлять last_seen текущего подключения в базе
+LAST_SEEN_RESOLUTION = 300
+# Сколько дней хранить историю подключений
+RETENTION_DAYS = 90
+
+
+class ConnectionEvent:
+    __slots__ = ("client_name", "ip", "endpoint", "first_seen", "last_seen")
+
+    def __init__(self, client_name: str, ip: str, endpoint: str, first_seen: int, last_seen: int):
+        self.client_name = client_name
+        self.ip = ip
+        self.endpoint = endpoint
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+
+
+class ConnectionLog:
+    """История подключений клиентов (смена IP endpoint'а) в SQLite.
+
+    Новая строка добавляется только когда у клиента меняется IP; пока
+    адрес тот же, у текущей строки раз в LAST_SEEN_RESOLUTION секунд
+    обновляется last_seen. Текущий адрес каждого клиента держится в
+    памяти, так что повторные наблюдения без изменений не трогают базу.
+    Кэш читается и меняется в потоке писателя AsyncDatabase.
+    """
+
+    def __init__(self, db: "AsyncDatabase"):
+        self.db = db
+        # client_name -> [id строки, ip, last_seen в базе]; None — перечитать из базы
+        self._current: Optional[Dict[str, list]] = None
+
+    @staticmethod
+    def _read_current(conn: sqlite3.Connection) -> Dict[str, list]:
+        rows = conn.execute(
+            """
+            SELECT id, client_name, ip, last_seen FROM connection_events
+            WHERE id IN (SELECT MAX(id) FROM connection_events GROUP BY client_name)
+            """
+        ).fetchall()
+        return {
+            client_name: [event_id, ip, last_seen]
+            for event_id, client_name, ip, last_seen in rows
+        }
+
+    @staticmethod
+    def _changes(
+        current: Dict[str, list], observations: Iterable[Tuple[str, str, int]]
+    ) -> Tuple[list, list]:
+        """Новые подключения и обновления last_seen относительно кэша."""
+        inserts = []
+        touches = []
+        for client_name, endpoint, seen_at in observations:
+            if not endpoint:
+                continue
+            ip = endpoint.rsplit(":", 1)[0].strip("[]")
+            known = current.get(client_name)
+            if known is not None and known[1] == ip:
+                if seen_at - known[2] >= LAST_SEEN_RESOLUTION:
+                    touches.append((client_name, seen_at))
+                continue
+            inserts.append((client_name, ip, endpoint, seen_at))
+        return inserts, touches
+
+    async def record(self, observations: Iterable[Tuple[str, str, int]]) -> None:
+        """Сохраняет наблюдения (имя клиента, endpoint, epoch) одной транзакцией."""
+        observations = list(observations)
+        current = self._current
+        if current is not None and not any(self._changes(current, observations)):
+            return
+        try:
+            await self.db.run_write(self._record, observations)
+        except BaseException:
+            # Кэш мог разойтись с базой — перечитываем при следующей записи
+            self._current = None
+            raise
+
+    def _record(self, db: "Database", observations: List[Tuple[str, str, int]]) -> None:
+        if self._current is None:
+            self._current = self._read_current(db.conn)
+        current = self._current
+        inserts, touches = self._changes(current, observations)
+        for client_name, seen_at in touches:
+            known = current[client_name]
+            db.conn.execute(
+                "UPDATE connection_events SET last_seen = ? WHERE id = ?",
+                (seen_at, known[0]),
+            )
+            known[2] = seen_at
+        for client_name, ip, endpoint, seen_at in inserts:
+            cursor = db.conn.execute(
+                "INSERT INTO connection_events"
+                " (client_name, ip, endpoint, first_seen, last_seen)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (client_name, ip, endpoint, seen_at, seen_at),
+            )
+            current[client_name] = [cursor.lastrowid, ip, seen_at]
+
+    async def recent(self, client_name: str, limit: int = 5) -> List[ConnectionEvent]:
+        """Последние подключения клиента, новые первыми."""
+        rows = await self.db.run_read(self._recent, client_name, limit)
+        return [ConnectionEvent(*row) for row in rows]
+
+    @staticmethod
+    def _recent(db: "Database", client_name: str, limit: int) -> list:
+        return db.conn.execute(
+            "SELECT client_name, ip, endpoint, first_seen, last_seen FROM connection_events"
+            " WHERE client_name = ? ORDER BY last_seen DESC LIMIT ?",
+            (client_name, limit),
+        ).fetchall()
+
+    async def prune(self, retention_days: int = RETENTION_DAYS) -> int:
+        """Удаляет события старше retention_days; текущие подключения не трогаются."""
+        cutoff = int(time.time()) - retention_days * 86400
+        deleted = await self.db.run_write(self._prune, cutoff)
+        if deleted:
+            logger.info(f"Удалено старых записей о подключениях: {deleted}")
+        return deleted
+
+    @staticmethod
+    def _prune(db: "Database", cutoff: int) -> int:
+        return db.conn.execute(
+            "DELETE FROM connection_events WHERE last_seen < ? AND id NOT IN"
+            " (SELECT MAX(id) FROM connection_events GROUP BY client_name)",
+            (cutoff,),
+        ).rowcount
+
+    async def import_legacy(self, directory: str) -> None:
+        """Переносит files/connections/<имя>_ip.json в таблицу и удаляет файлы."""
+        if not os.path.isdir(directory):
+            return
+        for file_name in os.listdir(directory):
+            if not file_name.endswith("_ip.json"):
+                continue
+            client_name = file_name[: -len("_ip.json")]
+            file_path = os.path.join(directory, file_name)
+            try:
+                with open(file_path, "r") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                logger.warning(f"Не удалось прочитать {file_path}")
+                continue
+            events = []
+            for ip, timestamp in data.items():
+                try:
+                    seen_at = int(datetime.strptime(timestamp, "%d.%m.%Y %H:%M").timestamp())
+                except (TypeError, ValueError):
+                    continue
+                events.append((client_name, ip, ip, seen_at, seen_at))
+            events.sort(key=lambda event: event[3])
+            await self.db.run_write(self._insert_events, events)
+            os.remove(file_path)
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
+        self._current = None
+
+    @staticmethod
+    def _insert_events(db: "Database", events: List[tuple]) -> None:
+        db.conn.executemany(
+            "INSERT INTO connection_events"
+            " (client_name, ip, endpoint, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)",
+            events,
+        )
+
+
+def format_seen(epoch: Optional[int]) -> str:
+    if not epoch:
+        return "—"
+    return datetime.fromtimestamp(epoch).strftime("%d.%m.%Y %H:%M")
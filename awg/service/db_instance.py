@@ -1,3 +1,3 @@
 from service import db_user
 
-user_db = db_user.Database()
+user_db = db_user.AsyncDatabase()
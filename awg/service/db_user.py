@@ -1,14 +1,140 @@
+import asyncio
+import functools
+import itertools
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import sqlite3
-from typing import List, Literal, Optional, Union
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional, Tuple, TypeVar, Union
 from dateutil.relativedelta import relativedelta
 
 from settings import DB_FILE
 from service.base_model import Payment, UserData, Config
+from service.epoch_day import from_epoch_day, to_epoch_day, today_epoch_day
+from service.migrations import migrate
+from service.reminders import next_reminder
+from service.user_cache import MISSING, UserCache
+from service.write_queue import WriteQueue
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Количество соединений-читателей AsyncDatabase
+READER_POOL_SIZE = 4
+# Сколько ждать снятия блокировки записи, мс
+BUSY_TIMEOUT_MS = 5000
+
+# WAL: читатели не блокируют писателя и наоборот. synchronous=NORMAL в
+# режиме WAL не теряет целостность, но не делает fsync на каждый коммит.
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=67108864",
+)
+
+# Сколько строк забирать из курсора за раз в потоковых запросах
+FETCH_BATCH_SIZE = 500
+# Сколько результатов обработки платежей помнить для повторных доставок
+PAYMENT_OUTCOME_CACHE_SIZE = 1000
+
+USER_FIELDS = (
+    "user_id", "telegram_id", "name", "end_date", "is_unlimited", "has_used_trial", "end_day",
+)
+CONFIG_FIELDS = (
+    "config_id", "user_id",
+    "private_key", "address", "dns",
+    "jc", "jmin", "jmax",
+    "s1", "s2",
+    "h1", "h2", "h3", "h4",
+    "public_key", "preshared_key",
+    "allowed_ips", "endpoint", "persistent_keepalive",
+    "deactivate_presharekey",
+)
+PAYMENT_FIELDS = (
+    "payment_id", "user_id", "amount", "months", "provider_payment_id",
+    "payment_time", "raw_payload", "status", "unique_payload",
+    "telegram_payment_charge_id",
+)
+USER_COLUMNS = ", ".join(USER_FIELDS)
+CONFIG_COLUMNS = ", ".join(f"c.{field}" for field in CONFIG_FIELDS)
+PAYMENT_COLUMNS = ", ".join(PAYMENT_FIELDS)
+
+
+def _model_row_factory(model, fields):
+    """row_factory, собирающая модель без валидации.
+
+    Строки из своей базы доверенные: типы гарантирует схема, поэтому
+    вместо конструктора pydantic используется model_construct.
+    """
+    construct = model.model_construct
+
+    def factory(cursor, row):
+        return construct(**dict(zip(fields, row)))
+
+    return factory
+
+
+class UserVpnState:
+    """Пользователь, состояние подписки и ключи его конфигурации."""
+
+    __slots__ = ("user_id", "telegram_id", "state", "preshared_key", "deactivate_presharekey")
+
+    def __init__(self, user_id, telegram_id, state, preshared_key, deactivate_presharekey):
+        self.user_id = user_id
+        self.telegram_id = telegram_id
+        self.state = state
+        self.preshared_key = preshared_key
+        self.deactivate_presharekey = deactivate_presharekey
+
+
+class DueReminder:
+    """Пользователь, которому пора напомнить об окончании подписки."""
+
+    __slots__ = ("user", "due_day", "days_before")
+
+    def __init__(self, user: UserData, due_day: int, days_before: int):
+        self.user = user
+        self.due_day = due_day
+        self.days_before = days_before
+
+
+class PaymentOutcome:
+    """Результат apply_payment: запись платежа и дата окончания подписки.
+
+    duplicate = True — платёж с этим telegram_payment_charge_id уже был проведён,
+    подписка повторно не продлевалась.
+    """
+
+    __slots__ = ("payment", "end_date", "duplicate")
+
+    def __init__(self, payment: Payment, end_date: Optional[str], duplicate: bool):
+        self.payment = payment
+        self.end_date = end_date
+        self.duplicate = duplicate
+
+
+STATE_ACTIVE = "active"
+STATE_EXPIRED = "expired"
+
+_user_row = _model_row_factory(UserData, USER_FIELDS)
+_config_row = _model_row_factory(Config, CONFIG_FIELDS)
+_payment_row = _model_row_factory(Payment, PAYMENT_FIELDS)
+
+
+def _vpn_state_row(cursor, row):
+    return UserVpnState(*row)
+
+
+def _due_reminder_row(cursor, row):
+    return DueReminder(_user_row(cursor, row[:-2]), row[-2], row[-1])
+
 
 # =====================================================================
 # Интегрированный класс Database для управления пользователями и конфигурациями VPN
@@ -16,124 +142,133 @@ logger = logging.getLogger(__name__)
 
 
 class Database:
-    def __init__(self, db_path=DB_FILE):
+    def __init__(self, db_path=DB_FILE, read_only: bool = False):
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        for pragma in _PRAGMAS:
+            self.conn.execute(pragma)
+        if read_only:
+            self.conn.execute("PRAGMA query_only=ON")
         self.cursor = self.conn.cursor()
-        self.create_tables()
+        # True, пока операции выполняются внутри transaction()
+        self._in_transaction = False
+        if not read_only:
+            self.create_tables()
 
     def create_tables(self):
-        """Создает таблицы для пользователей и конфигураций VPN, если они отсутствуют."""
-        self.cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                telegram_id TEXT UNIQUE,
-                name TEXT,
-                end_date TEXT,
-                is_unlimited INTEGER DEFAULT 0,
-                has_used_trial INTEGER DEFAULT 0
-            )
+        """Создаёт таблицы и применяет недостающие миграции схемы."""
+        migrate(self.conn)
+
+    def _commit(self):
+        """commit, если операция не выполняется внутри transaction()."""
+        if not self._in_transaction:
+            self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT, при исключении — ROLLBACK.
+
+        Вложенный вызов выполняется в уже открытой транзакции; _commit()
+        внутри неё ничего не делает.
         """
-        )
-        self.cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS configs (
-                config_id INTEGER PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                
-                -- Интерфейс
-                private_key TEXT NOT NULL,
-                address TEXT NOT NULL,
-                dns TEXT,
-
-                jc INTEGER,
-                jmin INTEGER,
-                jmax INTEGER,
-                s1 INTEGER,
-                s2 INTEGER,
-                h1 INTEGER,
-                h2 INTEGER,
-                h3 INTEGER,
-                h4 INTEGER,
-
-                -- Параметры peer'а
-                public_key TEXT NOT NULL,
-                preshared_key TEXT,
-                allowed_ips TEXT,
-                endpoint TEXT,
-                persistent_keepalive INTEGER,
-
-                -- deactivate_presharekey
-
-                deactivate_presharekey TEXT,
-
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
+        if self._in_transaction:
+            yield self.conn
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        self._in_transaction = True
+        try:
+            yield self.conn
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        finally:
+            self._in_transaction = False
+
+    def run_in_transaction(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """fn(self, *args, **kwargs) одной транзакцией (см. AsyncDatabase.run_write)."""
+        with self.transaction():
+            return fn(self, *args, **kwargs)
+
+    def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """fn(self, *args, **kwargs) (см. AsyncDatabase.run_read)."""
+        return fn(self, *args, **kwargs)
+
+    def run_batch(self, calls: List[Tuple[str, tuple, dict]]) -> List[Tuple[bool, Any]]:
+        """Выполняет операции одной транзакцией с одним commit (group commit).
+
+        Каждая операция — в своём SAVEPOINT: ошибка одной откатывает только
+        её. Возвращает [(успех, результат или исключение), ...] в порядке calls.
         """
-        )
-        self.cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS payments (
-                payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                amount INTEGER,
-                months INTEGER,
-                provider_payment_id TEXT,
-                payment_time TEXT DEFAULT CURRENT_TIMESTAMP,
-                raw_payload TEXT,
-                status TEXT DEFAULT 'pending',
-                unique_payload TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-"""
-        )
-        self.conn.commit()
+        results: List[Tuple[bool, Any]] = []
+        with self.transaction():
+            for name, args, kwargs in calls:
+                self.conn.execute("SAVEPOINT batch_op")
+                try:
+                    result = getattr(self, name)(*args, **kwargs)
+                except Exception as e:
+                    self.conn.execute("ROLLBACK TO batch_op")
+                    results.append((False, e))
+                else:
+                    results.append((True, result))
+                self.conn.execute("RELEASE batch_op")
+        return results
+
+    def _fetch_one(self, row_factory, query: str, params=()):
+        cursor = self.conn.cursor()
+        cursor.row_factory = row_factory
+        try:
+            return cursor.execute(query, params).fetchone()
+        finally:
+            cursor.close()
+
+    def _iterate(self, row_factory, query: str, params=(), batch_size: int = FETCH_BATCH_SIZE):
+        """Потоково отдаёт строки запроса, не загружая весь результат в память."""
+        cursor = self.conn.cursor()
+        cursor.row_factory = row_factory
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
 
     def get_user_by_telegram_id(
         self, telegram_id: str
     ) -> Union[UserData, Literal[False]]:
         """Возвращает пользователя по telegram_id или False, если не найден."""
-        self.cursor.execute(
-            """
-            SELECT user_id, telegram_id, name, end_date, is_unlimited, has_used_trial
-            FROM users
-            WHERE telegram_id = ?
-            """,
+        user = self._fetch_one(
+            _user_row,
+            f"SELECT {USER_COLUMNS} FROM users WHERE telegram_id = ?",
             (telegram_id,),
         )
-        row = self.cursor.fetchone()
-        if not row:
-            return False
-        return UserData(
-            user_id=row[0],
-            telegram_id=row[1],
-            name=row[2],
-            end_date=row[3],
-            is_unlimited=row[4],
-            has_used_trial=row[5],
-        )
+        return user or False
 
     def get_user_by_user_id(self, user_id: int) -> Union[UserData, Literal[False]]:
         """Возвращает пользователя по user_id или False, если не найден."""
-        self.cursor.execute(
-            """
-            SELECT user_id, telegram_id, name, end_date, is_unlimited, has_used_trial
-            FROM users
-            WHERE user_id = ?
-            """,
+        user = self._fetch_one(
+            _user_row,
+            f"SELECT {USER_COLUMNS} FROM users WHERE user_id = ?",
             (user_id,),
         )
-        row = self.cursor.fetchone()
-        if not row:
-            return False
-        return UserData(
-            user_id=row[0],
-            telegram_id=row[1],
-            name=row[2],
-            end_date=row[3],
-            is_unlimited=row[4],
-            has_used_trial=row[5],
-        )
+        return user or False
+
+    def get_users_by_telegram_ids(self, telegram_ids: List[str]) -> Dict[str, UserData]:
+        """Пользователи по списку telegram_id одним запросом (пачками по FETCH_BATCH_SIZE)."""
+        ids = list(dict.fromkeys(str(telegram_id) for telegram_id in telegram_ids))
+        users: Dict[str, UserData] = {}
+        for start in range(0, len(ids), FETCH_BATCH_SIZE):
+            chunk = ids[start:start + FETCH_BATCH_SIZE]
+            for user in self._iterate(
+                _user_row,
+                f"SELECT {USER_COLUMNS} FROM users"
+                f" WHERE telegram_id IN ({','.join('?' for _ in chunk)})",
+                chunk,
+            ):
+                users[user.telegram_id] = user
+        return users
 
     def add_user(self, telegram_id: str, name: str) -> None:
         """Добавляет нового пользователя, если он ещё не существует."""
@@ -145,7 +280,7 @@ class Database:
                 """,
                 (telegram_id, name),
             )
-            self.conn.commit()
+            self._commit()
 
     def has_active_subscription(self, telegram_id):
         """Проверяем подписку пользователя
@@ -153,102 +288,131 @@ class Database:
         end_date = [дата] и is_unlimited = 0 → обычная подписка
         is_unlimited = 1 → подписка безлимитная (дата не имеет значения)"""
         self.cursor.execute(
-            "SELECT end_date, is_unlimited FROM users WHERE telegram_id = ?",
+            "SELECT end_day, is_unlimited FROM users WHERE telegram_id = ?",
             (telegram_id,),
         )
         row = self.cursor.fetchone()
         if not row:
             return False
-        end_date, is_unlimited = row
+        end_day, is_unlimited = row
         if is_unlimited:
             return True
-        if end_date:
-            return datetime.strptime(end_date, "%Y-%m-%d") > datetime.now()
+        if end_day is not None:
+            # Подписка действует до конца дня end_date, но не включая его
+            return end_day > today_epoch_day()
         return False
 
+    def iter_users_expired_yesterday(self) -> Iterator[UserData]:
+        """Потоковый вариант get_users_expired_yesterday."""
+        return self._iterate(
+            _user_row,
+            f"""
+            SELECT {USER_COLUMNS}
+            FROM users
+            WHERE end_day <= ?
+            AND is_unlimited != 1
+            """,
+            (today_epoch_day() - 1,),
+        )
+
     def get_users_expired_yesterday(self) -> List[UserData]:
         """Возвращает список пользователей, у которых подписка закончилась вчера,
         is_unlimited != 1 и end_date не NULL.
         """
-        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        return list(self.iter_users_expired_yesterday())
 
-        self.cursor.execute(
-            """
-            SELECT user_id, telegram_id, name, end_date, is_unlimited, has_used_trial
+    def iter_users_expiring_between(self, first_day: int, last_day: int) -> Iterator[UserData]:
+        """Пользователи без безлимита, у которых end_day в [first_day, last_day].
+
+        Дни — номера дней от 1970-01-01 (см. service.epoch_day).
+        """
+        return self._iterate(
+            _user_row,
+            f"""
+            SELECT {USER_COLUMNS}
             FROM users
-            WHERE is_unlimited != 1
-            AND end_date IS NOT NULL
-            AND end_date <= ?
+            WHERE end_day BETWEEN ? AND ?
+            AND is_unlimited != 1
             """,
-            (yesterday,),
+            (first_day, last_day),
         )
-        logger.info(f"yesterday: {yesterday}")
-        return [
-            UserData(
-                user_id=row[0],
-                telegram_id=row[1],
-                name=row[2],
-                end_date=row[3],
-                is_unlimited=row[4],
-                has_used_trial=row[5],
-            )
-            for row in self.cursor.fetchall()
-        ]
 
-    def get_active_users(self) -> List[UserData]:
-        """Возвращает список пользователей с is_unlimited = 1 или у кого end_date сегодня или в будущем."""
-        today = datetime.now().strftime("%Y-%m-%d")
+    def iter_users_expired_since(self, since_day: int) -> Iterator[UserData]:
+        """Пользователи, чья подписка закончилась не раньше since_day (и не позже вчера)."""
+        return self.iter_users_expiring_between(since_day, today_epoch_day() - 1)
 
-        self.cursor.execute(
-            """
-            SELECT user_id, telegram_id, name, end_date, is_unlimited, has_used_trial
+    def iter_active_users(self) -> Iterator[UserData]:
+        """Потоковый вариант get_active_users."""
+        return self._iterate(
+            _user_row,
+            f"""
+            SELECT {USER_COLUMNS}
             FROM users
             WHERE is_unlimited = 1
-            OR (end_date IS NOT NULL AND end_date >= ?)
+            OR end_day >= ?
             """,
-            (today,),
+            (today_epoch_day(),),
         )
 
-        rows = self.cursor.fetchall()
-        return [
-            UserData(
-                user_id=row[0],
-                telegram_id=row[1],
-                name=row[2],
-                end_date=row[3],
-                is_unlimited=row[4],
-                has_used_trial=row[5],
-            )
-            for row in rows
-        ]
+    def get_active_users(self) -> List[UserData]:
+        """Возвращает список пользователей с is_unlimited = 1 или у кого end_day сегодня или в будущем."""
+        return list(self.iter_active_users())
+
+    def iter_users_expiring_in_days(self, days: List[int]) -> Iterator[UserData]:
+        """Потоковый вариант get_users_expiring_in_days."""
+        today = today_epoch_day()
+        target_days = [today + day for day in days]
+        return self._iterate(
+            _user_row,
+            f"""
+            SELECT {USER_COLUMNS}
+            FROM users
+            WHERE end_day IN ({','.join('?' for _ in target_days)})
+            AND is_unlimited != 1
+            """,
+            target_days,
+        )
 
     def get_users_expiring_in_days(self, days: List[int]) -> List[UserData]:
         """Возвращает список пользователей, у которых подписка заканчивается через указанные дни."""
-        target_dates = [
-            (datetime.now() + timedelta(days=day)).strftime("%Y-%m-%d") for day in days
-        ]
+        return list(self.iter_users_expiring_in_days(days))
 
-        query = f"""
-            SELECT user_id, telegram_id, name, end_date, is_unlimited, has_used_trial
-            FROM users
-            WHERE is_unlimited != 1
-            AND end_date IS NOT NULL
-            AND end_date IN ({','.join('?' for _ in target_dates)})
-        """
+    def iter_users_with_configs(
+        self, state: Optional[str] = None
+    ) -> Iterator[UserVpnState]:
+        """Пользователи с конфигурацией и состоянием подписки одним запросом.
 
-        self.cursor.execute(query, target_dates)
+        state: STATE_ACTIVE — безлимитные и с end_day не раньше сегодня,
+        STATE_EXPIRED — подписка закончилась вчера или раньше, None — обе группы.
+        Пользователи без конфигурации не возвращаются; если конфигураций
+        несколько, берётся первая, как в get_config_by_telegram_id.
+        """
+        today = today_epoch_day()
+        active = "(u.is_unlimited = 1 OR u.end_day >= :today)"
+        expired = "(u.is_unlimited != 1 AND u.end_day <= :yesterday)"
+        if state == STATE_ACTIVE:
+            condition = active
+        elif state == STATE_EXPIRED:
+            condition = expired
+        elif state is None:
+            condition = f"({active} OR {expired})"
+        else:
+            raise ValueError(f"Неизвестное состояние подписки: {state}")
 
-        return [
-            UserData(
-                user_id=row[0],
-                telegram_id=row[1],
-                name=row[2],
-                end_date=row[3],
-                is_unlimited=row[4],
-                has_used_trial=row[5],
+        return self._iterate(
+            _vpn_state_row,
+            f"""
+            SELECT u.user_id, u.telegram_id,
+                CASE WHEN {active} THEN '{STATE_ACTIVE}' ELSE '{STATE_EXPIRED}' END,
+                c.preshared_key, c.deactivate_presharekey
+            FROM users u
+            JOIN configs c ON c.config_id = (
+                SELECT MIN(config_id) FROM configs WHERE user_id = u.user_id
             )
-            for row in self.cursor.fetchall()
-        ]
+            WHERE {condition}
+            """,
+            {"today": today, "yesterday": today - 1},
+        )
 
     def add_config(
         self,
@@ -311,52 +475,24 @@ class Database:
                 deactivate_presharekey,
             ),
         )
-        self.conn.commit()
-        return self.cursor.lastrowid  # ID новой конфигурации
+        config_id = self.cursor.lastrowid  # ID новой конфигурации
+        if config_id is None:
+            raise RuntimeError(f"Конфигурация пользователя {telegram_id} не сохранена.")
+        self._commit()
+        return config_id
 
     def get_config_by_telegram_id(self, telegram_id: str) -> Optional[Config]:
         """Возвращает полную конфигурацию пользователя по telegram_id."""
-        self.cursor.execute(
-            """
-            SELECT c.config_id, c.user_id,
-                c.private_key, c.address, c.dns,
-                c.jc, c.jmin, c.jmax,
-                c.s1, c.s2,
-                c.h1, c.h2, c.h3, c.h4,
-                c.public_key, c.preshared_key,
-                c.allowed_ips, c.endpoint, c.persistent_keepalive,
-                c.deactivate_presharekey
+        return self._fetch_one(
+            _config_row,
+            f"""
+            SELECT {CONFIG_COLUMNS}
             FROM configs c
             JOIN users u ON c.user_id = u.user_id
             WHERE u.telegram_id = ?
             """,
             (telegram_id,),
         )
-        row = self.cursor.fetchone()
-        if row:
-            return Config(
-                config_id=row[0],
-                user_id=row[1],
-                private_key=row[2],
-                address=row[3],
-                dns=row[4],
-                jc=row[5],
-                jmin=row[6],
-                jmax=row[7],
-                s1=row[8],
-                s2=row[9],
-                h1=row[10],
-                h2=row[11],
-                h3=row[12],
-                h4=row[13],
-                public_key=row[14],
-                preshared_key=row[15],
-                allowed_ips=row[16],
-                endpoint=row[17],
-                persistent_keepalive=row[18],
-                deactivate_presharekey=row[19],
-            )
-        return None
 
     def update_user_end_date(
         self, telegram_id: str, months_to_add: int
@@ -367,37 +503,121 @@ class Database:
         if not user:
             raise ValueError(f"Пользователь с telegram_id {telegram_id} не найден.")
 
+        self._extend_end_date(user.user_id, months_to_add)
+        self._commit()
+        return user
+
+    def _extend_end_date(self, user_id: int, months_to_add: int) -> str:
+        """UPDATE даты окончания без commit; возвращает новую дату."""
         # Получаем текущую дату окончания
         self.cursor.execute(
-            "SELECT end_date FROM users WHERE user_id = ?", (user.user_id,)
+            "SELECT end_day FROM users WHERE user_id = ?", (user_id,)
         )
         result = self.cursor.fetchone()
 
-        if result and result[0]:
-            current_end_date = datetime.strptime(result[0], "%Y-%m-%d")
+        today = datetime.now().date()
+        new_subscription = False
+        if result and result[0] is not None:
+            current_end_date = from_epoch_day(result[0])
             # Если дата окончания в прошлом — берем сегодняшнюю дату
-            if current_end_date < datetime.now():
-                current_end_date = datetime.now()
+            if current_end_date <= today:
+                current_end_date = today
+                new_subscription = True
         else:
             # Если даты нет, начинаем с сегодняшнего дня
-            current_end_date = datetime.now()
+            current_end_date = today
+            new_subscription = True
 
         # Прибавляем месяцы
         new_end_date = current_end_date + relativedelta(months=months_to_add)
         new_end_date_str = new_end_date.strftime("%Y-%m-%d")
 
-        # Обновляем дату окончания
+        # Обновляем дату окончания (текст и номер дня); при новой подписке — и дату её начала
+        if new_subscription:
+            self.cursor.execute(
+                "UPDATE users SET end_date = ?, end_day = ?, subscription_start = ?"
+                " WHERE user_id = ?",
+                (
+                    new_end_date_str,
+                    to_epoch_day(new_end_date),
+                    today.strftime("%Y-%m-%d"),
+                    user_id,
+                ),
+            )
+        else:
+            self.cursor.execute(
+                "UPDATE users SET end_date = ?, end_day = ? WHERE user_id = ?",
+                (new_end_date_str, to_epoch_day(new_end_date), user_id),
+            )
+        self._schedule_reminder(user_id, to_epoch_day(new_end_date), today_epoch_day() - 1)
+        return new_end_date_str
+
+    def _schedule_reminder(self, user_id: int, end_day: Optional[int], after_day: int) -> None:
+        """Записывает в notifications ближайшее напоминание позже after_day (без commit)."""
+        reminder = next_reminder(end_day, after_day)
+        if reminder is None:
+            self.cursor.execute("DELETE FROM notifications WHERE user_id = ?", (user_id,))
+        else:
+            self.cursor.execute(
+                "INSERT OR REPLACE INTO notifications (user_id, due_day, days_before)"
+                " VALUES (?, ?, ?)",
+                (user_id, *reminder),
+            )
+
+    def iter_due_reminders(self, today: Optional[int] = None) -> Iterator[DueReminder]:
+        """Напоминания с днём отправки не позже today (по умолчанию — сегодня).
+
+        Просроченные из-за простоя бота тоже попадают сюда: каждому
+        пользователю отправляется одно, самое позднее, напоминание.
+        """
+        today = today_epoch_day() if today is None else today
+        return self._iterate(
+            _due_reminder_row,
+            f"""
+            SELECT {", ".join(f"u.{field}" for field in USER_FIELDS)}, n.due_day, n.days_before
+            FROM notifications n
+            JOIN users u ON u.user_id = n.user_id
+            WHERE n.due_day <= ?
+            AND u.is_unlimited != 1
+            AND u.end_day >= ?
+            """,
+            (today, today),
+        )
+
+    def complete_reminders(self, sent: List[Tuple[int, int]], today: Optional[int] = None) -> None:
+        """Переносит отправленные напоминания [(user_id, due_day), ...] на следующие.
+
+        Если за это время подписку продлили (due_day в таблице уже другой),
+        новое расписание не трогается. Просроченные и безлимитные — удаляются.
+        """
+        today = today_epoch_day() if today is None else today
+        for user_id, due_day in sent:
+            row = self.cursor.execute(
+                """
+                SELECT u.end_day, u.is_unlimited FROM notifications n
+                JOIN users u ON u.user_id = n.user_id
+                WHERE n.user_id = ? AND n.due_day = ?
+                """,
+                (user_id, due_day),
+            ).fetchone()
+            if row is None:
+                continue
+            end_day, is_unlimited = row
+            self._schedule_reminder(user_id, None if is_unlimited else end_day, today)
         self.cursor.execute(
-            "UPDATE users SET end_date = ? WHERE user_id = ?",
-            (new_end_date_str, user.user_id),
+            """
+            DELETE FROM notifications WHERE due_day <= ? AND user_id IN (
+                SELECT user_id FROM users WHERE is_unlimited = 1 OR end_day IS NULL OR end_day < ?
+            )
+            """,
+            (today, today),
         )
-        self.conn.commit()
-        return user
+        self._commit()
 
     def delete_configs_by_user_id(self, user_id):
         """Удаляет все VPN-конфигурации, связанные с пользователем по его ID."""
         self.cursor.execute("DELETE FROM configs WHERE user_id = ?", (user_id,))
-        self.conn.commit()
+        self._commit()
 
     def add_payment(
         self,
@@ -426,7 +646,7 @@ class Database:
                 status,
             ),
         )
-        self.conn.commit()
+        self._commit()
         return self.cursor.lastrowid
 
     def update_payment_status(
@@ -444,40 +664,71 @@ class Database:
             """,
             (unique_payload, new_status, raw_payload),
         )
-        self.conn.commit()
+        updated = self.cursor.rowcount
+        self._commit()
 
-        if self.cursor.rowcount == 0:
+        if updated == 0:
             return None
 
         # Получаем обновлённый платёж
-        self.cursor.execute(
-            """
-            SELECT payment_id, user_id, amount, months, provider_payment_id,
-                payment_time, raw_payload, status, unique_payload
-            FROM payments
-            WHERE raw_payload = ?
-            """,
+        return self._fetch_one(
+            _payment_row,
+            f"SELECT {PAYMENT_COLUMNS} FROM payments WHERE raw_payload = ?",
             (raw_payload,),
         )
-        row = self.cursor.fetchone()
-        if row:
-            return Payment(
-                payment_id=row[0],
-                user_id=row[1],
-                amount=row[2],
-                months=row[3],
-                provider_payment_id=row[4],
-                payment_time=row[5],
-                raw_payload=row[6],
-                status=row[7],
-                unique_payload=row[8],
+
+    def apply_payment(
+        self,
+        telegram_id: str,
+        telegram_payment_charge_id: str,
+        raw_payload: str,
+        months: int,
+        amount: int,
+        provider_payment_id: Optional[str] = None,
+    ) -> PaymentOutcome:
+        """Проводит успешный платёж и продлевает подписку одной транзакцией.
+
+        Запись платежа вставляется через INSERT OR IGNORE по уникальному
+        telegram_payment_charge_id (provider_payment_id у Stars пустой и
+        сохраняется просто как столбец): повторная или параллельная доставка
+        того же платежа ничего не меняет и возвращает исходную запись с
+        duplicate=True.
+        """
+        with self.transaction():
+            user = self.get_user_by_telegram_id(telegram_id)
+            if not user:
+                raise ValueError(f"Пользователь с telegram_id {telegram_id} не найден.")
+            self.cursor.execute(
+                """
+                INSERT OR IGNORE INTO payments (
+                    user_id, amount, months, provider_payment_id, raw_payload,
+                    telegram_payment_charge_id, status
+                ) VALUES (?, ?, ?, ?, ?, ?, 'success')
+                """,
+                (
+                    user.user_id,
+                    amount,
+                    months,
+                    provider_payment_id,
+                    raw_payload,
+                    telegram_payment_charge_id,
+                ),
             )
-        return None
+            duplicate = self.cursor.rowcount == 0
+            if duplicate:
+                end_date = user.end_date
+            else:
+                end_date = self._extend_end_date(user.user_id, months)
+            payment = self._fetch_one(
+                _payment_row,
+                f"SELECT {PAYMENT_COLUMNS} FROM payments WHERE telegram_payment_charge_id = ?",
+                (telegram_payment_charge_id,),
+            )
+        return PaymentOutcome(payment, end_date, duplicate)
 
     def count_active_users(self) -> int:
         """Считает количество активных пользователей с учётом ограничений."""
-        today = datetime.now().date()
-        month_ago = today - timedelta(days=30)
+        month_ago = datetime.now().date() - timedelta(days=30)
 
         self.cursor.execute(
             """
@@ -485,13 +736,12 @@ class Database:
             WHERE
                 is_unlimited = 1
                 OR (
-                    end_date IS NOT NULL
-                    AND date(end_date) >= ?
+                    end_day >= ?
                     AND subscription_start IS NOT NULL
-                    AND date(subscription_start) >= ?
+                    AND subscription_start >= ?
                 )
             """,
-            (today.strftime("%Y-%m-%d"), month_ago.strftime("%Y-%m-%d")),
+            (today_epoch_day(), month_ago.strftime("%Y-%m-%d")),
         )
         return self.cursor.fetchone()[0]
     
@@ -499,7 +749,7 @@ class Database:
         """Проверяет, является ли пользователь активным или недавно активным (до 30 дней назад)."""
         self.cursor.execute(
             """
-            SELECT end_date, is_unlimited
+            SELECT end_day, is_unlimited
             FROM users
             WHERE telegram_id = ?
             """,
@@ -510,21 +760,332 @@ class Database:
         if not row:
             return False  # пользователь не найден
 
-        end_date_str, is_unlimited = row
+        end_day, is_unlimited = row
 
         if is_unlimited:
             return True
 
-        if end_date_str:
-            try:
-                end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
-                month_ago = datetime.now().date() - timedelta(days=30)
-                return end_date >= month_ago
-            except ValueError:
-                return False  # некорректная дата
+        if end_day is not None:
+            return end_day >= today_epoch_day() - 30
 
         return False
 
     def close(self):
         """Закрывает соединение с базой данных."""
         self.conn.close()
+
+
+# =====================================================================
+# Асинхронная обёртка над Database
+# =====================================================================
+
+
+def _reader(name: str):
+    method = getattr(Database, name)
+
+    @functools.wraps(method)
+    async def wrapper(self: "AsyncDatabase", *args, **kwargs):
+        return await self._read(name, *args, **kwargs)
+
+    return wrapper
+
+
+def _writer(name: str):
+    method = getattr(Database, name)
+
+    @functools.wraps(method)
+    async def wrapper(self: "AsyncDatabase", *args, **kwargs):
+        return await self._write(name, *args, **kwargs)
+
+    return wrapper
+
+
+def _streamer(name: str):
+    method = getattr(Database, name)
+
+    @functools.wraps(method)
+    async def wrapper(self: "AsyncDatabase", *args, **kwargs):
+        async for item in self._stream(name, *args, **kwargs):
+            yield item
+
+    return wrapper
+
+
+def _queued_writer(name: str):
+    method = getattr(Database, name)
+
+    @functools.wraps(method)
+    async def wrapper(self: "AsyncDatabase", *args, wait: bool = True, **kwargs):
+        return await self._queue_write(name, args, kwargs, wait=wait)
+
+    return wrapper
+
+
+def _next_batch(iterator: Iterator, size: int) -> list:
+    return list(itertools.islice(iterator, size))
+
+
+def _log_write_error(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Ошибка фоновой записи в базу: {future.exception()}")
+
+
+class AsyncDatabase:
+    """Те же методы, что у Database, но без блокировки event loop.
+
+    Чтения выполняются в пуле потоков, у каждого потока своё соединение
+    только для чтения. Все записи идут через одно соединение в отдельном
+    потоке, поэтому они строго последовательны и не делят курсор с
+    чтениями. База работает в режиме WAL, так что чтения не ждут записей.
+
+    Пользователи кэшируются (UserCache) по telegram_id и user_id; методы,
+    меняющие пользователя или его конфигурацию, сбрасывают его запись.
+
+    Записи проходят через WriteQueue: add_user, add_config, add_payment и
+    delete_configs_by_user_id коммитятся пачками. По умолчанию вызов
+    возвращается после коммита; wait=False ставит запись в очередь и
+    возвращает None сразу.
+
+    Остальные хранилища в той же базе пишут через run_write и читают
+    через run_read, так что писатель у базы один.
+    """
+
+    def __init__(self, db_path=DB_FILE, readers: int = READER_POOL_SIZE):
+        self.db_path = db_path
+        # Писатель создаётся первым: он создаёт таблицы и включает WAL
+        self._writer_db = Database(db_path)
+        self._write_executor = ThreadPoolExecutor(1, thread_name_prefix="db-writer")
+        self._read_executor = ThreadPoolExecutor(readers, thread_name_prefix="db-reader")
+        self._local = threading.local()
+        self._readers: List[Database] = []
+        self._readers_lock = threading.Lock()
+        self.user_cache = UserCache()
+        self.write_queue = WriteQueue(
+            self._write_executor, self._call_writer, self._writer_db.run_batch
+        )
+        # telegram_payment_charge_id -> PaymentOutcome уже проведённых платежей
+        self._payment_outcomes: "OrderedDict[str, PaymentOutcome]" = OrderedDict()
+
+    def _reader_db(self) -> Database:
+        reader = getattr(self._local, "db", None)
+        if reader is None:
+            reader = Database(self.db_path, read_only=True)
+            self._local.db = reader
+            with self._readers_lock:
+                self._readers.append(reader)
+        return reader
+
+    def _call_reader(self, name: str, args: tuple, kwargs: dict):
+        return getattr(self._reader_db(), name)(*args, **kwargs)
+
+    def _call_writer(self, name: str, args: tuple, kwargs: dict):
+        # Выполняется в потоке писателя (через write_queue)
+        try:
+            return getattr(self._writer_db, name)(*args, **kwargs)
+        except BaseException:
+            # Не оставляем открытую транзакцию следующему вызову
+            self._writer_db.conn.rollback()
+            raise
+
+    async def _read(self, name: str, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._read_executor, self._call_reader, name, args, kwargs
+        )
+
+    async def _write(self, name: str, *args, **kwargs):
+        return await self.write_queue.submit(name, args, kwargs)
+
+    async def _queue_write(
+        self, name: str, args: tuple, kwargs: dict, wait: bool = True, on_done=None
+    ):
+        """Ставит пакетную запись в очередь; при wait=True ждёт её коммита."""
+        future = self.write_queue.submit(name, args, kwargs, batchable=True)
+        if on_done is not None:
+            future.add_done_callback(lambda _: on_done())
+        if wait:
+            return await future
+        future.add_done_callback(_log_write_error)
+        return None
+
+    async def _stream(self, name: str, *args, **kwargs):
+        """Асинхронно отдаёт строки потокового запроса пачками.
+
+        Курсор живёт между await'ами, поэтому у запроса своё соединение,
+        а не соединение потока из пула читателей.
+        """
+        loop = asyncio.get_running_loop()
+        reader = await loop.run_in_executor(
+            self._read_executor, functools.partial(Database, self.db_path, read_only=True)
+        )
+        try:
+            iterator = getattr(reader, name)(*args, **kwargs)
+            while True:
+                batch = await loop.run_in_executor(
+                    self._read_executor, _next_batch, iterator, FETCH_BATCH_SIZE
+                )
+                if not batch:
+                    break
+                for item in batch:
+                    yield item
+        finally:
+            reader.close()
+
+    async def get_user_by_telegram_id(
+        self, telegram_id: str
+    ) -> Union[UserData, Literal[False]]:
+        """Возвращает пользователя по telegram_id или False, если не найден."""
+        cached = self.user_cache.get(("tg", str(telegram_id)))
+        if cached is not MISSING:
+            return cached
+        token = self.user_cache.begin()
+        user = await self._read("get_user_by_telegram_id", telegram_id)
+        self.user_cache.put_user(user, token, telegram_id=telegram_id)
+        return user
+
+    async def get_user_by_user_id(self, user_id: int) -> Union[UserData, Literal[False]]:
+        """Возвращает пользователя по user_id или False, если не найден."""
+        cached = self.user_cache.get(("id", user_id))
+        if cached is not MISSING:
+            return cached
+        token = self.user_cache.begin()
+        user = await self._read("get_user_by_user_id", user_id)
+        self.user_cache.put_user(user, token)
+        return user
+
+    async def get_users_by_telegram_ids(self, telegram_ids: List[str]) -> Dict[str, UserData]:
+        """Пользователи по списку telegram_id: из кэша, остальные одним запросом."""
+        users: Dict[str, UserData] = {}
+        missing: List[str] = []
+        for telegram_id in dict.fromkeys(str(t) for t in telegram_ids):
+            cached = self.user_cache.get(("tg", telegram_id))
+            if cached is MISSING:
+                missing.append(telegram_id)
+            elif cached:
+                users[telegram_id] = cached
+        if missing:
+            token = self.user_cache.begin()
+            found = await self._read("get_users_by_telegram_ids", missing)
+            for telegram_id in missing:
+                user = found.get(telegram_id, False)
+                self.user_cache.put_user(user, token, telegram_id=telegram_id)
+                if user:
+                    users[telegram_id] = user
+        return users
+
+    async def add_user(self, telegram_id: str, name: str, wait: bool = True) -> None:
+        """Добавляет нового пользователя, если он ещё не существует."""
+        cached = self.user_cache.get(("tg", str(telegram_id)))
+        if cached is not MISSING and cached:
+            return
+        await self._queue_write(
+            "add_user",
+            (telegram_id, name),
+            {},
+            wait=wait,
+            on_done=lambda: self.user_cache.invalidate(telegram_id=telegram_id),
+        )
+
+    async def update_user_end_date(
+        self, telegram_id: str, months_to_add: int
+    ) -> Union[UserData, bool]:
+        """Продлевает подписку пользователя на указанное количество месяцев."""
+        try:
+            return await self._write("update_user_end_date", telegram_id, months_to_add)
+        finally:
+            self.user_cache.invalidate(telegram_id=telegram_id)
+
+    async def add_config(self, telegram_id: str, *args, wait: bool = True, **kwargs) -> int:
+        """Добавляет VPN-конфигурацию пользователя по telegram_id."""
+        return await self._queue_write(
+            "add_config",
+            (telegram_id, *args),
+            kwargs,
+            wait=wait,
+            on_done=lambda: self.user_cache.invalidate(telegram_id=telegram_id),
+        )
+
+    async def delete_configs_by_user_id(self, user_id, wait: bool = True):
+        """Удаляет все VPN-конфигурации, связанные с пользователем по его ID."""
+        return await self._queue_write(
+            "delete_configs_by_user_id",
+            (user_id,),
+            {},
+            wait=wait,
+            on_done=lambda: self.user_cache.invalidate(user_id=user_id),
+        )
+
+    async def flush(self) -> None:
+        """Ждёт коммита всех записей, поставленных в очередь."""
+        await self.write_queue.flush()
+
+    async def run_write(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Выполняет fn(db, *args, **kwargs) в потоке писателя одной транзакцией.
+
+        db — Database писателя. Так пишут хранилища поверх той же базы
+        (IpAllocator, TrafficStore и др.): их записи идут в общей очереди
+        и не ждут блокировку SQLite в event loop.
+        """
+        return await self._write("run_in_transaction", fn, *args, **kwargs)
+
+    async def run_read(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Выполняет fn(db, *args, **kwargs) в пуле читателей (db только для чтения)."""
+        return await self._read("run", fn, *args, **kwargs)
+
+    async def apply_payment(
+        self, telegram_id: str, telegram_payment_charge_id: str, *args, **kwargs
+    ) -> PaymentOutcome:
+        """Проводит платёж (см. Database.apply_payment).
+
+        Повторная доставка уже проведённого здесь платежа отвечается из
+        памяти без обращения к базе.
+        """
+        outcome = self._payment_outcomes.get(telegram_payment_charge_id)
+        if outcome is not None:
+            return PaymentOutcome(outcome.payment, outcome.end_date, duplicate=True)
+        try:
+            outcome = await self._write(
+                "apply_payment", telegram_id, telegram_payment_charge_id, *args, **kwargs
+            )
+        finally:
+            self.user_cache.invalidate(telegram_id=telegram_id)
+        self._payment_outcomes[telegram_payment_charge_id] = outcome
+        while len(self._payment_outcomes) > PAYMENT_OUTCOME_CACHE_SIZE:
+            self._payment_outcomes.popitem(last=False)
+        return outcome
+
+    def cache_stats(self) -> dict:
+        return self.user_cache.stats()
+
+    def write_stats(self) -> dict:
+        return self.write_queue.stats()
+
+    has_active_subscription = _reader("has_active_subscription")
+    get_users_expired_yesterday = _reader("get_users_expired_yesterday")
+    get_active_users = _reader("get_active_users")
+    get_users_expiring_in_days = _reader("get_users_expiring_in_days")
+    get_config_by_telegram_id = _reader("get_config_by_telegram_id")
+    count_active_users = _reader("count_active_users")
+    is_recently_active_user = _reader("is_recently_active_user")
+
+    iter_users_expired_yesterday = _streamer("iter_users_expired_yesterday")
+    iter_active_users = _streamer("iter_active_users")
+    iter_users_expiring_in_days = _streamer("iter_users_expiring_in_days")
+    iter_users_expiring_between = _streamer("iter_users_expiring_between")
+    iter_users_expired_since = _streamer("iter_users_expired_since")
+    iter_users_with_configs = _streamer("iter_users_with_configs")
+    iter_due_reminders = _streamer("iter_due_reminders")
+
+    add_payment = _queued_writer("add_payment")
+    update_payment_status = _writer("update_payment_status")
+    complete_reminders = _writer("complete_reminders")
+
+    def close(self):
+        """Останавливает потоки и закрывает все соединения."""
+        self._read_executor.shutdown(wait=True)
+        self._write_executor.shutdown(wait=True)
+        with self._readers_lock:
+            for reader in self._readers:
+                reader.close()
+            self._readers.clear()
+        self._writer_db.close()
@@ -0,0 +1,31 @@
+from datetime import date, datetime
+from typing import Optional
+
+# Дата хранится в базе как номер дня от 1970-01-01 (epoch-day): сравнения
+# и диапазоны становятся целочисленными и используют индекс
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# То же преобразование на стороне SQLite (для миграции и триггеров)
+SQL_EPOCH_DAY = "CAST(julianday({column}) - 2440587.5 AS INTEGER)"
+
+
+def to_epoch_day(value: date) -> int:
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def from_epoch_day(day: int) -> date:
+    return date.fromordinal(day + EPOCH_ORDINAL)
+
+
+def today_epoch_day() -> int:
+    return to_epoch_day(datetime.now().date())
+
+
+def parse_epoch_day(text: Optional[str]) -> Optional[int]:
+    """'YYYY-MM-DD' -> epoch-day или None."""
+    if not text:
+        return None
+    try:
+        return to_epoch_day(datetime.strptime(text, "%Y-%m-%d").date())
+    except ValueError:
+        return None
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import subprocess
+import time
+from typing import Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Сколько docker/wg процессов может выполняться одновременно
+MAX_CONCURRENCY = 4
+# Таймаут одной команды по умолчанию, сек.
+DEFAULT_TIMEOUT = 30.0
+
+
+class CommandResult:
+    __slots__ = ("args", "returncode", "stdout", "stderr")
+
+    def __init__(self, args: Sequence[str], returncode: int, stdout: bytes, stderr: bytes):
+        self.args = list(args)
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+class CommandExecutor:
+    """Асинхронный запуск внешних команд без shell.
+
+    Команды выполняются через asyncio.create_subprocess_exec, число
+    одновременно запущенных процессов ограничено семафором. Ошибки
+    поднимаются теми же исключениями, что и у модуля subprocess
+    (CalledProcessError, TimeoutExpired), поэтому вызывающий код
+    обрабатывает их как раньше. Команда, которую не удалось запустить
+    (например, нет docker), завершается с кодом 127 или 126, как в shell.
+    """
+
+    def __init__(
+        self, max_concurrency: int = MAX_CONCURRENCY, default_timeout: float = DEFAULT_TIMEOUT
+    ):
+        self.max_concurrency = max_concurrency
+        self.default_timeout = default_timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # Счётчики
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.total_wait = 0.0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Создаём лениво, чтобы семафор принадлежал работающему event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def run(
+        self,
+        *args: str,
+        input: Optional[bytes] = None,
+        timeout: Optional[float] = None,
+        check: bool = True,
+    ) -> CommandResult:
+        """Запускает команду и возвращает её результат."""
+        timeout = self.default_timeout if timeout is None else timeout
+        enqueued_at = time.monotonic()
+        acquired = False
+        self.queued += 1
+        try:
+            async with self._get_semaphore():
+                self.queued -= 1
+                acquired = True
+                started_at = time.monotonic()
+                self.total_wait += started_at - enqueued_at
+                self.running += 1
+                try:
+                    result = await self._execute(args, input, timeout)
+                except subprocess.TimeoutExpired:
+                    self.failed += 1
+                    raise
+                finally:
+                    self.running -= 1
+                    latency = time.monotonic() - started_at
+                    self.total_latency += latency
+                    self.max_latency = max(self.max_latency, latency)
+        finally:
+            if not acquired:
+                self.queued -= 1
+
+        if result.returncode != 0:
+            self.failed += 1
+            if check:
+                raise subprocess.CalledProcessError(
+                    result.returncode, result.args, result.stdout, result.stderr
+                )
+        else:
+            self.completed += 1
+        return result
+
+    async def _execute(
+        self, args: Sequence[str], input: Optional[bytes], timeout: float
+    ) -> CommandResult:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except OSError as e:
+            logger.error(f"Не удалось запустить {args[0]}: {e}")
+            returncode = 127 if isinstance(e, FileNotFoundError) else 126
+            return CommandResult(args, returncode, b"", str(e).encode("utf-8"))
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(input), timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            await self._kill(process)
+            logger.error(f"Команда {args[0]} превысила таймаут {timeout} сек.")
+            raise subprocess.TimeoutExpired(list(args), timeout)
+        except BaseException:
+            # Вызывающего отменили: процесс не должен остаться работать зомби
+            await self._kill(process)
+            raise
+        return CommandResult(args, process.returncode or 0, stdout, stderr)
+
+    @staticmethod
+    async def _kill(process: asyncio.subprocess.Process) -> None:
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        await process.wait()
+
+    async def check_output(
+        self, *args: str, input: Optional[bytes] = None, timeout: Optional[float] = None
+    ) -> bytes:
+        """Аналог subprocess.check_output."""
+        result = await self.run(*args, input=input, timeout=timeout)
+        return result.stdout
+
+    async def call(
+        self, *args: str, input: Optional[bytes] = None, timeout: Optional[float] = None
+    ) -> int:
+        """Аналог subprocess.call: возвращает код завершения, вывод пишет в лог."""
+        result = await self.run(*args, input=input, timeout=timeout, check=False)
+        if result.stdout:
+            logger.info(result.stdout.decode("utf-8", errors="replace").strip())
+        if result.returncode != 0 and result.stderr:
+            logger.error(result.stderr.decode("utf-8", errors="replace").strip())
+        return result.returncode
+
+    def stats(self) -> dict:
+        """Глубина очереди и задержки выполнения команд."""
+        finished = self.completed + self.failed
+        return {
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "avg_latency": self.total_latency / finished if finished else 0.0,
+            "max_latency": self.max_latency,
+            "avg_wait": self.total_wait / finished if finished else 0.0,
+        }
+
+
+executor = CommandExecutor()
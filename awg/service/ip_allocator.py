@@ -0,0 +1,221 @@
+import ipaddress
+import logging
+import sqlite3
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from service.db_user import AsyncDatabase, Database
+
+logger = logging.getLogger(__name__)
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+# Разрывы больше этого значения при синхронизации не переносятся в free-list
+# (актуально для огромных IPv6-пулов, где адреса раздавались не по порядку)
+MAX_GAP_FILL = 65536
+
+
+class PoolExhaustedError(Exception):
+    """В пуле не осталось свободных адресов."""
+
+
+class IpPool:
+    __slots__ = ("network", "first_offset", "last_offset", "host_prefix")
+
+    def __init__(self, cidr: str):
+        self.network: IPNetwork = ipaddress.ip_network(cidr, strict=False)
+        # .0 — адрес сети, .1 — как правило адрес самого сервера
+        self.first_offset = 2
+        if self.network.version == 4:
+            # Без адреса сети и broadcast
+            self.last_offset = self.network.num_addresses - 2
+            self.host_prefix = 32
+        else:
+            self.last_offset = self.network.num_addresses - 1
+            self.host_prefix = 128
+
+    @property
+    def key(self) -> str:
+        return str(self.network)
+
+    def address(self, offset: int) -> str:
+        return str(self.network.network_address + offset)
+
+    def offset(self, address: str) -> Optional[int]:
+        ip = ipaddress.ip_address(address)
+        if ip not in self.network:
+            return None
+        return int(ip) - int(self.network.network_address)
+
+
+class IpAllocator:
+    """Выдача адресов клиентам из пулов IPv4/IPv6.
+
+    Состояние хранится в SQLite: «верхняя граница» выданных адресов и
+    free-list освобождённых. Выдача — одна строка из free-list либо
+    сдвиг границы, т.е. не зависит от размера пула и числа клиентов.
+    Каждая операция — транзакция BEGIN IMMEDIATE в потоке писателя
+    AsyncDatabase, поэтому параллельные выдачи (в том числе из разных
+    процессов) не пересекаются. Таблицы создаёт миграция 7.
+    """
+
+    def __init__(self, db: "AsyncDatabase", ipv4_pool: str, ipv6_pool: Optional[str] = None):
+        self.db = db
+        self.pools: List[IpPool] = [IpPool(ipv4_pool)]
+        if ipv6_pool:
+            self.pools.append(IpPool(ipv6_pool))
+        self.synced_hash: Optional[str] = None
+
+    def _seed_pools(self, cur: sqlite3.Connection) -> None:
+        """Добавляет пулы из настроек, которых ещё нет в ip_pools."""
+        for pool in self.pools:
+            cur.execute(
+                "INSERT OR IGNORE INTO ip_pools (pool, next_offset) VALUES (?, ?)",
+                (pool.key, pool.first_offset),
+            )
+
+    def _allocate_in_pool(self, cur: sqlite3.Connection, pool: IpPool, client_name: str) -> str:
+        offset = None
+        while True:
+            row = cur.execute(
+                "SELECT offset FROM ip_free WHERE pool = ? LIMIT 1", (pool.key,)
+            ).fetchone()
+            if not row:
+                break
+            cur.execute("DELETE FROM ip_free WHERE pool = ? AND offset = ?", (pool.key, row[0]))
+            # Освобождённый адрес мог быть занят вне бота после синхронизации
+            if not cur.execute(
+                "SELECT 1 FROM ip_allocations WHERE address = ?", (pool.address(row[0]),)
+            ).fetchone():
+                offset = row[0]
+                break
+        if offset is None:
+            offset = cur.execute(
+                "SELECT next_offset FROM ip_pools WHERE pool = ?", (pool.key,)
+            ).fetchone()[0]
+            # Адрес может быть уже занят, если его выдали вне бота
+            while offset <= pool.last_offset and cur.execute(
+                "SELECT 1 FROM ip_allocations WHERE address = ?", (pool.address(offset),)
+            ).fetchone():
+                offset += 1
+            if offset > pool.last_offset:
+                raise PoolExhaustedError(f"Пул {pool.key} заполнен")
+            cur.execute(
+                "UPDATE ip_pools SET next_offset = ? WHERE pool = ?", (offset + 1, pool.key)
+            )
+
+        address = pool.address(offset)
+        cur.execute(
+            "INSERT INTO ip_allocations (address, pool, client_name) VALUES (?, ?, ?)",
+            (address, pool.key, client_name),
+        )
+        return f"{address}/{pool.host_prefix}"
+
+    async def allocate(self, client_name: str, ipv6: bool = False) -> Tuple[str, Optional[str]]:
+        """Выдаёт клиенту IPv4 (и IPv6, если запрошен и пул настроен) адрес."""
+        return await self.db.run_write(self._allocate, client_name, ipv6)
+
+    def _allocate(self, db: "Database", client_name: str, ipv6: bool) -> Tuple[str, Optional[str]]:
+        cur = db.conn
+        self._seed_pools(cur)
+        ipv4_address = self._allocate_in_pool(cur, self.pools[0], client_name)
+        ipv6_address = None
+        if ipv6 and len(self.pools) > 1:
+            ipv6_address = self._allocate_in_pool(cur, self.pools[1], client_name)
+        return ipv4_address, ipv6_address
+
+    async def release(self, client_name: str) -> None:
+        """Возвращает адреса клиента в пул."""
+        await self.db.run_write(self._release, client_name)
+
+    def _release(self, db: "Database", client_name: str) -> None:
+        rows = db.conn.execute(
+            "SELECT address, pool FROM ip_allocations WHERE client_name = ?",
+            (client_name,),
+        ).fetchall()
+        for address, pool_key in rows:
+            self._free(db.conn, address, pool_key)
+
+    def _free(self, cur: sqlite3.Connection, address: str, pool_key: str) -> None:
+        """Удаляет выдачу адреса и возвращает его в free-list своего пула."""
+        cur.execute("DELETE FROM ip_allocations WHERE address = ?", (address,))
+        pool = next((p for p in self.pools if p.key == pool_key), None)
+        offset = pool.offset(address) if pool else None
+        if offset is not None:
+            cur.execute(
+                "INSERT OR IGNORE INTO ip_free (pool, offset) VALUES (?, ?)",
+                (pool_key, offset),
+            )
+
+    async def sync(self, used: Iterable[Tuple[str, str]], content_hash: Optional[str] = None) -> None:
+        """Сверяет выданные адреса с wg0.conf.
+
+        used — пары (имя клиента, AllowedIPs/Address) всех peer'ов и сервера.
+        Адреса из конфигурации помечаются занятыми, а выданные ранее, но
+        исчезнувшие из неё (peer удалён вручную или старыми скриптами),
+        возвращаются в пул. Вызывается только при изменении конфигурации
+        (по content_hash), поэтому линейный проход здесь не влияет на
+        стоимость выдачи.
+        """
+        if content_hash is not None and content_hash == self.synced_hash:
+            return
+        await self.db.run_write(self._sync, list(used))
+        self.synced_hash = content_hash
+
+    def _sync(self, db: "Database", used: List[Tuple[str, str]]) -> None:
+        cur = db.conn
+        self._seed_pools(cur)
+        present = set()
+        for client_name, allowed_ips in used:
+            for item in allowed_ips.split(","):
+                item = item.strip()
+                if not item:
+                    continue
+                try:
+                    address = str(ipaddress.ip_address(item.split("/")[0]))
+                except ValueError:
+                    logger.warning(f"Некорректный адрес в конфигурации: {item}")
+                    continue
+                present.add(address)
+                self._mark_used(cur, address, client_name)
+
+        # Пустая конфигурация скорее означает ошибку чтения, чем удаление всех
+        # peer'ов: не освобождаем адреса, которые могут быть заняты
+        if not present:
+            return
+        stale = [
+            (address, pool_key)
+            for address, pool_key in cur.execute("SELECT address, pool FROM ip_allocations")
+            if address not in present
+        ]
+        for address, pool_key in stale:
+            self._free(cur, address, pool_key)
+        if stale:
+            logger.info(f"Возвращено в пул адресов удалённых peer'ов: {len(stale)}")
+
+    def _mark_used(self, cur: sqlite3.Connection, address: str, client_name: str) -> None:
+        pool = next(
+            (p for p in self.pools if p.offset(address) is not None), None
+        )
+        if pool is None:
+            return
+        offset = pool.offset(address)
+        assert offset is not None
+        cur.execute(
+            "INSERT OR IGNORE INTO ip_allocations (address, pool, client_name) VALUES (?, ?, ?)",
+            (address, pool.key, client_name),
+        )
+        cur.execute("DELETE FROM ip_free WHERE pool = ? AND offset = ?", (pool.key, offset))
+
+        next_offset = cur.execute(
+            "SELECT next_offset FROM ip_pools WHERE pool = ?", (pool.key,)
+        ).fetchone()[0]
+        if offset < next_offset or offset - next_offset > MAX_GAP_FILL:
+            return
+        cur.executemany(
+            "INSERT OR IGNORE INTO ip_free (pool, offset) VALUES (?, ?)",
+            ((pool.key, skipped) for skipped in range(next_offset, offset)),
+        )
+        cur.execute(
+            "UPDATE ip_pools SET next_offset = ? WHERE pool = ?", (offset + 1, pool.key)
+        )
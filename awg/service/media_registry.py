@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputMediaPhoto, Message
+
+if TYPE_CHECKING:
+    from service.db_user import AsyncDatabase, Database
+
+logger = logging.getLogger(__name__)
+
+PHOTO = "photo"
+
+
+class MediaRegistry:
+    """file_id загруженных в Telegram файлов из media/.
+
+    Файл загружается один раз; file_id из ответа сохраняется в SQLite по
+    sha256 содержимого и виду отправки (file_id фото и документа различаются). Изменённый
+    файл получает новый хэш и загружается заново. Хэш пересчитывается
+    только при изменении размера или mtime файла. Таблица читается и
+    пишется через AsyncDatabase.
+    """
+
+    def __init__(self, db: "AsyncDatabase"):
+        self.db = db
+        # путь -> (mtime_ns, размер, sha256)
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+        # (sha256, вид) -> file_id; None — ещё не прочитаны из базы
+        self._file_ids: Optional[Dict[Tuple[str, str], str]] = None
+
+    async def _ensure_loaded(self) -> Dict[Tuple[str, str], str]:
+        if self._file_ids is None:
+            rows = await self.db.run_read(self._load)
+            if self._file_ids is None:
+                self._file_ids = {(sha256, kind): file_id for sha256, kind, file_id in rows}
+        return self._file_ids
+
+    @staticmethod
+    def _load(db: "Database") -> list:
+        return db.conn.execute("SELECT sha256, kind, file_id FROM media_files").fetchall()
+
+    def content_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        cached = self._hashes.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        self._hashes[path] = (stat.st_mtime_ns, stat.st_size, sha256)
+        return sha256
+
+    async def resolve(self, path: str, kind: str = PHOTO) -> Union[str, FSInputFile]:
+        """file_id, если файл уже загружен, иначе FSInputFile для загрузки."""
+        file_ids = await self._ensure_loaded()
+        file_id = file_ids.get((self.content_hash(path), kind))
+        return file_id if file_id else FSInputFile(path)
+
+    async def remember(self, path: str, kind: str, file_id: str) -> None:
+        file_ids = await self._ensure_loaded()
+        sha256 = self.content_hash(path)
+        if file_ids.get((sha256, kind)) == file_id:
+            return
+        file_ids[(sha256, kind)] = file_id
+        await self.db.run_write(self._save, sha256, kind, file_id, path)
+
+    @staticmethod
+    def _save(db: "Database", sha256: str, kind: str, file_id: str, path: str) -> None:
+        db.conn.execute(
+            "INSERT INTO media_files (sha256, kind, file_id, path, uploaded_at)"
+            " VALUES (?, ?, ?, ?, ?) ON CONFLICT(sha256, kind) DO UPDATE SET"
+            " file_id = excluded.file_id, path = excluded.path,"
+            " uploaded_at = excluded.uploaded_at",
+            (sha256, kind, file_id, path, int(time.time())),
+        )
+
+    async def forget(self, path: str, kind: str) -> None:
+        file_ids = await self._ensure_loaded()
+        sha256 = self.content_hash(path)
+        file_ids.pop((sha256, kind), None)
+        await self.db.run_write(self._delete, sha256, kind)
+
+    @staticmethod
+    def _delete(db: "Database", sha256: str, kind: str) -> None:
+        db.conn.execute("DELETE FROM media_files WHERE sha256 = ? AND kind = ?", (sha256, kind))
+
+    async def send_photo(
+        self, send: Callable[..., Awaitable[Message]], path: str, **kwargs
+    ) -> Message:
+        """Отправляет фото через send(photo=..., **kwargs), например message.answer_photo.
+
+        Если сохранённый file_id Telegram больше не принимает (например,
+        сменился токен бота), файл загружается заново.
+        """
+        photo = await self.resolve(path, PHOTO)
+        try:
+            message = await send(photo=photo, **kwargs)
+        except TelegramBadRequest:
+            if isinstance(photo, FSInputFile):
+                raise
+            logger.warning(f"file_id для {path} отклонён, загружаем файл заново")
+            await self.forget(path, PHOTO)
+            message = await send(photo=FSInputFile(path), **kwargs)
+        if message.photo:
+            await self.remember(path, PHOTO, message.photo[-1].file_id)
+        return message
+
+    async def send_album(
+        self,
+        send: Callable[..., Awaitable[List[Message]]],
+        items: Sequence[Tuple[str, str]],
+        parse_mode: str = "Markdown",
+        **kwargs,
+    ) -> List[Message]:
+        """Отправляет фото [(путь, подпись), ...] одним альбомом через send(media=..., **kwargs).
+
+        send — например message.answer_media_group или bot.send_media_group.
+        """
+        album = await self._album(items, parse_mode, upload=False)
+        try:
+            messages = await send(media=album, **kwargs)
+        except TelegramBadRequest:
+            if all(isinstance(media.media, FSInputFile) for media in album):
+                raise
+            logger.warning("file_id альбома отклонён, загружаем файлы заново")
+            for path, _ in items:
+                await self.forget(path, PHOTO)
+            messages = await send(media=await self._album(items, parse_mode, upload=True), **kwargs)
+        for (path, _), message in zip(items, messages):
+            if message.photo:
+                await self.remember(path, PHOTO, message.photo[-1].file_id)
+        return messages
+
+    async def _album(
+        self, items: Sequence[Tuple[str, str]], parse_mode: str, upload: bool
+    ) -> List[InputMediaPhoto]:
+        return [
+            InputMediaPhoto(
+                media=FSInputFile(path) if upload else await self.resolve(path, PHOTO),
+                caption=caption,
+                parse_mode=parse_mode,
+            )
+            for path, caption in items
+        ]
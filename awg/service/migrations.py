@@ -0,0 +1,361 @@
+import logging
+import sqlite3
+from typing import Callable, List, Tuple, Union
+
+from service.epoch_day import SQL_EPOCH_DAY, today_epoch_day
+from service.reminders import next_reminder
+
+logger = logging.getLogger(__name__)
+
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+
+def _add_column(table: str, column: str, definition: str) -> Callable[[sqlite3.Connection], None]:
+    def step(conn: sqlite3.Connection) -> None:
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    return step
+
+
+def _schedule_existing_reminders(conn: sqlite3.Connection) -> None:
+    """Заполняет notifications для уже существующих подписок."""
+    today = today_epoch_day()
+    rows = conn.execute(
+        "SELECT user_id, end_day FROM users WHERE end_day >= ? AND is_unlimited != 1",
+        (today,),
+    ).fetchall()
+    schedule = []
+    for user_id, end_day in rows:
+        reminder = next_reminder(end_day, today - 1)
+        if reminder:
+            schedule.append((user_id, *reminder))
+    conn.executemany(
+        "INSERT OR REPLACE INTO notifications (user_id, due_day, days_before) VALUES (?, ?, ?)",
+        schedule,
+    )
+
+
+# (версия, описание, шаги). Уже применённые миграции менять нельзя —
+# только добавлять новые в конец списка.
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (
+        1,
+        "Базовые таблицы users, configs, payments",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                telegram_id TEXT UNIQUE,
+                name TEXT,
+                end_date TEXT,
+                is_unlimited INTEGER DEFAULT 0,
+                has_used_trial INTEGER DEFAULT 0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS configs (
+                config_id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+
+                -- Интерфейс
+                private_key TEXT NOT NULL,
+                address TEXT NOT NULL,
+                dns TEXT,
+
+                jc INTEGER,
+                jmin INTEGER,
+                jmax INTEGER,
+                s1 INTEGER,
+                s2 INTEGER,
+                h1 INTEGER,
+                h2 INTEGER,
+                h3 INTEGER,
+                h4 INTEGER,
+
+                -- Параметры peer'а
+                public_key TEXT NOT NULL,
+                preshared_key TEXT,
+                allowed_ips TEXT,
+                endpoint TEXT,
+                persistent_keepalive INTEGER,
+
+                -- deactivate_presharekey
+
+                deactivate_presharekey TEXT,
+
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS payments (
+                payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                amount INTEGER,
+                months INTEGER,
+                provider_payment_id TEXT,
+                payment_time TEXT DEFAULT CURRENT_TIMESTAMP,
+                raw_payload TEXT,
+                status TEXT DEFAULT 'pending',
+                unique_payload TEXT,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "Индексы для поиска конфигурации, платежа и истекающих подписок",
+        [
+            # get_config_by_telegram_id: users по telegram_id (UNIQUE), затем configs по user_id
+            "CREATE INDEX IF NOT EXISTS idx_configs_user_id ON configs(user_id)",
+            # update_payment_status: UPDATE/SELECT ... WHERE raw_payload = ?
+            "CREATE INDEX IF NOT EXISTS idx_payments_raw_payload ON payments(raw_payload)",
+            # get_users_expiring_in_days / get_users_expired_yesterday / get_active_users
+            "CREATE INDEX IF NOT EXISTS idx_users_end_date ON users(end_date)",
+            # Вторая ветка OR в get_active_users и count_active_users
+            "CREATE INDEX IF NOT EXISTS idx_users_unlimited ON users(is_unlimited)"
+            " WHERE is_unlimited = 1",
+        ],
+    ),
+    (
+        3,
+        "Дата начала текущей подписки (используется в count_active_users)",
+        [_add_column("users", "subscription_start", "TEXT")],
+    ),
+    (
+        4,
+        "Дата окончания подписки как целый номер дня (end_day) с индексом",
+        [
+            _add_column("users", "end_day", "INTEGER"),
+            "UPDATE users SET end_day = "
+            + SQL_EPOCH_DAY.format(column="end_date")
+            + " WHERE end_date IS NOT NULL",
+            "CREATE INDEX IF NOT EXISTS idx_users_end_day ON users(end_day)",
+            "DROP INDEX IF EXISTS idx_users_end_date",
+            # end_date остаётся текстовым представлением end_day; триггеры
+            # поддерживают end_day, если end_date записали в обход Database
+            f"""
+            CREATE TRIGGER IF NOT EXISTS users_end_day_insert AFTER INSERT ON users
+            WHEN NEW.end_day IS NOT {SQL_EPOCH_DAY.format(column="NEW.end_date")}
+            BEGIN
+                UPDATE users SET end_day = {SQL_EPOCH_DAY.format(column="NEW.end_date")}
+                WHERE user_id = NEW.user_id;
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS users_end_day_update AFTER UPDATE OF end_date ON users
+            WHEN NEW.end_day IS NOT {SQL_EPOCH_DAY.format(column="NEW.end_date")}
+            BEGIN
+                UPDATE users SET end_day = {SQL_EPOCH_DAY.format(column="NEW.end_date")}
+                WHERE user_id = NEW.user_id;
+            END
+            """,
+        ],
+    ),
+    (
+        5,
+        "Уникальный telegram_payment_charge_id: повторная доставка платежа не продлевает подписку",
+        [
+            _add_column("payments", "telegram_payment_charge_id", "TEXT"),
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_telegram_charge_id"
+            " ON payments(telegram_payment_charge_id)"
+            " WHERE telegram_payment_charge_id IS NOT NULL",
+        ],
+    ),
+    (
+        6,
+        "Расписание напоминаний об окончании подписки (notifications)",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS notifications (
+                user_id INTEGER PRIMARY KEY REFERENCES users(user_id),
+                due_day INTEGER NOT NULL,
+                days_before INTEGER NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_notifications_due_day ON notifications(due_day)",
+            _schedule_existing_reminders,
+        ],
+    ),
+    # Таблицы 7–11 раньше создавались своими хранилищами через CREATE TABLE
+    # IF NOT EXISTS, поэтому в существующих базах они уже могут быть
+    (
+        7,
+        "Пулы адресов клиентов (IpAllocator)",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS ip_pools (
+                pool TEXT PRIMARY KEY,
+                next_offset INTEGER NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS ip_allocations (
+                address TEXT PRIMARY KEY,
+                pool TEXT NOT NULL,
+                client_name TEXT NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_ip_allocations_client ON ip_allocations(client_name)",
+            """
+            CREATE TABLE IF NOT EXISTS ip_free (
+                pool TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                PRIMARY KEY (pool, offset)
+            )
+            """,
+        ],
+    ),
+    (
+        8,
+        "Временной ряд трафика peer'ов (TrafficStore)",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS traffic_counters (
+                public_key TEXT PRIMARY KEY,
+                rx INTEGER NOT NULL,
+                tx INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS traffic_totals (
+                client_name TEXT PRIMARY KEY,
+                rx INTEGER NOT NULL DEFAULT 0,
+                tx INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            *(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    client_name TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    rx INTEGER NOT NULL,
+                    tx INTEGER NOT NULL,
+                    PRIMARY KEY (client_name, ts)
+                ) WITHOUT ROWID
+                """
+                for table in ("traffic_minute", "traffic_hour", "traffic_day")
+            ),
+            "CREATE INDEX IF NOT EXISTS idx_traffic_minute_ts ON traffic_minute(ts)",
+            "CREATE INDEX IF NOT EXISTS idx_traffic_hour_ts ON traffic_hour(ts)",
+            "CREATE INDEX IF NOT EXISTS idx_traffic_day_ts ON traffic_day(ts)",
+            """
+            CREATE TABLE IF NOT EXISTS traffic_rollups (
+                target TEXT PRIMARY KEY,
+                done_until INTEGER NOT NULL
+            )
+            """,
+        ],
+    ),
+    (
+        9,
+        "История подключений клиентов (ConnectionLog)",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS connection_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_name TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                first_seen INTEGER NOT NULL,
+                last_seen INTEGER NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_connection_events_client_seen"
+            " ON connection_events(client_name, last_seen)",
+            "CREATE INDEX IF NOT EXISTS idx_connection_events_seen ON connection_events(last_seen)",
+        ],
+    ),
+    (
+        10,
+        "file_id загруженных в Telegram файлов (MediaRegistry)",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS media_files (
+                sha256 TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                path TEXT,
+                uploaded_at INTEGER NOT NULL,
+                PRIMARY KEY (sha256, kind)
+            ) WITHOUT ROWID
+            """,
+        ],
+    ),
+    (
+        11,
+        "Рассылки и статус сообщений (BroadcastStore)",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                reply_markup TEXT,
+                parse_mode TEXT,
+                created_at INTEGER NOT NULL,
+                finished_at INTEGER
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS broadcast_messages (
+                job_id INTEGER NOT NULL,
+                chat_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                PRIMARY KEY (job_id, chat_id)
+            ) WITHOUT ROWID
+            """,
+        ],
+    ),
+]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Применяет недостающие миграции; возвращает итоговую версию схемы.
+
+    Каждая миграция выполняется в своей транзакции вместе с записью в
+    schema_version, так что прерванная миграция повторяется целиком.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.commit()
+    version = current_version(conn)
+    for migration_version, description, steps in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (migration_version, description),
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            logger.error(f"Ошибка миграции схемы до версии {migration_version}")
+            raise
+        version = migration_version
+        logger.info(f"Схема базы обновлена до версии {version}: {description}")
+    return version
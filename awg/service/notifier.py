@@ -1,23 +1,39 @@
 import logging
 import time
-from typing import List
+from typing import Callable, List, Optional
 
 from keyboard.menu import get_user_profile_menu
 from service.db_instance import user_db
+from service.db_user import Database
 from service.base_model import UserData
+from service.broadcast import Broadcaster, BroadcastResult, BroadcastStore
+from service.epoch_day import today_epoch_day
 from settings import ADMINS, BOT
 
 logger = logging.getLogger(__name__)
 
+_broadcaster: Optional[Broadcaster] = None
+
+# Сколько напоминаний отправлять между записями прогресса в базу
+REMINDER_BATCH_SIZE = 100
+
 
 async def daily_check_end_date_and_notify():
     start_time = time.time()
     logger.info("📬 Начинаю ежедневную проверку рассылки подписок...")
 
     try:
-        days_before_end = [10, 5, 2]
-        users = user_db.get_users_expiring_in_days(days_before_end)
-        await notify_users(users)
+        # Расписание напоминаний ведётся в таблице notifications при каждом
+        # продлении; здесь только забираем наступившие (и пропущенные) напоминания
+        today = today_epoch_day()
+        batch: List = []
+        async for reminder in user_db.iter_due_reminders(today):
+            batch.append(reminder)
+            if len(batch) >= REMINDER_BATCH_SIZE:
+                await _send_reminders(batch, today)
+                batch = []
+        if batch:
+            await _send_reminders(batch, today)
     except Exception as e:
         logger.error(f"❌ Ошибка в daily_check_end_date_and_notify: {e}")
     finally:
@@ -26,48 +42,60 @@ async def daily_check_end_date_and_notify():
         )
 
 
-async def notify_users(users: List[UserData]):
-    """Отправляет уведомления пользователям и логирует успешные отправки."""
-    successful_sends = 0
-    failed_sends = 0
-    for user in users:
-        try:
-            await BOT.send_message(
+def get_broadcaster() -> Broadcaster:
+    global _broadcaster
+    if _broadcaster is None:
+        _broadcaster = Broadcaster(BOT, BroadcastStore(user_db))
+    return _broadcaster
+
+
+async def _send_reminders(reminders: List, today: int) -> None:
+    sent = [(reminder.user.user_id, reminder.due_day) for reminder in reminders]
+    # Напоминания переносятся в той же транзакции, что ставит рассылку в
+    # очередь: после сбоя её досылает resume_broadcasts, а повторная
+    # проверка эти напоминания уже не выберет
+    await notify_users(
+        [reminder.user for reminder in reminders],
+        on_create=lambda db: db.complete_reminders(sent, today),
+    )
+
+
+async def notify_users(
+    users: List[UserData], on_create: Optional[Callable[[Database], None]] = None
+) -> BroadcastResult:
+    """Отправляет уведомления пользователям через общую очередь рассылки."""
+    result = await get_broadcaster().broadcast(
+        "subscription_reminders",
+        (
+            (
                 user.telegram_id,
                 f"Привет, {user.name}!\nВаша подписка заканчивается {user.end_date}.\nПожалуйста, продлите её вовремя!",
-                reply_markup = get_user_profile_menu()
-            )
-
-            # Логируем успешную отправку, если исключение не возникло
-            logger.info(
-                f"✅ Уведомление успешно отправлено пользователю ID: {user.telegram_id} (Имя: {user.name})"
-            )
-            successful_sends += 1
-        except Exception as e:
-            logger.error(
-                f"Ошибка отправки сообщения пользователю {user.telegram_id}: {e}"
             )
-            failed_sends += 1
-
+            for user in users
+        ),
+        reply_markup=get_user_profile_menu(),
+        on_create=on_create,
+    )
     logger.info(
-        f"📊 Статистика рассылки: Успешно: {successful_sends}, Ошибок: {failed_sends}"
+        f"📊 Статистика рассылки: Успешно: {result.sent}, Ошибок: {result.failed}"
     )
+    return result
 
 
-async def notify_admins(text: str):
+async def notify_admins(text: str) -> BroadcastResult:
     """Рассылает сообщение всем администраторам."""
-    successful_sends = 0
-    failed_sends = 0
-
-    for admin_id in ADMINS:
-        try:
-            await BOT.send_message(admin_id, text)
-            logger.info(f"✅ Сообщение администратору {admin_id} отправлено.")
-            successful_sends += 1
-        except Exception as e:
-            logger.error(f"❌ Ошибка отправки админу {admin_id}: {e}")
-            failed_sends += 1
-
+    result = await get_broadcaster().broadcast(
+        "admins", ((admin_id, text) for admin_id in ADMINS)
+    )
     logger.info(
-        f"📊 Админам отправлено: Успешно: {successful_sends}, Ошибок: {failed_sends}"
-    )
\ No newline at end of file
+        f"📊 Админам отправлено: Успешно: {result.sent}, Ошибок: {result.failed}"
+    )
+    return result
+
+
+async def resume_broadcasts():
+    """Дорассылает сообщения, не отправленные до остановки бота."""
+    try:
+        await get_broadcaster().resume()
+    except Exception as e:
+        logger.error(f"❌ Ошибка при возобновлении рассылок: {e}")
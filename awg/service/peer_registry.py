@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import logging
+import subprocess
+import time
+from typing import Dict, List, Optional
+
+from service.executor import executor
+from service.wg_apply import CLIENTS_TABLE_PATH
+from service.wg_config import WgConfig
+
+logger = logging.getLogger(__name__)
+
+# Разделитель между wg0.conf и clientsTable в выводе одного docker exec
+_SEPARATOR = b"\0"
+# Как часто (сек.) сверять сигнатуру файлов в контейнере
+CHECK_INTERVAL = 2.0
+
+
+class PeerSnapshot:
+    """Разобранное состояние wg0.conf и clientsTable с индексами.
+
+    Снимок общий для всех вызывающих, поэтому config менять нельзя:
+    для изменений нужно разобрать свою копию из config_content.
+    """
+
+    __slots__ = (
+        "content_hash",
+        "config_content",
+        "config",
+        "clients_table",
+        "client_map",
+        "clients",
+        "by_public_key",
+        "by_name",
+        "unnamed_peers",
+    )
+
+    def __init__(self, config_content: str, clients_table: list, content_hash: str = ""):
+        self.content_hash = content_hash
+        self.config_content = config_content
+        self.config = WgConfig.parse(config_content)
+        self.clients_table = clients_table
+        self.client_map: Dict[str, str] = {
+            client["clientId"]: client["userData"]["clientName"]
+            for client in clients_table
+        }
+        # [имя, публичный ключ, AllowedIPs] — формат get_client_list()
+        self.clients: List[list] = [
+            [
+                self.client_map.get(peer.public_key, peer.name or "Unknown"),
+                peer.public_key,
+                peer.allowed_ips,
+            ]
+            for peer in self.config.peers
+        ]
+        self.by_public_key: Dict[str, list] = {c[1]: c for c in self.clients}
+        self.by_name: Dict[str, list] = {}
+        for client in self.clients:
+            # Первый найденный peer с именем выигрывает, как и при линейном поиске
+            self.by_name.setdefault(client[0], client)
+        # Публичные ключи peer'ов без комментария # name
+        self.unnamed_peers: List[str] = [
+            peer.public_key for peer in self.config.peers if peer.name_line < 0
+        ]
+
+    @property
+    def interface_address(self) -> str:
+        return self.config.interface_address
+
+
+class PeerRegistry:
+    """Общий кэш пиров WireGuard.
+
+    Файлы читаются из контейнера одним docker exec и разбираются один раз.
+    Повторное чтение происходит только если изменились mtime/ctime, размер
+    или inode файлов (или явно вызван invalidate() после собственной
+    записи), а повторный разбор — только если изменился хеш содержимого.
+
+    Все изменения wg0.conf/clientsTable ботом выполняются под write_lock,
+    чтобы параллельные операции не перезаписывали файлы друг друга.
+    """
+
+    def __init__(self, docker_container: str, wg_config_file: str):
+        self.docker_container = docker_container
+        self.wg_config_file = wg_config_file
+        self._snapshot: Optional[PeerSnapshot] = None
+        self._content_hash: Optional[str] = None
+        self._signature: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def write_lock(self) -> asyncio.Lock:
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        return self._write_lock
+
+    def invalidate(self) -> None:
+        """Сбрасывает сигнатуру: следующий вызов перечитает файлы."""
+        self._signature = None
+        self._checked_at = 0.0
+
+    async def _stat_signature(self) -> str:
+        # %y/%z — mtime/ctime с долями секунды (и в GNU stat, и в busybox),
+        # %i — inode: перезапись того же размера в ту же секунду или замена
+        # файла через rename тоже меняют сигнатуру
+        output = await executor.check_output(
+            "docker",
+            "exec",
+            self.docker_container,
+            "sh",
+            "-c",
+            f"stat -c '%n %y %z %s %i' {self.wg_config_file} {CLIENTS_TABLE_PATH} 2>/dev/null || true",
+        )
+        return output.decode("utf-8").strip()
+
+    async def _read_files(self) -> bytes:
+        return await executor.check_output(
+            "docker",
+            "exec",
+            "-i",
+            self.docker_container,
+            "sh",
+            "-c",
+            f"cat {self.wg_config_file}; printf '\\000'; cat {CLIENTS_TABLE_PATH} 2>/dev/null || true",
+        )
+
+    async def _load(self) -> None:
+        raw = await self._read_files()
+        content_hash = hashlib.sha256(raw).hexdigest()
+        if self._snapshot is not None and content_hash == self._content_hash:
+            return
+
+        config_raw, _, table_raw = raw.partition(_SEPARATOR)
+        try:
+            clients_table = json.loads(table_raw.decode("utf-8")) if table_raw.strip() else []
+        except json.JSONDecodeError:
+            logger.error("Ошибка при разборе clientsTable JSON.")
+            clients_table = []
+
+        self._snapshot = PeerSnapshot(
+            config_raw.decode("utf-8"), clients_table, content_hash
+        )
+        self._content_hash = content_hash
+        logger.info(f"Реестр пиров перестроен: {len(self._snapshot.clients)} пиров.")
+
+    async def snapshot(self) -> PeerSnapshot:
+        """Возвращает актуальный снимок, перечитывая файлы только при изменениях."""
+        if self._snapshot is not None and time.monotonic() - self._checked_at < CHECK_INTERVAL:
+            return self._snapshot
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Параллельные обработчики ждут одно чтение, а не запускают свои
+        async with self._lock:
+            now = time.monotonic()
+            if self._snapshot is not None and now - self._checked_at < CHECK_INTERVAL:
+                return self._snapshot
+            try:
+                signature = await self._stat_signature()
+                if self._snapshot is None or signature != self._signature:
+                    await self._load()
+                    self._signature = signature
+                self._checked_at = now
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                logger.error(f"Ошибка при чтении конфигурации WireGuard: {e}")
+                if self._snapshot is None:
+                    return PeerSnapshot("", [])
+        return self._snapshot  # type: ignore[return-value]
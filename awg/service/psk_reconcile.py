@@ -0,0 +1,94 @@
+import logging
+from typing import Dict, List, Tuple
+
+from service.peer_registry import PeerRegistry
+from service.wg_config import WgConfig
+from service.wg_apply import apply_config, write_config
+
+logger = logging.getLogger(__name__)
+
+
+class PskChange:
+    __slots__ = ("client_name", "public_key", "old_key", "new_key")
+
+    def __init__(self, client_name: str, public_key: str, old_key: str, new_key: str):
+        self.client_name = client_name
+        self.public_key = public_key
+        self.old_key = old_key
+        self.new_key = new_key
+
+    def __repr__(self) -> str:
+        return f"PskChange({self.client_name!r}, {self.public_key[:8]}…)"
+
+
+def plan_psk_changes(
+    config_content: str, desired: Dict[str, str]
+) -> Tuple[str, List[PskChange]]:
+    """Вычисляет новые PresharedKey по разобранному wg0.conf.
+
+    desired — словарь «публичный ключ peer'а → нужный PresharedKey».
+    Возвращает новый текст конфигурации и список peer'ов, у которых ключ
+    реально меняется. Если изменений нет, текст возвращается как есть.
+    """
+    config = WgConfig.parse(config_content)
+    changes: List[PskChange] = []
+    for public_key, new_key in desired.items():
+        peer = config.by_public_key.get(public_key)
+        if peer is None or not new_key or "presharedkey" not in peer.keys:
+            continue
+        old_key = peer.preshared_key
+        if old_key == new_key:
+            continue
+        peer.set("PresharedKey", new_key)
+        changes.append(PskChange(peer.name, public_key, old_key, new_key))
+
+    if not changes:
+        return config_content, changes
+    return config.to_text(), changes
+
+
+async def reconcile_preshared_keys(
+    registry: PeerRegistry,
+    desired: Dict[str, str],
+    apply_mode: str = "live",
+) -> List[PskChange]:
+    """Приводит PresharedKey в wg0.conf к нужному состоянию.
+
+    Конфигурация читается и разбирается один раз, изменения записываются одной
+    операцией и применяются одним вызовом wg syncconf (или перезапуском
+    при apply_mode = restart). Если менять нечего, контейнер не трогается.
+    """
+    async with registry.write_lock:
+        return await _reconcile_locked(registry, desired, apply_mode)
+
+
+async def _reconcile_locked(
+    registry: PeerRegistry, desired: Dict[str, str], apply_mode: str
+) -> List[PskChange]:
+    registry.invalidate()
+    snapshot = await registry.snapshot()
+
+    desired_by_key: Dict[str, str] = {}
+    for client_name, preshared_key in desired.items():
+        client = snapshot.by_name.get(client_name)
+        if client is None:
+            logger.warning(f"Клиент {client_name} не найден в конфигурации WireGuard")
+            continue
+        desired_by_key[client[1]] = preshared_key
+
+    new_content, changes = plan_psk_changes(snapshot.config_content, desired_by_key)
+    for change in changes:
+        change.client_name = snapshot.by_public_key[change.public_key][0]
+
+    if not changes:
+        logger.info("PresharedKey всех клиентов актуальны, изменений нет.")
+        return changes
+
+    await write_config(registry.docker_container, registry.wg_config_file, new_content)
+    registry.invalidate()
+    await apply_config(registry.docker_container, registry.wg_config_file, apply_mode)
+
+    for change in changes:
+        logger.info(f"PresharedKey обновлён для {change.client_name}")
+    logger.info(f"Обновлено PresharedKey: {len(changes)}")
+    return changes
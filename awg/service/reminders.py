@@ -0,0 +1,18 @@
+from typing import Optional, Tuple
+
+# За сколько дней до окончания подписки напоминать (по убыванию)
+REMINDER_DAYS = (10, 5, 2)
+
+
+def next_reminder(end_day: Optional[int], after_day: int) -> Optional[Tuple[int, int]]:
+    """Ближайшее напоминание позже after_day: (день отправки, дней до окончания).
+
+    Дни — epoch-day. None, если напоминать больше нечего.
+    """
+    if end_day is None:
+        return None
+    for days_before in REMINDER_DAYS:
+        due_day = end_day - days_before
+        if due_day > after_day:
+            return due_day, days_before
+    return None
@@ -1,68 +1,177 @@
-import io
+import asyncio
 import logging
 import os
+import sqlite3
+import tempfile
+import time
 from datetime import datetime
+from typing import List, Optional, Sequence
 import zipfile
-from aiogram.types import BufferedInputFile
+import humanize
+from aiogram import Bot
+from aiogram.types import FSInputFile
+from db import get_traffic_store
 from service.system_stats import find_peak_usage, get_vnstat_hourly
 from settings import ADMINS, BOT, DB_FILE
 
 logger = logging.getLogger(__name__)
 
+# Сколько клиентов с наибольшим трафиком за сутки показывать в отчёте
+TOP_CLIENTS = 5
 
-def create_db_backup(original_path: str, backup_dir: str = "backups") -> bytes:
-    """Создает ZIP-резервную копию базы данных и других важных файлов, возвращает путь к ZIP-файлу (который будет удалён после использования)."""
-    os.makedirs(backup_dir, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_zip_path = os.path.join(backup_dir, f"full_backup_{timestamp}.zip")
-
-    with zipfile.ZipFile(backup_zip_path, "w") as zipf:
-        # Добавить базу данных
-        if os.path.exists(original_path):
-            zipf.write(original_path, os.path.relpath(original_path, os.getcwd()))
-
-        # Добавить отдельные скрипты
-        for file in ["awg-decode.py", "newclient.sh", "removeclient.sh"]:
-            if os.path.exists(file):
-                zipf.write(file, os.path.relpath(file, os.getcwd()))
-
-        # Добавить содержимое папки files/
-        for root, _, files in os.walk("files"):
-            for file in files:
-                full_path = os.path.join(root, file)
-                zipf.write(full_path, os.path.relpath(full_path, os.getcwd()))
-
-        # Добавить содержимое папки users/
-        for root, _, files in os.walk("users"):
-            for file in files:
-                full_path = os.path.join(root, file)
-                zipf.write(full_path, os.path.relpath(full_path, os.getcwd()))
-
-    # Возврат пути для использования, а затем удаление
+# Лимит Telegram на загрузку файла ботом — 50 МБ; оставляем запас
+MAX_UPLOAD_SIZE = 49 * 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _snapshot_database(path: str) -> str:
+    """Согласованная копия SQLite-базы во временный файл."""
+    fd, snapshot_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    source = sqlite3.connect(path)
+    target = sqlite3.connect(snapshot_path)
     try:
-        with open(backup_zip_path, "rb") as f:
-            zip_bytes = f.read()
+        source.backup(target)
     finally:
+        target.close()
+        source.close()
+    return snapshot_path
+
+
+def create_db_backup(original_path: str, backup_dir: Optional[str] = None) -> str:
+    """Создает ZIP-резервную копию базы данных и других важных файлов.
+
+    Архив пишется потоково во временный файл (в backup_dir или системном
+    каталоге); возвращается путь к нему, удалить файл должен вызывающий.
+    """
+    if backup_dir:
+        os.makedirs(backup_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    fd, backup_zip_path = tempfile.mkstemp(
+        prefix=f"full_backup_{timestamp}_", suffix=".zip", dir=backup_dir
+    )
+    os.close(fd)
+
+    try:
+        with zipfile.ZipFile(backup_zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            # Добавить базу данных. В режиме WAL часть данных может быть ещё
+            # в файле -wal, поэтому копия снимается через backup API SQLite
+            if os.path.exists(original_path):
+                snapshot_path = _snapshot_database(original_path)
+                try:
+                    zipf.write(snapshot_path, os.path.relpath(original_path, os.getcwd()))
+                finally:
+                    os.remove(snapshot_path)
+
+            # Добавить отдельные скрипты
+            for file in ["awg-decode.py", "newclient.sh"]:
+                if os.path.exists(file):
+                    zipf.write(file, os.path.relpath(file, os.getcwd()))
+
+            # Добавить содержимое папки files/
+            for root, _, files in os.walk("files"):
+                for file in files:
+                    full_path = os.path.join(root, file)
+                    zipf.write(full_path, os.path.relpath(full_path, os.getcwd()))
+
+            # Добавить содержимое папки users/
+            for root, _, files in os.walk("users"):
+                for file in files:
+                    full_path = os.path.join(root, file)
+                    zipf.write(full_path, os.path.relpath(full_path, os.getcwd()))
+    except BaseException:
         os.remove(backup_zip_path)
+        raise
 
-    return zip_bytes  # Возвращаем содержимое архива как байты
+    return backup_zip_path
 
 
-async def send_backup():
+def split_file(path: str, part_size: int = MAX_UPLOAD_SIZE) -> List[str]:
+    """Делит файл на части не больше part_size: path.001, path.002, ...
+
+    Файл, который помещается целиком, возвращается как есть; иначе
+    исходный файл удаляется. Собрать обратно: cat backup.zip.* > backup.zip
+    """
+    if os.path.getsize(path) <= part_size:
+        return [path]
+    parts: List[str] = []
     try:
-        backup_bytes = create_db_backup(DB_FILE)
+        with open(path, "rb") as source:
+            while True:
+                part_path = f"{path}.{len(parts) + 1:03d}"
+                written = 0
+                with open(part_path, "wb") as target:
+                    while written < part_size:
+                        chunk = source.read(min(COPY_CHUNK_SIZE, part_size - written))
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        written += len(chunk)
+                if not written:
+                    os.remove(part_path)
+                    break
+                parts.append(part_path)
+    except BaseException:
+        for part_path in parts:
+            os.remove(part_path)
+        raise
+    os.remove(path)
+    return parts
+
+
+async def build_backup() -> List[str]:
+    """Собирает архив и делит его на части в отдельном потоке, не блокируя бота."""
+    loop = asyncio.get_running_loop()
+    backup_path = await loop.run_in_executor(None, create_db_backup, DB_FILE)
+    return await loop.run_in_executor(None, split_file, backup_path)
+
+
+async def deliver_backup(bot: Bot, chat_ids: Sequence[int], caption: str) -> int:
+    """Отправляет бэкап в чаты chat_ids; возвращает, скольким он доставлен.
+
+    Каждая часть загружается в Telegram один раз, остальным получателям
+    уходит её file_id. Временные файлы удаляются после отправки.
+    """
+    parts = await build_backup()
+    delivered = set(chat_ids)
+    try:
+        for index, part_path in enumerate(parts, start=1):
+            if len(parts) == 1:
+                filename, part_caption = "backup.zip", caption
+            else:
+                filename = f"backup.zip.{index:03d}"
+                part_caption = f"{caption}\nЧасть {index} из {len(parts)}."
+                if index == len(parts):
+                    part_caption += "\nСобрать архив: cat backup.zip.* > backup.zip"
+
+            file_id = None
+            for chat_id in chat_ids:
+                if chat_id not in delivered:
+                    continue
+                try:
+                    message = await bot.send_document(
+                        chat_id=chat_id,
+                        document=file_id or FSInputFile(part_path, filename=filename),
+                        caption=part_caption,
+                    )
+                except Exception as e:
+                    logger.error(f"Ошибка при отправке бэкапа {chat_id}: {e}")
+                    delivered.discard(chat_id)
+                    continue
+                if file_id is None and message.document:
+                    file_id = message.document.file_id
+    finally:
+        for part_path in parts:
+            os.remove(part_path)
+    return len(delivered)
 
-        input_file = BufferedInputFile(file=backup_bytes, filename="backup.zip")
 
-        for admin_id in ADMINS:
-            await BOT.send_document(
-                chat_id=admin_id,
-                document=input_file,
-                caption="Автоматический бэкап базы данных.",
-            )
-            logging.info("Бэкап успешно отправлен. {admin_id}")
+async def send_backup():
+    try:
+        delivered = await deliver_backup(BOT, ADMINS, "Автоматический бэкап базы данных.")
+        logger.info(f"Бэкап отправлен администраторам: {delivered} из {len(ADMINS)}")
     except Exception as e:
-        logging.error(f"Ошибка при отправке бэкапа: {e}")
+        logger.error(f"Ошибка при отправке бэкапа: {e}")
 
 
 async def send_peak_usage():
@@ -81,5 +190,12 @@ async def send_peak_usage():
     else:
         response = "❌ Не удалось определить пиковую нагрузку!"
 
+    top = await get_traffic_store().top_clients(int(time.time()) - 86400, TOP_CLIENTS)
+    if top:
+        response += "\n\n👥 **Больше всего трафика за сутки**:\n" + "\n".join(
+            f"🔹 `{name}`: ↓{humanize.naturalsize(rx)} ↑{humanize.naturalsize(tx)}"
+            for name, rx, tx in top
+        )
+
     for admin_id in ADMINS:
         await BOT.send_message(chat_id=admin_id, text=response)
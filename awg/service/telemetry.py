@@ -0,0 +1,87 @@
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional
+
+from service.executor import executor
+from service.wg_apply import get_interface_name
+
+logger = logging.getLogger(__name__)
+
+
+class PeerStats:
+    """Строка peer'а из `wg show <iface> dump` с точными значениями."""
+
+    __slots__ = (
+        "public_key",
+        "endpoint",
+        "allowed_ips",
+        "latest_handshake",
+        "rx_bytes",
+        "tx_bytes",
+    )
+
+    def __init__(
+        self,
+        public_key: str,
+        endpoint: str,
+        allowed_ips: str,
+        latest_handshake: int,
+        rx_bytes: int,
+        tx_bytes: int,
+    ):
+        self.public_key = public_key
+        self.endpoint = endpoint
+        self.allowed_ips = allowed_ips
+        self.latest_handshake = latest_handshake  # epoch, 0 — рукопожатия не было
+        self.rx_bytes = rx_bytes
+        self.tx_bytes = tx_bytes
+
+    @property
+    def handshake_at(self) -> Optional[datetime]:
+        if not self.latest_handshake:
+            return None
+        return datetime.fromtimestamp(self.latest_handshake, tz=timezone.utc)
+
+
+def parse_dump(lines: Iterable[str]) -> Iterator[PeerStats]:
+    """Разбирает вывод `wg show <iface> dump` построчно.
+
+    Первая строка описывает интерфейс и пропускается. Строки peer'ов:
+    public-key, preshared-key, endpoint, allowed-ips, latest-handshake,
+    transfer-rx, transfer-tx, persistent-keepalive (через табуляцию).
+    """
+    iterator = iter(lines)
+    next(iterator, None)
+    for line in iterator:
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) < 7:
+            continue
+        try:
+            yield PeerStats(
+                public_key=fields[0],
+                endpoint="" if fields[2] == "(none)" else fields[2],
+                allowed_ips="" if fields[3] == "(none)" else fields[3],
+                latest_handshake=int(fields[4]),
+                rx_bytes=int(fields[5]),
+                tx_bytes=int(fields[6]),
+            )
+        except ValueError:
+            logger.warning(f"Некорректная строка wg dump: {line!r}")
+
+
+async def read_peer_stats(docker_container: str, wg_config_file: str) -> Dict[str, PeerStats]:
+    """Снимает статистику всех peer'ов интерфейса одним вызовом wg show dump."""
+    output = await executor.check_output(
+        "docker",
+        "exec",
+        "-i",
+        docker_container,
+        "wg",
+        "show",
+        get_interface_name(wg_config_file),
+        "dump",
+    )
+    return {
+        stats.public_key: stats
+        for stats in parse_dump(output.decode("utf-8").splitlines())
+    }
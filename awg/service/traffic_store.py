@@ -0,0 +1,205 @@
+import logging
+import sqlite3
+import time
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from service.db_user import AsyncDatabase, Database
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+
+# Сколько хранить данные каждого уровня детализации (секунды)
+MINUTE_RETENTION = 2 * DAY
+HOUR_RETENTION = 31 * DAY
+DAY_RETENTION = 2 * 365 * DAY
+
+# (таблица-источник, таблица-приёмник, размер корзины приёмника)
+_ROLLUPS = (
+    ("traffic_minute", "traffic_hour", HOUR),
+    ("traffic_hour", "traffic_day", DAY),
+)
+_RETENTION = (
+    ("traffic_minute", MINUTE_RETENTION),
+    ("traffic_hour", HOUR_RETENTION),
+    ("traffic_day", DAY_RETENTION),
+)
+
+
+class TrafficSample:
+    __slots__ = ("client_name", "public_key", "rx_bytes", "tx_bytes")
+
+    def __init__(self, client_name: str, public_key: str, rx_bytes: int, tx_bytes: int):
+        self.client_name = client_name
+        self.public_key = public_key
+        self.rx_bytes = rx_bytes
+        self.tx_bytes = tx_bytes
+
+
+class TrafficStore:
+    """Временной ряд трафика peer'ов в SQLite.
+
+    При каждом опросе сохраняется разница со счётчиками предыдущего опроса
+    (при сбросе счётчика — после перезапуска интерфейса — учитывается
+    новое значение целиком). Минутные корзины сворачиваются в часовые,
+    часовые — в суточные; каждый уровень хранится ограниченное время.
+    Накопленный итог по клиенту лежит в отдельной таблице, так что
+    запрос для профиля — одна строка по первичному ключу. Запись идёт
+    через писателя AsyncDatabase, чтение — через её читателей.
+    """
+
+    def __init__(self, db: "AsyncDatabase"):
+        self.db = db
+
+    async def record(self, samples: Iterable[TrafficSample], now: Optional[int] = None) -> int:
+        """Сохраняет приращения счётчиков; возвращает число peer'ов с трафиком."""
+        now = int(now if now is not None else time.time())
+        return await self.db.run_write(self._record, list(samples), now)
+
+    def _record(self, db: "Database", samples: List[TrafficSample], now: int) -> int:
+        cur = db.conn
+        bucket = now - now % MINUTE
+        changed = 0
+        for sample in samples:
+            row = cur.execute(
+                "SELECT rx, tx FROM traffic_counters WHERE public_key = ?",
+                (sample.public_key,),
+            ).fetchone()
+            if row is None or sample.rx_bytes < row[0] or sample.tx_bytes < row[1]:
+                # Первый опрос peer'а или счётчики сброшены
+                rx_delta, tx_delta = sample.rx_bytes, sample.tx_bytes
+            else:
+                rx_delta, tx_delta = sample.rx_bytes - row[0], sample.tx_bytes - row[1]
+            cur.execute(
+                "INSERT INTO traffic_counters (public_key, rx, tx, updated_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(public_key) DO UPDATE SET"
+                " rx = excluded.rx, tx = excluded.tx, updated_at = excluded.updated_at",
+                (sample.public_key, sample.rx_bytes, sample.tx_bytes, now),
+            )
+            if not rx_delta and not tx_delta:
+                continue
+            changed += 1
+            cur.execute(
+                "INSERT INTO traffic_minute (client_name, ts, rx, tx) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(client_name, ts) DO UPDATE SET"
+                " rx = rx + excluded.rx, tx = tx + excluded.tx",
+                (sample.client_name, bucket, rx_delta, tx_delta),
+            )
+            cur.execute(
+                "INSERT INTO traffic_totals (client_name, rx, tx) VALUES (?, ?, ?)"
+                " ON CONFLICT(client_name) DO UPDATE SET"
+                " rx = rx + excluded.rx, tx = tx + excluded.tx",
+                (sample.client_name, rx_delta, tx_delta),
+            )
+        return changed
+
+    async def rollup(self, now: Optional[int] = None) -> None:
+        """Сворачивает завершённые интервалы и удаляет устаревшие корзины."""
+        now = int(now if now is not None else time.time())
+        await self.db.run_write(self._rollup, now)
+
+    def _rollup(self, db: "Database", now: int) -> None:
+        cur = db.conn
+        for source, target, size in _ROLLUPS:
+            upto = now - now % size
+            row = cur.execute(
+                "SELECT done_until FROM traffic_rollups WHERE target = ?", (target,)
+            ).fetchone()
+            done_until = row[0] if row else 0
+            if upto <= done_until:
+                continue
+            cur.execute(
+                f"INSERT INTO {target} (client_name, ts, rx, tx)"
+                f" SELECT client_name, ts - ts % {size}, SUM(rx), SUM(tx) FROM {source}"
+                " WHERE ts >= ? AND ts < ? GROUP BY client_name, ts - ts % ?"
+                " ON CONFLICT(client_name, ts) DO UPDATE SET"
+                " rx = rx + excluded.rx, tx = tx + excluded.tx",
+                (done_until, upto, size),
+            )
+            cur.execute(
+                "INSERT INTO traffic_rollups (target, done_until) VALUES (?, ?)"
+                " ON CONFLICT(target) DO UPDATE SET done_until = excluded.done_until",
+                (target, upto),
+            )
+        for table, retention in _RETENTION:
+            cur.execute(f"DELETE FROM {table} WHERE ts < ?", (now - retention,))
+
+    async def forget_client(self, client_name: str, public_key: Optional[str] = None) -> None:
+        """Удаляет накопленную статистику клиента и счётчики его peer'а (при удалении)."""
+        await self.db.run_write(self._forget_client, client_name, public_key)
+
+    @staticmethod
+    def _forget_client(db: "Database", client_name: str, public_key: Optional[str]) -> None:
+        db.conn.execute("DELETE FROM traffic_totals WHERE client_name = ?", (client_name,))
+        for table, _ in _RETENTION:
+            db.conn.execute(f"DELETE FROM {table} WHERE client_name = ?", (client_name,))
+        if public_key:
+            # Иначе peer, заново созданный с тем же ключом, считал бы
+            # приращения от счётчиков удалённого
+            db.conn.execute("DELETE FROM traffic_counters WHERE public_key = ?", (public_key,))
+
+    async def totals(self, client_name: str) -> Tuple[int, int]:
+        """Весь учтённый трафик клиента: (rx, tx)."""
+        return await self.db.run_read(self._totals, client_name)
+
+    @staticmethod
+    def _totals(db: "Database", client_name: str) -> Tuple[int, int]:
+        row = db.conn.execute(
+            "SELECT rx, tx FROM traffic_totals WHERE client_name = ?", (client_name,)
+        ).fetchone()
+        return (row[0], row[1]) if row else (0, 0)
+
+    async def usage_since(self, client_name: str, since: int) -> Tuple[int, int]:
+        """Трафик клиента начиная с момента since (epoch): (rx, tx)."""
+        return await self.db.run_read(self._usage_since, client_name, since)
+
+    def _usage_since(self, db: "Database", client_name: str, since: int) -> Tuple[int, int]:
+        buckets, params = self._buckets_since(db.conn, since, client_name)
+        row = db.conn.execute(
+            f"SELECT COALESCE(SUM(rx), 0), COALESCE(SUM(tx), 0) FROM ({buckets})", params
+        ).fetchone()
+        return row[0], row[1]
+
+    async def top_clients(self, since: int, limit: int = 10) -> List[Tuple[str, int, int]]:
+        """Клиенты с наибольшим трафиком начиная с since: [(имя, rx, tx), ...]."""
+        return await self.db.run_read(self._top_clients, since, limit)
+
+    def _top_clients(self, db: "Database", since: int, limit: int) -> List[Tuple[str, int, int]]:
+        buckets, params = self._buckets_since(db.conn, since)
+        return db.conn.execute(
+            f"SELECT client_name, SUM(rx), SUM(tx) FROM ({buckets})"
+            " GROUP BY client_name ORDER BY SUM(rx) + SUM(tx) DESC LIMIT ?",
+            [*params, limit],
+        ).fetchall()
+
+    def _buckets_since(
+        self, conn: sqlite3.Connection, since: int, client_name: Optional[str] = None
+    ) -> Tuple[str, list]:
+        """Запрос корзин всех уровней начиная с since и его параметры.
+
+        Каждая корзина берётся из того уровня, который за неё отвечает:
+        незавершённые часы ещё лежат в минутной таблице, незавершённые
+        сутки — в часовой.
+        """
+        hour_done, day_done = self._watermarks(conn)
+        levels = (
+            ("traffic_day", "ts >= ? AND ts < ?", (since, day_done)),
+            ("traffic_hour", "ts >= ? AND ts >= ? AND ts < ?", (since, day_done, hour_done)),
+            ("traffic_minute", "ts >= ? AND ts >= ?", (since, hour_done)),
+        )
+        client_filter = "client_name = ? AND " if client_name is not None else ""
+        client_params = (client_name,) if client_name is not None else ()
+        sql = " UNION ALL ".join(
+            f"SELECT client_name, rx, tx FROM {table} WHERE {client_filter}{condition}"
+            for table, condition, _ in levels
+        )
+        params = [value for _, _, level in levels for value in (*client_params, *level)]
+        return sql, params
+
+    @staticmethod
+    def _watermarks(conn: sqlite3.Connection) -> Tuple[int, int]:
+        marks = dict(conn.execute("SELECT target, done_until FROM traffic_rollups"))
+        return marks.get("traffic_hour", 0), marks.get("traffic_day", 0)
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# Сколько пользователей держать в памяти и как долго (сек.)
+MAX_ENTRIES = 10000
+TTL = 300.0
+
+# Маркер отсутствия записи (False — закэшированное «пользователь не найден»)
+MISSING = object()
+
+
+class UserCache:
+    """LRU-кэш пользователей с ограничением по времени жизни.
+
+    Записи хранятся под двумя ключами: ("tg", telegram_id) и
+    ("id", user_id). Кэшируется и отсутствие пользователя (False).
+    Чтение, начатое до инвалидации, не может положить в кэш устаревшее
+    значение: put() принимает токен begin() и игнорируется, если с тех
+    пор была хотя бы одна инвалидация.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def begin(self) -> int:
+        return self._generation
+
+    def get(self, key: Hashable) -> Any:
+        """Значение из кэша или MISSING."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any, token: int) -> None:
+        if token != self._generation:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put_user(self, user: Any, token: int, telegram_id: Optional[str] = None) -> None:
+        """Кладёт пользователя под обоими ключами (или False под telegram_id)."""
+        if user:
+            self.put(("tg", str(user.telegram_id)), user, token)
+            self.put(("id", user.user_id), user, token)
+        elif telegram_id is not None:
+            self.put(("tg", str(telegram_id)), False, token)
+
+    def invalidate(self, telegram_id: Optional[str] = None, user_id: Optional[int] = None) -> None:
+        """Удаляет пользователя из кэша по любому из ключей."""
+        self._generation += 1
+        keys: List[Tuple[str, Any]] = []
+        if telegram_id is not None:
+            keys.append(("tg", str(telegram_id)))
+        if user_id is not None:
+            keys.append(("id", user_id))
+        for key in keys:
+            entry = self._entries.pop(key, None)
+            if entry and entry[1]:
+                # Вторая запись того же пользователя
+                self._entries.pop(("tg", str(entry[1].telegram_id)), None)
+                self._entries.pop(("id", entry[1].user_id), None)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
@@ -1,50 +1,48 @@
-import json
 import logging
-import os
 import subprocess
+from typing import Dict
+
+import db
 from service.db_instance import user_db
-from settings import WG_CONFIG_FILE, DOCKER_CONTAINER
+from service.db_user import STATE_ACTIVE
+from service.psk_reconcile import reconcile_preshared_keys
+from settings import APPLY_MODE
 
 logger = logging.getLogger(__name__)
 
+# Ключ для пользователей без сгенерированного deactivate_presharekey
+DEFAULT_DEACTIVATE_PRESHAREKEY = "18Yi5MBAZPf9kX8U2wr95+fbl/fo3JxLRcsPfOVLD2M="
+
+
+async def get_all_users_vpn() -> Dict[str, str]:
+    """Нужные PresharedKey клиентов: активным — настоящий, истёкшим — мусорный."""
+    desired: Dict[str, str] = {}
+    active_count = deactivate_count = 0
+
+    async for user in user_db.iter_users_with_configs():
+        if user.state == STATE_ACTIVE:
+            if not user.preshared_key:
+                logger.warning(f"У клиента {user.telegram_id} нет PresharedKey в базе")
+                continue
+            desired[str(user.telegram_id)] = user.preshared_key
+            active_count += 1
+        else:
+            desired[str(user.telegram_id)] = (
+                user.deactivate_presharekey or DEFAULT_DEACTIVATE_PRESHAREKEY
+            )
+            deactivate_count += 1
+
+    logger.info(
+        f"Активных клиентов: {active_count}, к отключению: {deactivate_count}"
+    )
+    return desired
+
 
-def get_all_users_vpn():
-    """Получение json пользователей которые активны или нет"""
-    config_list = []
-    activ_users = user_db.get_active_users()
-    deactivate_users = user_db.get_users_expired_yesterday()
-
-    for user in activ_users:
-        user_config = user_db.get_config_by_telegram_id(user.telegram_id)
-        config_list.append(
-            {
-                "client_name": str(user.telegram_id),
-                "new_preshared_key": user_config.preshared_key,
-            }
-        )
-
-    for user in deactivate_users:
-        user_config = user_db.get_config_by_telegram_id(user.telegram_id)
-        config_list.append(
-            {
-                "client_name": str(user.telegram_id),
-                "new_preshared_key": "18Yi5MBAZPf9kX8U2wr95+fbl/fo3JxLRcsPfOVLD2M=",
-            }
-        )
-    for entry in config_list:
-        logger.info(f"Client: {entry}")
-    return config_list
-
-
-def update_vpn_state():
-    data = get_all_users_vpn()
-    cmd = ["./updatepresharekey.sh", WG_CONFIG_FILE, DOCKER_CONTAINER]
+async def update_vpn_state():
+    desired = await get_all_users_vpn()
     try:
-        result = subprocess.run(
-            cmd, input=json.dumps(data), text=True, capture_output=True, check=True
-        )
-        logger.info(result.stdout)
+        await reconcile_preshared_keys(db.get_peer_registry(), desired, APPLY_MODE)
         return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error during VPN update: {e.stderr}")
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        logger.error(f"Error during VPN update: {e}")
         return False
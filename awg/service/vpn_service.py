@@ -14,7 +14,7 @@ async def create_vpn_config(user_id: int, message: Message, admin_add=False):
     """Генерируем файл в докере копируем его в директорию создаем файл и отправляем клиенту"""
     from bot_manager import BOT
 
-    success = root_add(str(user_id), ipv6=False)
+    success = await root_add(str(user_id))
     if not success:
         await message.answer(
             "❌ Не удалось создать конфигурацию. Обратитесь в поддержку."
@@ -27,7 +27,7 @@ async def create_vpn_config(user_id: int, message: Message, admin_add=False):
         return
 
     if not admin_add:
-        process_and_add_config(conf_path, user_id)
+        await process_and_add_config(conf_path, user_id)
     
     config_file = FSInputFile(conf_path)
     config_message = await BOT.send_document(
@@ -43,7 +43,7 @@ async def create_vpn_config(user_id: int, message: Message, admin_add=False):
     logging.info(f"VPN конфигурация для пользователя {user_id} успешно отправлена.")
 
 
-def process_and_add_config(file_path: str, telegram_id: str) -> int:
+async def process_and_add_config(file_path: str, telegram_id: str) -> int:
     config = configparser.ConfigParser()
     config.read(file_path)
 
@@ -75,7 +75,7 @@ def process_and_add_config(file_path: str, telegram_id: str) -> int:
     deactivate_presharekey = generate_deactivate_presharekey()
 
     # Вызов метода добавления в БД
-    return user_db.add_config(
+    return await user_db.add_config(
         telegram_id=telegram_id,
         private_key=private_key,
         address=address,
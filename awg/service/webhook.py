@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Callable, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    url: str,
+    path: str,
+    host: str,
+    port: int,
+    secret: str,
+    max_connections: int,
+    stats: Callable[[], Dict[str, int]],
+) -> None:
+    """Принимает обновления через webhook до отмены задачи.
+
+    Запросы без правильного X-Telegram-Bot-Api-Secret-Token отклоняются.
+    Telegram держит не больше max_connections одновременных запросов;
+    ответ на запрос отдаётся сразу, обновление обрабатывается в фоне.
+    GET /healthz — 200, когда webhook установлен, иначе 503.
+    """
+    ready = False
+
+    async def healthz(request: web.Request) -> web.Response:
+        return web.json_response(
+            {"status": "ok" if ready else "starting", "mode": "webhook", **stats()},
+            status=200 if ready else 503,
+        )
+
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret).register(app, path=path)
+    app.router.add_get("/healthz", healthz)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Webhook-сервер слушает {host}:{port}{path}")
+        await bot.set_webhook(
+            url + path,
+            secret_token=secret,
+            max_connections=max_connections,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        ready = True
+        logger.info(f"Webhook установлен: {url}{path}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
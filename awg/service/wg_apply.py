@@ -0,0 +1,82 @@
+import json
+import os
+import logging
+import tempfile
+
+from service.executor import executor
+
+CLIENTS_TABLE_PATH = "/opt/amnezia/awg/clientsTable"
+
+logger = logging.getLogger(__name__)
+
+
+def get_interface_name(wg_config_file: str) -> str:
+    return os.path.basename(wg_config_file).split(".")[0]
+
+
+async def copy_to_container(docker_container: str, path: str, content: str) -> None:
+    """Записывает файл в контейнер одной операцией docker cp."""
+    with tempfile.NamedTemporaryFile(mode="w", delete=False) as temp_file:
+        temp_file.write(content)
+        temp_file_path = temp_file.name
+    try:
+        await executor.check_output(
+            "docker", "cp", temp_file_path, f"{docker_container}:{path}"
+        )
+    finally:
+        os.remove(temp_file_path)
+
+
+async def write_config(docker_container: str, wg_config_file: str, content: str) -> None:
+    """Сохраняет wg0.conf в контейнер."""
+    await copy_to_container(docker_container, wg_config_file, content)
+
+
+async def write_clients_table(docker_container: str, clients_table: list) -> None:
+    """Сохраняет clientsTable в контейнер."""
+    await copy_to_container(docker_container, CLIENTS_TABLE_PATH, json.dumps(clients_table))
+
+
+async def apply_config(
+    docker_container: str, wg_config_file: str, apply_mode: str = "live"
+) -> None:
+    """Применяет сохранённый wg0.conf к интерфейсу.
+
+    В режиме live используется wg syncconf: меняются только отличающиеся
+    peer'ы, сессии остальных клиентов не прерываются. В режиме restart
+    интерфейс перезапускается через wg-quick down/up.
+    """
+    if apply_mode == "restart":
+        script = f"wg-quick down {wg_config_file} || true && wg-quick up {wg_config_file}"
+    else:
+        interface = get_interface_name(wg_config_file)
+        # Свой временный файл на каждый вызов: параллельные применения
+        # (в том числе из newclient.sh и скриптов вне бота) не пересекаются
+        script = (
+            'sync_conf=$(mktemp) &&'
+            f' wg-quick strip {wg_config_file} > "$sync_conf"'
+            f' && wg syncconf {interface} "$sync_conf";'
+            ' status=$?; rm -f "$sync_conf"; exit $status'
+        )
+    await executor.check_output("docker", "exec", "-i", docker_container, "sh", "-c", script)
+
+
+async def remove_peer(
+    docker_container: str, wg_config_file: str, public_key: str, apply_mode: str = "live"
+) -> None:
+    """Удаляет peer с интерфейса (сам wg0.conf должен быть уже сохранён)."""
+    if apply_mode == "restart":
+        await apply_config(docker_container, wg_config_file, apply_mode)
+        return
+    await executor.check_output(
+        "docker",
+        "exec",
+        "-i",
+        docker_container,
+        "wg",
+        "set",
+        get_interface_name(wg_config_file),
+        "peer",
+        public_key,
+        "remove",
+    )
@@ -0,0 +1,202 @@
+from typing import Dict, List, Optional
+
+
+def parse_client_name(full_name: str) -> str:
+    return full_name.split("[")[0].strip()
+
+
+def _line_ending(line: str) -> str:
+    return line[len(line.rstrip("\r\n")):]
+
+
+class WgSection:
+    """Секция wg0.conf ([Interface] или [Peer]) вместе с исходными строками.
+
+    Строки хранятся как есть (с переводами строк), поэтому неизменённая
+    секция сериализуется байт в байт. Параметры индексируются по
+    имени ключа в нижнем регистре -> номер строки.
+    """
+
+    __slots__ = ("kind", "lines", "keys", "name", "name_line")
+
+    def __init__(self, kind: str, lines: List[str]):
+        self.kind = kind
+        self.lines = lines
+        self.keys: Dict[str, int] = {}
+        self.name = ""
+        self.name_line = -1
+        for index, raw_line in enumerate(lines[1:], start=1):
+            line = raw_line.strip()
+            if line.startswith("#"):
+                if self.name_line < 0:
+                    self.name = parse_client_name(line[1:].strip())
+                    self.name_line = index
+            elif "=" in line:
+                key = line.split("=", 1)[0].strip().lower()
+                self.keys.setdefault(key, index)
+
+    def get(self, key: str, default: str = "") -> str:
+        index = self.keys.get(key.lower())
+        if index is None:
+            return default
+        return self.lines[index].split("=", 1)[1].strip()
+
+    def set(self, key: str, value: str) -> None:
+        """Меняет значение параметра или добавляет его в конец секции."""
+        index = self.keys.get(key.lower())
+        if index is not None:
+            ending = _line_ending(self.lines[index]) or "\n"
+            self.lines[index] = f"{key} = {value}{ending}"
+            return
+        insert_at = self._content_end()
+        self.lines.insert(insert_at, f"{key} = {value}\n")
+        self._shift(insert_at)
+        self.keys[key.lower()] = insert_at
+
+    def set_name(self, name: str) -> None:
+        """Ставит комментарий # name сразу после заголовка секции."""
+        if self.name_line >= 0:
+            ending = _line_ending(self.lines[self.name_line]) or "\n"
+            self.lines[self.name_line] = f"# {name}{ending}"
+        else:
+            if not _line_ending(self.lines[0]):
+                self.lines[0] += "\n"
+            self.lines.insert(1, f"# {name}\n")
+            self._shift(1)
+            self.name_line = 1
+        self.name = parse_client_name(name)
+
+    def _content_end(self) -> int:
+        end = len(self.lines)
+        while end > 1 and not self.lines[end - 1].strip():
+            end -= 1
+        if not _line_ending(self.lines[end - 1]):
+            self.lines[end - 1] += "\n"
+        return end
+
+    def _shift(self, inserted_at: int) -> None:
+        for key, index in self.keys.items():
+            if index >= inserted_at:
+                self.keys[key] = index + 1
+        if self.name_line >= inserted_at:
+            self.name_line += 1
+
+    def text(self) -> str:
+        return "".join(self.lines)
+
+
+class WgPeer(WgSection):
+    __slots__ = ()
+
+    @property
+    def public_key(self) -> str:
+        return self.get("PublicKey")
+
+    @property
+    def preshared_key(self) -> str:
+        return self.get("PresharedKey")
+
+    @property
+    def allowed_ips(self) -> str:
+        return self.get("AllowedIPs")
+
+    def addresses(self) -> List[str]:
+        return [item.strip() for item in self.allowed_ips.split(",") if item.strip()]
+
+
+class WgConfig:
+    """Разобранный wg0.conf с индексами по публичному ключу, имени и AllowedIPs.
+
+    Комментарии, пустые строки и порядок секций сохраняются; to_text()
+    для неизменённого файла возвращает исходный текст без изменений.
+    """
+
+    def __init__(self, preamble: List[str], sections: List[WgSection]):
+        self.preamble = preamble
+        self.sections = sections
+        self.interface = next((s for s in sections if s.kind == "interface"), None)
+        self.peers: List[WgPeer] = [s for s in sections if isinstance(s, WgPeer)]
+        self.reindex()
+
+    @classmethod
+    def parse(cls, text: str) -> "WgConfig":
+        preamble: List[str] = []
+        sections: List[WgSection] = []
+        current: Optional[List[str]] = None
+        kind = ""
+
+        def flush() -> None:
+            if current is not None:
+                section_cls = WgPeer if kind == "peer" else WgSection
+                sections.append(section_cls(kind, current))
+
+        for raw_line in text.splitlines(keepends=True):
+            line = raw_line.strip()
+            if line.startswith("[") and line.endswith("]"):
+                flush()
+                current = [raw_line]
+                kind = line[1:-1].strip().lower()
+            elif current is None:
+                preamble.append(raw_line)
+            else:
+                current.append(raw_line)
+        flush()
+        return cls(preamble, sections)
+
+    def reindex(self) -> None:
+        self.by_public_key: Dict[str, WgPeer] = {}
+        self.by_name: Dict[str, WgPeer] = {}
+        self.by_allowed_ip: Dict[str, WgPeer] = {}
+        for peer in self.peers:
+            self._index(peer)
+
+    def _index(self, peer: WgPeer) -> None:
+        if peer.public_key:
+            self.by_public_key.setdefault(peer.public_key, peer)
+        if peer.name:
+            self.by_name.setdefault(peer.name, peer)
+        for address in peer.addresses():
+            self.by_allowed_ip.setdefault(address, peer)
+
+    @property
+    def interface_address(self) -> str:
+        return self.interface.get("Address") if self.interface else ""
+
+    def add_peer(
+        self, name: str, public_key: str, preshared_key: str, allowed_ips: str
+    ) -> WgPeer:
+        self._ensure_separator()
+        peer = WgPeer(
+            "peer",
+            [
+                "[Peer]\n",
+                f"# {name}\n",
+                f"PublicKey = {public_key}\n",
+                f"PresharedKey = {preshared_key}\n",
+                f"AllowedIPs = {allowed_ips}\n",
+                "\n",
+            ],
+        )
+        self.peers.append(peer)
+        self.sections.append(peer)
+        self._index(peer)
+        return peer
+
+    def remove_peer(self, public_key: str) -> Optional[WgPeer]:
+        peer = self.by_public_key.get(public_key)
+        if peer is None:
+            return None
+        self.peers.remove(peer)
+        self.sections.remove(peer)
+        self.reindex()
+        return peer
+
+    def _ensure_separator(self) -> None:
+        last = self.sections[-1].lines if self.sections else self.preamble
+        if last and not _line_ending(last[-1]):
+            last[-1] += "\n"
+        if last and last[-1].strip():
+            last.append("\n")
+
+    def to_text(self) -> str:
+        return "".join(self.preamble) + "".join(s.text() for s in self.sections)
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать попутчиков для группового коммита, сек.
+GROUP_COMMIT_DELAY = 0.005
+# Максимум операций в одной транзакции
+GROUP_COMMIT_MAX_OPS = 256
+
+Call = Tuple[str, tuple, dict]
+
+
+class _Item:
+    __slots__ = ("call", "batchable", "future", "enqueued_at")
+
+    def __init__(self, call: Call, batchable: bool, future: asyncio.Future):
+        self.call = call
+        self.batchable = batchable
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class WriteQueue:
+    """Очередь записей в SQLite с групповым коммитом.
+
+    Все записи выполняются по очереди в потоке писателя. Подряд идущие
+    пакетные операции (batchable) собираются в одну транзакцию — до
+    max_ops штук или в течение max_delay секунд, — так что всплеск
+    /start от новых пользователей даёт один fsync на пачку, а не на
+    каждого. Остальные операции выполняются поодиночке, порядок
+    записей сохраняется.
+
+    submit() возвращает future, который завершается после коммита;
+    ожидать его не обязательно (запись «в фоне»).
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        run_one: Callable[[str, tuple, dict], Any],
+        run_batch: Callable[[List[Call]], List[Tuple[bool, Any]]],
+        max_ops: int = GROUP_COMMIT_MAX_OPS,
+        max_delay: float = GROUP_COMMIT_DELAY,
+    ):
+        self.executor = executor
+        self.run_one = run_one
+        self.run_batch = run_batch
+        self.max_ops = max_ops
+        self.max_delay = max_delay
+        self._pending: Deque[_Item] = deque()
+        # Событие привязывается к циклу при первом ожидании, поэтому
+        # создаётся сразу; при перезапуске _drain в новом цикле — заново
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+
+        # Счётчики
+        self.batches = 0
+        self.operations = 0
+        self.failed = 0
+        self.max_batch_size = 0
+        self.total_commit_time = 0.0
+        self.max_commit_time = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def submit(self, name: str, args: tuple, kwargs: dict, batchable: bool = False) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._task = loop.create_task(self._drain())
+        item = _Item((name, args, kwargs), batchable, loop.create_future())
+        self._pending.append(item)
+        self._idle.clear()
+        self._wakeup.set()
+        return item.future
+
+    async def flush(self) -> None:
+        """Ждёт, пока все поставленные записи будут закоммичены."""
+        if self._pending or not self._idle.is_set():
+            await self._idle.wait()
+
+    async def _drain(self) -> None:
+        while True:
+            if not self._pending:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if self._pending[0].batchable and len(self._pending) < self.max_ops and self.max_delay:
+                await asyncio.sleep(self.max_delay)
+            batch = self._take_batch()
+            try:
+                await self._execute(batch)
+            except Exception as e:
+                # Сюда попадают только ошибки самой транзакции
+                self.failed += len(batch)
+                logger.error(f"Ошибка группового коммита ({len(batch)} операций): {e}")
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+
+    def _take_batch(self) -> List[_Item]:
+        first = self._pending.popleft()
+        batch = [first]
+        if not first.batchable:
+            return batch
+        while self._pending and self._pending[0].batchable and len(batch) < self.max_ops:
+            batch.append(self._pending.popleft())
+        return batch
+
+    async def _execute(self, batch: List[_Item]) -> None:
+        loop = asyncio.get_running_loop()
+        started_at = time.monotonic()
+        if batch[0].batchable:
+            results = await loop.run_in_executor(
+                self.executor, self.run_batch, [item.call for item in batch]
+            )
+        else:
+            try:
+                results = [(True, await loop.run_in_executor(self.executor, self.run_one, *batch[0].call))]
+            except Exception as e:
+                results = [(False, e)]
+        finished_at = time.monotonic()
+
+        commit_time = finished_at - started_at
+        self.batches += 1
+        self.operations += len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        self.total_commit_time += commit_time
+        self.max_commit_time = max(self.max_commit_time, commit_time)
+
+        for item, (ok, value) in zip(batch, results):
+            latency = finished_at - item.enqueued_at
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if item.future.done():
+                continue
+            if ok:
+                item.future.set_result(value)
+            else:
+                self.failed += 1
+                item.future.set_exception(value)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "operations": self.operations,
+            "failed": self.failed,
+            "avg_batch_size": self.operations / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "avg_commit_time": self.total_commit_time / self.batches if self.batches else 0.0,
+            "max_commit_time": self.max_commit_time,
+            "avg_latency": self.total_latency / self.operations if self.operations else 0.0,
+            "max_latency": self.max_latency,
+        }
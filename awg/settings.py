@@ -1,9 +1,13 @@
+import secrets
 import subprocess
 import sys
 import logging
 import db
+from service.executor import executor
 from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 logger = logging.getLogger(__name__)
 
@@ -18,13 +22,46 @@ endpoint = setting.get("endpoint")
 yookassa_provider_token = setting.get("yookassa_provider_token").strip()
 vpn_name = setting.get("vpn_name")
 fast_api_url = setting.get("fast_api_url")
+# live — изменения peer'ов применяются без перезапуска интерфейса, restart — wg-quick down/up
+apply_mode = setting.get("apply_mode", "live")
+# Период опроса счётчиков трафика peer'ов, секунды
+traffic_sample_interval = int(setting.get("traffic_sample_interval", 60))
+# polling — long polling, webhook — обновления принимает HTTP-сервер бота
+update_mode = setting.get("update_mode", "polling")
+# Публичный адрес (https://...), по которому Telegram доступен webhook
+webhook_url = setting.get("webhook_url", "").rstrip("/")
+webhook_path = setting.get("webhook_path", "/webhook")
+webhook_host = setting.get("webhook_host", "0.0.0.0")
+webhook_port = int(setting.get("webhook_port", 8080))
+# Если не задан, генерируется при каждом запуске (webhook переустанавливается)
+webhook_secret = setting.get("webhook_secret") or secrets.token_urlsafe(32)
+# Сколько обновлений обрабатывается одновременно (в обоих режимах)
+max_concurrent_updates = int(setting.get("max_concurrent_updates", 32))
+# Свой сервер Bot API вместо api.telegram.org (локальный telegram-bot-api)
+telegram_api_url = setting.get("telegram_api_url", "").rstrip("/")
 
 if not all([bot_token, admin_ids, wg_config_file, docker_container, endpoint]):
     logger.error("Некоторые обязательные настройки отсутствуют.")
     sys.exit(1)
 
+if update_mode not in ("polling", "webhook"):
+    logger.error(f"Неизвестный update_mode: {update_mode} (polling или webhook).")
+    sys.exit(1)
+
+if update_mode == "webhook" and not webhook_url:
+    logger.error("Для update_mode = webhook нужен webhook_url.")
+    sys.exit(1)
+
 # Настройки и объекты
-BOT = Bot(bot_token, default=DefaultBotProperties(parse_mode="HTML"))
+BOT = Bot(
+    bot_token,
+    session=(
+        AiohttpSession(api=TelegramAPIServer.from_base(telegram_api_url))
+        if telegram_api_url
+        else None
+    ),
+    default=DefaultBotProperties(parse_mode="HTML"),
+)
 ADMINS = [int(admin_id) for admin_id in admin_ids]
 MODERATORS = [int(mod_id) for mod_id in moderator_ids]
 WG_CONFIG_FILE = wg_config_file
@@ -33,6 +70,15 @@ ENDPOINT = endpoint
 YOOKASSA_PROVIDER_TOKEN = yookassa_provider_token
 VPN_NAME = vpn_name
 FAST_API_URL = fast_api_url
+APPLY_MODE = apply_mode
+TRAFFIC_SAMPLE_INTERVAL = traffic_sample_interval
+UPDATE_MODE = update_mode
+WEBHOOK_URL = webhook_url
+WEBHOOK_PATH = webhook_path
+WEBHOOK_HOST = webhook_host
+WEBHOOK_PORT = webhook_port
+WEBHOOK_SECRET = webhook_secret
+MAX_CONCURRENT_UPDATES = max_concurrent_updates
 
 # Кэш и файлы
 ISP_CACHE_FILE = "files/isp_cache.json"
@@ -65,13 +111,17 @@ PAYMENT_PLANS = {
 }
 
 async def check_environment():
-    if DOCKER_CONTAINER not in subprocess.check_output(
-        f"docker ps --filter 'name={DOCKER_CONTAINER}' --format '{{{{.Names}}}}'",
-        shell=True,
-    ).decode().strip().split("\n"):
-        logger.error(f"Контейнер '{DOCKER_CONTAINER}' не найден.")
+    try:
+        output = await executor.check_output(
+            "docker", "ps", "--filter", f"name={DOCKER_CONTAINER}", "--format", "{{.Names}}"
+        )
+        if DOCKER_CONTAINER not in output.decode().strip().split("\n"):
+            logger.error(f"Контейнер '{DOCKER_CONTAINER}' не найден.")
+            return False
+        await executor.check_output(
+            "docker", "exec", DOCKER_CONTAINER, "test", "-f", WG_CONFIG_FILE
+        )
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        logger.error(f"Ошибка проверки окружения: {e}")
         return False
-    subprocess.check_call(
-        f"docker exec {DOCKER_CONTAINER} test -f {WG_CONFIG_FILE}", shell=True
-    )
-    return True
\ No newline at end of file
+    return True
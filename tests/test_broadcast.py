@@ -0,0 +1,75 @@
+"""Broadcaster: рассылка завершается, даже если прогресс не записался."""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "awg"))
+
+from service.broadcast import PENDING, PROGRESS_BATCH, SENT, Broadcaster, _Outgoing  # noqa: E402
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0)
+        self.sent.append(chat_id)
+
+
+class FakeStore:
+    """BroadcastStore в памяти; первые failures вызовов save_progress падают."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.status = {}
+
+    async def create_job(self, name, messages, reply_markup, parse_mode, on_create=None):
+        self.status = {str(chat_id): PENDING for chat_id, _ in messages}
+        return 1
+
+    async def pending(self, job_id):
+        return [_Outgoing(chat_id, "text", 0) for chat_id, status in self.status.items() if status == PENDING]
+
+    async def save_progress(self, job_id, results):
+        if not results:
+            return
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database is locked")
+        for chat_id, status, attempts, error in results:
+            self.status[chat_id] = status
+
+    async def finish(self, job_id):
+        statuses = list(self.status.values())
+        return statuses.count(SENT), 0
+
+
+class BroadcasterTest(unittest.TestCase):
+    def run_broadcast(self, store: FakeStore):
+        bot = FakeBot()
+        broadcaster = Broadcaster(bot, store, rate=10_000, per_chat_interval=0)
+        messages = [(chat_id, "text") for chat_id in range(PROGRESS_BATCH * 2 + 5)]
+        with self.assertLogs("service.broadcast", "ERROR"):
+            return asyncio.run(asyncio.wait_for(broadcaster.broadcast("test", messages), 5)), bot
+
+    def test_failed_progress_batch_is_saved_later(self):
+        store = FakeStore(failures=1)
+
+        result, bot = self.run_broadcast(store)
+
+        self.assertEqual(len(bot.sent), PROGRESS_BATCH * 2 + 5)
+        self.assertEqual(result.sent, PROGRESS_BATCH * 2 + 5)
+        self.assertNotIn(PENDING, store.status.values())
+
+    def test_broadcast_raises_when_progress_is_never_saved(self):
+        store = FakeStore(failures=1_000)
+
+        with self.assertRaisesRegex(RuntimeError, "database is locked"):
+            self.run_broadcast(store)
+        self.assertEqual(set(store.status.values()), {PENDING})
+
+
+if __name__ == "__main__":
+    unittest.main()
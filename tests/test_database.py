@@ -0,0 +1,57 @@
+"""Транзакции Database: методы не коммитят внутри transaction() сами."""
+import os
+import sys
+import tempfile
+import types
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "awg"))
+
+# settings при импорте читает files/setting.ini и создаёт бота; Database
+# нужен только путь к базе по умолчанию
+if "settings" not in sys.modules:
+    _settings = types.ModuleType("settings")
+    _settings.DB_FILE = "database.db"
+    sys.modules["settings"] = _settings
+
+from service.db_user import Database  # noqa: E402
+
+
+class Abort(Exception):
+    pass
+
+
+class TransactionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = Database(os.path.join(self.tmp.name, "database.db"))
+        self.addCleanup(self.db.close)
+        self.db.add_user("100", "user")
+        self.db.add_payment(1, 100, 1, None, "payload-1", None)
+
+    def rolled_back(self, operation):
+        def run(db):
+            operation(db)
+            raise Abort()
+
+        with self.assertRaises(Abort):
+            self.db.run_in_transaction(run)
+
+    def test_update_user_end_date_rolls_back_with_transaction(self):
+        self.rolled_back(lambda db: db.update_user_end_date("100", 1))
+        self.assertIsNone(self.db.get_user_by_telegram_id("100").end_date)
+
+    def test_update_payment_status_rolls_back_with_transaction(self):
+        self.rolled_back(lambda db: db.update_payment_status("payload-1", "charge-1", "success"))
+        status = self.db.conn.execute("SELECT status FROM payments").fetchone()[0]
+        self.assertEqual(status, "pending")
+
+    def test_update_payment_status_outside_transaction(self):
+        payment = self.db.update_payment_status("payload-1", "charge-1", "success")
+        self.assertEqual(payment.status, "success")
+        self.assertIsNone(self.db.update_payment_status("missing", "charge-2", "success"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+"""Выдача адресов клиентам (service/ip_allocator.py) поверх AsyncDatabase."""
+import os
+import sys
+import tempfile
+import types
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "awg"))
+
+# settings при импорте читает files/setting.ini и создаёт бота; AsyncDatabase
+# нужен только путь к базе по умолчанию
+if "settings" not in sys.modules:
+    _settings = types.ModuleType("settings")
+    _settings.DB_FILE = "database.db"
+    sys.modules["settings"] = _settings
+
+from service.db_user import AsyncDatabase  # noqa: E402
+from service.ip_allocator import IpAllocator  # noqa: E402
+
+
+class IpAllocatorTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = AsyncDatabase(os.path.join(self.tmp.name, "database.db"))
+        self.addCleanup(self.db.close)
+        self.allocator = IpAllocator(self.db, "10.8.1.0/24", "fd00::/120")
+
+    async def test_allocates_after_addresses_from_config(self):
+        await self.allocator.sync(
+            [("server", "10.8.1.1/24"), ("old", "10.8.1.2/32, 10.8.1.3/32")], "v1"
+        )
+        self.assertEqual(await self.allocator.allocate("new"), ("10.8.1.4/32", None))
+        self.assertEqual(
+            await self.allocator.allocate("dual", ipv6=True), ("10.8.1.5/32", "fd00::2/128")
+        )
+
+    async def test_sync_releases_peers_removed_outside_bot(self):
+        await self.allocator.sync([("server", "10.8.1.1/24"), ("a", "10.8.1.2/32")], "v1")
+        address, _ = await self.allocator.allocate("b")
+        self.assertEqual(address, "10.8.1.3/32")
+
+        # Оба peer'а удалены из wg0.conf вручную
+        await self.allocator.sync([("server", "10.8.1.1/24")], "v2")
+        reused = {(await self.allocator.allocate(name))[0] for name in ("c", "d")}
+        self.assertEqual(reused, {"10.8.1.2/32", "10.8.1.3/32"})
+
+    async def test_release_returns_address(self):
+        await self.allocator.sync([("server", "10.8.1.1/24")], "v1")
+        address, _ = await self.allocator.allocate("a")
+        await self.allocator.release("a")
+        self.assertEqual((await self.allocator.allocate("b"))[0], address)
+
+
+if __name__ == "__main__":
+    unittest.main()
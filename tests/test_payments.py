@@ -0,0 +1,108 @@
+"""Идемпотентность платежей (Database.apply_payment) и миграция её ключа."""
+import os
+import sqlite3
+import sys
+import tempfile
+import types
+import unittest
+
+AWG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "awg")
+sys.path.insert(0, AWG_DIR)
+
+# settings при импорте читает files/setting.ini и создаёт бота; Database
+# нужен только путь к базе по умолчанию
+if "settings" not in sys.modules:
+    _settings = types.ModuleType("settings")
+    _settings.DB_FILE = "database.db"
+    sys.modules["settings"] = _settings
+
+from service.db_user import Database  # noqa: E402
+from service.migrations import MIGRATIONS, migrate  # noqa: E402
+
+
+class ApplyPaymentTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = Database(os.path.join(self.tmp.name, "database.db"))
+        self.addCleanup(self.db.close)
+        self.db.add_user("100", "user")
+
+    def pay(self, charge_id: str, provider_payment_id: str):
+        return self.db.apply_payment(
+            "100",
+            charge_id,
+            f"payload-{charge_id}",
+            months=1,
+            amount=100,
+            provider_payment_id=provider_payment_id,
+        )
+
+    def test_stars_payments_with_empty_provider_id_are_distinct(self):
+        first = self.pay("stars-1", provider_payment_id="")
+        second = self.pay("stars-2", provider_payment_id="")
+
+        self.assertFalse(first.duplicate)
+        self.assertFalse(second.duplicate)
+        self.assertIsNotNone(first.end_date)
+        self.assertGreater(second.end_date, first.end_date)
+        self.assertEqual(second.payment.telegram_payment_charge_id, "stars-2")
+
+    def test_redelivery_is_duplicate(self):
+        first = self.pay("charge-1", provider_payment_id="p-1")
+        again = self.pay("charge-1", provider_payment_id="p-1")
+
+        self.assertTrue(again.duplicate)
+        self.assertEqual(again.end_date, first.end_date)
+        self.assertEqual(again.payment.payment_id, first.payment.payment_id)
+        count = self.db.conn.execute("SELECT COUNT(*) FROM payments").fetchone()[0]
+        self.assertEqual(count, 1)
+
+
+class PaymentMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.conn = sqlite3.connect(os.path.join(self.tmp.name, "database.db"))
+        self.addCleanup(self.conn.close)
+
+    def migrate_to(self, version: int) -> None:
+        """Схема версии version, записанная так, как её оставила бы та версия."""
+        self.conn.execute(
+            "CREATE TABLE schema_version (version INTEGER PRIMARY KEY,"
+            " description TEXT NOT NULL, applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+        for migration_version, description, steps in MIGRATIONS:
+            if migration_version > version:
+                break
+            for step in steps:
+                if callable(step):
+                    step(self.conn)
+                else:
+                    self.conn.execute(step)
+            self.conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (migration_version, description),
+            )
+        self.conn.commit()
+
+    def insert_stars_payments(self) -> None:
+        # Платежи в Stars: provider_payment_charge_id пустой у всех
+        self.conn.executemany(
+            "INSERT INTO payments (user_id, amount, months, provider_payment_id, status)"
+            " VALUES (1, 100, 1, '', 'success')",
+            [(), ()],
+        )
+        self.conn.commit()
+
+    def test_migrates_database_with_duplicate_provider_ids(self):
+        self.migrate_to(4)
+        self.insert_stars_payments()
+
+        self.assertEqual(migrate(self.conn), MIGRATIONS[-1][0])
+        count = self.conn.execute("SELECT COUNT(*) FROM payments").fetchone()[0]
+        self.assertEqual(count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+"""Горячие запросы Database используют индексы (EXPLAIN QUERY PLAN на 100 тыс. пользователей).
+
+Тест вызывает сами методы Database, перехватывает выполненные ими
+запросы через set_trace_callback и проверяет план каждого: ни одна
+таблица не читается полным проходом.
+"""
+import os
+import re
+import sys
+import tempfile
+import types
+import unittest
+
+AWG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "awg")
+sys.path.insert(0, AWG_DIR)
+
+# settings при импорте читает files/setting.ini и создаёт бота; Database
+# нужен только путь к базе по умолчанию
+if "settings" not in sys.modules:
+    _settings = types.ModuleType("settings")
+    _settings.DB_FILE = "database.db"
+    sys.modules["settings"] = _settings
+
+from service.db_user import Database  # noqa: E402
+from service.epoch_day import today_epoch_day, from_epoch_day  # noqa: E402
+
+USERS = 100_000
+
+# Полный проход по таблице (в плане — её имя или псевдоним) либо временный
+# индекс, который SQLite строит тем же полным проходом
+_FULL_SCAN = re.compile(r"^SCAN \w+(?! USING (?:COVERING )?INDEX)|AUTOMATIC")
+
+
+def _populate(conn, today: int) -> None:
+    users = []
+    configs = []
+    payments = []
+    notifications = []
+    for user_id in range(1, USERS + 1):
+        # Подписки равномерно от месяца назад до двух месяцев вперёд
+        end_day = today - 30 + user_id % 90
+        users.append(
+            (
+                user_id,
+                str(10_000_000 + user_id),
+                f"user{user_id}",
+                from_epoch_day(end_day).strftime("%Y-%m-%d %H:%M:%S"),
+                end_day,
+                1 if user_id % 1000 == 0 else 0,
+                from_epoch_day(end_day - 30).strftime("%Y-%m-%d"),
+            )
+        )
+        address = f"10.8.{user_id // 250}.{user_id % 250}/32"
+        configs.append((user_id, f"priv{user_id}", address, f"pub{user_id}"))
+        payments.append((user_id, 100, 1, f"charge{user_id}", f"payload{user_id}", "success"))
+        if end_day - 5 >= today:
+            notifications.append((user_id, end_day - 5, 5))
+    conn.executemany(
+        "INSERT INTO users (user_id, telegram_id, name, end_date, end_day, is_unlimited, subscription_start)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        users,
+    )
+    conn.executemany(
+        "INSERT INTO configs (user_id, private_key, address, public_key) VALUES (?, ?, ?, ?)",
+        configs,
+    )
+    conn.executemany(
+        "INSERT INTO payments (user_id, amount, months, provider_payment_id, raw_payload, status)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        payments,
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO notifications (user_id, due_day, days_before) VALUES (?, ?, ?)",
+        notifications,
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+
+
+class QueryPlanTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.db = Database(os.path.join(cls.tmp.name, "database.db"))
+        cls.today = today_epoch_day()
+        _populate(cls.db.conn, cls.today)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.close()
+        cls.tmp.cleanup()
+
+    def traced(self, call):
+        """Запросы, выполненные call(db)."""
+        statements = []
+        self.db.conn.set_trace_callback(statements.append)
+        try:
+            result = call(self.db)
+            if hasattr(result, "__next__"):
+                list(result)
+        finally:
+            self.db.conn.set_trace_callback(None)
+        return [
+            sql for sql in statements
+            if sql.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE", "INSERT")
+        ]
+
+    def assert_uses_indexes(self, name, call):
+        statements = self.traced(call)
+        self.assertTrue(statements, f"{name}: запросы не перехвачены")
+        for sql in statements:
+            plan = [row[3] for row in self.db.conn.execute("EXPLAIN QUERY PLAN " + sql)]
+            for detail in plan:
+                self.assertIsNone(
+                    _FULL_SCAN.search(detail),
+                    f"{name}: полный проход по таблице\n{sql}\n" + "\n".join(plan),
+                )
+
+    def test_hot_queries_use_indexes(self):
+        today = self.today
+        telegram_id = str(10_000_000 + 4242)
+        hot_queries = {
+            "get_user_by_telegram_id": lambda db: db.get_user_by_telegram_id(telegram_id),
+            "get_user_by_user_id": lambda db: db.get_user_by_user_id(4242),
+            "get_users_by_telegram_ids": lambda db: db.get_users_by_telegram_ids(
+                [telegram_id, str(10_000_000 + 7)]
+            ),
+            "has_active_subscription": lambda db: db.has_active_subscription(telegram_id),
+            "is_recently_active_user": lambda db: db.is_recently_active_user(telegram_id),
+            "get_config_by_telegram_id": lambda db: db.get_config_by_telegram_id(telegram_id),
+            "update_payment_status": lambda db: db.update_payment_status(
+                "payload4242", "unique4242", "success"
+            ),
+            "iter_users_expiring_between": lambda db: db.iter_users_expiring_between(
+                today + 1, today + 3
+            ),
+            "iter_users_expired_since": lambda db: db.iter_users_expired_since(today - 1),
+            "iter_users_expired_yesterday": lambda db: db.iter_users_expired_yesterday(),
+            "iter_users_expiring_in_days": lambda db: db.iter_users_expiring_in_days([2, 5, 10]),
+            "iter_due_reminders": lambda db: db.iter_due_reminders(today + 1),
+            "complete_reminders": lambda db: db.complete_reminders([(4242, today + 1)], today + 1),
+            "count_active_users": lambda db: db.count_active_users(),
+        }
+        for name, call in hot_queries.items():
+            with self.subTest(name):
+                self.assert_uses_indexes(name, call)
+
+
+if __name__ == "__main__":
+    unittest.main()
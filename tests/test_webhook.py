@@ -0,0 +1,288 @@
+"""Webhook-режим (service/webhook.py) и polling против подменного Bot API.
+
+Подменный сервер Telegram отвечает на вызовы бота и запоминает их;
+setWebhook задерживается до команды теста, чтобы проверить /healthz
+до и после установки webhook, getUpdates отдаёт поставленные тестом
+обновления.
+"""
+import asyncio
+import os
+import socket
+import sys
+import time
+import unittest
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message
+from aiohttp import ClientSession, web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "awg"))
+
+from service.webhook import run_webhook  # noqa: E402
+
+TOKEN = "42:TEST"
+SECRET = "s3cret"
+PATH = "/webhook"
+
+# Сколько обновлений прогонять в замере пропускной способности
+THROUGHPUT_UPDATES = 500
+# Нижняя граница, ниже которой режим считается сломанным, а не медленным
+MIN_UPDATES_PER_SECOND = 50
+
+
+def make_update(update_id: int = 1, text: str = "ping") -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "user"},
+            "text": text,
+        },
+    }
+
+
+UPDATE = make_update()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeTelegram:
+    """Bot API: отвечает ok на любой метод и записывает вызовы.
+
+    getUpdates работает как long polling: отдаёт обновления из updates
+    начиная с offset или ждёт новых до истечения timeout.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.release_set_webhook = asyncio.Event()
+        self.updates = []
+        self.new_updates = asyncio.Event()
+
+    def add_updates(self, updates) -> None:
+        self.updates.extend(updates)
+        self.new_updates.set()
+
+    async def get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", 100))
+        while True:
+            batch = [update for update in self.updates if update["update_id"] >= offset][:limit]
+            if batch:
+                return batch
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), float(params.get("timeout", 0)))
+            except asyncio.TimeoutError:
+                return []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls.append((method, params))
+        result: object = True
+        if method == "setWebhook":
+            await self.release_set_webhook.wait()
+        elif method == "getMe":
+            result = {"id": 42, "is_bot": True, "first_name": "bot", "username": "test_bot"}
+        elif method == "getUpdates":
+            result = await self.get_updates(params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        port = _free_port()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+        return f"http://127.0.0.1:{port}"
+
+
+class BotTestCase(unittest.IsolatedAsyncioTestCase):
+    """Бот, подключённый к FakeTelegram; тексты сообщений попадают в received."""
+
+    async def asyncSetUp(self):
+        self.telegram = FakeTelegram()
+        api_url = await self.telegram.start()
+        self.addAsyncCleanup(self.telegram.runner.cleanup)
+
+        session = AiohttpSession(api=TelegramAPIServer.from_base(api_url))
+        self.bot = Bot(TOKEN, session=session)
+        self.addAsyncCleanup(self.bot.session.close)
+
+        self.received = asyncio.Queue()
+        router = Router()
+
+        @router.message()
+        async def on_message(message: Message):
+            await self.received.put(message.text)
+
+        self.dp = Dispatcher()
+        self.dp.include_router(router)
+
+    async def wait_for(self, predicate, timeout: float = 5.0):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not await predicate():
+            self.assertLess(loop.time(), deadline, "условие не выполнилось")
+            await asyncio.sleep(0.02)
+
+    async def receive(self, count: int, timeout: float = 30.0) -> None:
+        for _ in range(count):
+            await asyncio.wait_for(self.received.get(), timeout)
+
+
+class WebhookTest(BotTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        port = _free_port()
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.server = asyncio.create_task(
+            run_webhook(
+                self.dp,
+                self.bot,
+                url="https://bot.example.com",
+                path=PATH,
+                host="127.0.0.1",
+                port=port,
+                secret=SECRET,
+                max_connections=40,
+                stats=lambda: {"in_flight": 0},
+            )
+        )
+        self.addAsyncCleanup(self.stop_server)
+        self.http = ClientSession()
+        self.addAsyncCleanup(self.http.close)
+
+    async def stop_server(self):
+        self.server.cancel()
+        await asyncio.gather(self.server, return_exceptions=True)
+
+    async def healthz(self):
+        try:
+            async with self.http.get(self.base_url + "/healthz") as response:
+                return response.status, await response.json()
+        except OSError:
+            return None, None
+
+    async def start_webhook(self):
+        async def set_webhook_called():
+            return any(method == "setWebhook" for method, _ in self.telegram.calls)
+
+        await self.wait_for(set_webhook_called)
+        self.telegram.release_set_webhook.set()
+
+        async def ready():
+            return (await self.healthz())[0] == 200
+
+        await self.wait_for(ready)
+
+    async def post_update(self, secret=None, update=UPDATE):
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+        async with self.http.post(self.base_url + PATH, json=update, headers=headers) as response:
+            return response.status
+
+    async def test_healthz_reports_webhook_state(self):
+        async def listening():
+            return (await self.healthz())[0] is not None
+
+        await self.wait_for(listening)
+        status, body = await self.healthz()
+        self.assertEqual(status, 503)
+        self.assertEqual(body["status"], "starting")
+
+        await self.start_webhook()
+        status, body = await self.healthz()
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {"status": "ok", "mode": "webhook", "in_flight": 0})
+
+    async def test_set_webhook_passes_secret_and_limits(self):
+        await self.start_webhook()
+        params = next(params for method, params in self.telegram.calls if method == "setWebhook")
+        self.assertEqual(params["url"], "https://bot.example.com" + PATH)
+        self.assertEqual(params["secret_token"], SECRET)
+        self.assertEqual(params["max_connections"], "40")
+
+    async def test_rejects_updates_without_valid_secret(self):
+        await self.start_webhook()
+        self.assertEqual(await self.post_update(), 401)
+        self.assertEqual(await self.post_update("wrong"), 401)
+        await asyncio.sleep(0.1)
+        self.assertTrue(self.received.empty())
+
+    async def test_accepts_update_with_secret(self):
+        await self.start_webhook()
+        self.assertEqual(await self.post_update(SECRET), 200)
+        self.assertEqual(await asyncio.wait_for(self.received.get(), 5), "ping")
+
+    async def test_throughput(self):
+        await self.start_webhook()
+        updates = [make_update(update_id) for update_id in range(1, THROUGHPUT_UPDATES + 1)]
+        # Как Telegram: не больше max_connections запросов одновременно
+        connections = asyncio.Semaphore(40)
+
+        async def post(update):
+            async with connections:
+                self.assertEqual(await self.post_update(SECRET, update), 200)
+
+        started = time.monotonic()
+        await asyncio.gather(*(post(update) for update in updates))
+        await self.receive(THROUGHPUT_UPDATES)
+        report_throughput(self, "webhook", time.monotonic() - started)
+
+
+class PollingTest(BotTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.polling = asyncio.create_task(
+            self.dp.start_polling(
+                self.bot, polling_timeout=1, handle_signals=False, close_bot_session=False
+            )
+        )
+        self.addAsyncCleanup(self.stop_polling)
+
+    async def stop_polling(self):
+        if not self.polling.done():
+            await self.dp.stop_polling()
+        await asyncio.gather(self.polling, return_exceptions=True)
+
+    def get_updates_offsets(self):
+        return [int(params.get("offset", 0)) for method, params in self.telegram.calls if method == "getUpdates"]
+
+    async def test_receives_updates_and_confirms_offset(self):
+        self.telegram.add_updates([make_update(1, "first"), make_update(2, "second")])
+        self.assertEqual(await asyncio.wait_for(self.received.get(), 5), "first")
+        self.assertEqual(await asyncio.wait_for(self.received.get(), 5), "second")
+
+        # Следующий getUpdates подтверждает полученные обновления
+        async def confirmed():
+            return 3 in self.get_updates_offsets()
+
+        await self.wait_for(confirmed)
+
+    async def test_throughput(self):
+        started = time.monotonic()
+        self.telegram.add_updates(
+            make_update(update_id) for update_id in range(1, THROUGHPUT_UPDATES + 1)
+        )
+        await self.receive(THROUGHPUT_UPDATES)
+        report_throughput(self, "polling", time.monotonic() - started)
+
+
+def report_throughput(test: unittest.TestCase, mode: str, elapsed: float) -> None:
+    rate = THROUGHPUT_UPDATES / elapsed
+    print(f"\n{mode}: {THROUGHPUT_UPDATES} обновлений за {elapsed:.2f} с, {rate:.0f} обновлений/с")
+    test.assertGreater(rate, MIN_UPDATES_PER_SECOND)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+"""Живое применение wg0.conf (service/wg_apply.py) на подменных docker/wg/wg-quick.
+
+Подменные утилиты кладутся в начало PATH: docker exec выполняет команду
+локально, wg и wg-quick пишут вызовы в журнал, а wg syncconf сохраняет
+применённую конфигурацию в каталог состояния.
+"""
+import asyncio
+import os
+import stat
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "awg"))
+
+from service import wg_apply  # noqa: E402
+from service.executor import executor  # noqa: E402
+
+FAKE_DOCKER = """#!/bin/sh
+echo "docker $*" >> "$FAKE_LOG"
+case "$1" in
+    exec)
+        shift
+        [ "$1" = "-i" ] && shift
+        shift  # имя контейнера
+        exec "$@"
+        ;;
+    cp)
+        cp "$2" "${3#*:}"
+        ;;
+esac
+"""
+
+FAKE_WG = """#!/bin/sh
+echo "wg $*" >> "$FAKE_LOG"
+if [ "$1" = "syncconf" ]; then
+    # Медленное применение: параллельный вызов успевает вмешаться
+    sleep 0.2
+    cp "$3" "$FAKE_STATE/$2.conf"
+fi
+"""
+
+FAKE_WG_QUICK = """#!/bin/sh
+echo "wg-quick $*" >> "$FAKE_LOG"
+if [ "$1" = "strip" ]; then
+    grep -v -E '^(Address|DNS|MTU|Table|SaveConfig|PreUp|PostUp|PreDown|PostDown) *=' "$2"
+fi
+"""
+
+CONFIG = """[Interface]
+PrivateKey = server-key
+Address = 10.8.1.1/24
+ListenPort = 51820
+
+[Peer]
+# {name}
+PublicKey = {name}-key
+AllowedIPs = 10.8.1.2/32
+"""
+
+
+class WgApplyTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = self.tmp.name
+        bin_dir = os.path.join(root, "bin")
+        self.state_dir = os.path.join(root, "state")
+        os.mkdir(bin_dir)
+        os.mkdir(self.state_dir)
+        for name, script in (("docker", FAKE_DOCKER), ("wg", FAKE_WG), ("wg-quick", FAKE_WG_QUICK)):
+            path = os.path.join(bin_dir, name)
+            with open(path, "w") as f:
+                f.write(script)
+            os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        self.log_path = os.path.join(root, "calls.log")
+        env = {
+            "PATH": bin_dir + os.pathsep + os.environ.get("PATH", ""),
+            "FAKE_LOG": self.log_path,
+            "FAKE_STATE": self.state_dir,
+        }
+        patcher = mock.patch.dict(os.environ, env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+        # Семафор исполнителя создаётся в event loop теста
+        executor._semaphore = None
+
+    def write_config(self, interface: str) -> str:
+        path = os.path.join(self.tmp.name, f"{interface}.conf")
+        with open(path, "w") as f:
+            f.write(CONFIG.format(name=interface))
+        return path
+
+    def calls(self):
+        with open(self.log_path) as f:
+            return [line.split() for line in f.read().splitlines()]
+
+    def applied(self, interface: str) -> str:
+        with open(os.path.join(self.state_dir, f"{interface}.conf")) as f:
+            return f.read()
+
+    async def test_live_apply_uses_syncconf_without_restart(self):
+        path = self.write_config("wg0")
+        await wg_apply.apply_config("amnezia-awg", path, "live")
+
+        calls = self.calls()
+        self.assertFalse([c for c in calls if c[:2] in (["wg-quick", "down"], ["wg-quick", "up"])])
+        syncconf = [c for c in calls if c[:2] == ["wg", "syncconf"]]
+        self.assertEqual(len(syncconf), 1)
+        self.assertEqual(syncconf[0][2], "wg0")
+        applied = self.applied("wg0")
+        self.assertIn("PublicKey = wg0-key", applied)
+        self.assertNotIn("Address", applied)
+        # Временный файл удалён
+        self.assertFalse(os.path.exists(syncconf[0][3]))
+
+    async def test_concurrent_live_applies_do_not_share_temp_file(self):
+        first = self.write_config("wg0")
+        second = self.write_config("wg1")
+        await asyncio.gather(
+            wg_apply.apply_config("amnezia-awg", first, "live"),
+            wg_apply.apply_config("amnezia-awg", second, "live"),
+        )
+
+        self.assertIn("PublicKey = wg0-key", self.applied("wg0"))
+        self.assertIn("PublicKey = wg1-key", self.applied("wg1"))
+        temp_files = [c[3] for c in self.calls() if c[:2] == ["wg", "syncconf"]]
+        self.assertEqual(len(set(temp_files)), 2)
+
+    async def test_restart_mode_restarts_interface(self):
+        path = self.write_config("wg0")
+        await wg_apply.apply_config("amnezia-awg", path, "restart")
+
+        calls = [c[:2] for c in self.calls() if c[0] in ("wg", "wg-quick")]
+        self.assertEqual(calls, [["wg-quick", "down"], ["wg-quick", "up"]])
+
+    async def test_remove_peer_live(self):
+        path = self.write_config("wg0")
+        await wg_apply.remove_peer("amnezia-awg", path, "peer-key", "live")
+
+        self.assertIn(["wg", "set", "wg0", "peer", "peer-key", "remove"], self.calls())
+
+
+if __name__ == "__main__":
+    unittest.main()